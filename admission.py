@@ -0,0 +1,145 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional, Tuple
+
+from metrics import metrics
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is turned away; retry_after is in seconds"""
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a fixed rate"""
+    def __init__(self, rate: float, capacity: float):
+        """
+        Initialize a full bucket
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum tokens, i.e. the allowed burst
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self, tokens: float = 1.0) -> Tuple[bool, float]:
+        """Take tokens if available; returns (acquired, seconds until enough tokens)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True, 0.0
+        return False, (tokens - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class ClientQuotas:
+    """Per-client token buckets, keeping only the most recently seen clients"""
+    def __init__(self, per_minute: float, burst: float, max_clients: int = 10000):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client_key: str) -> None:
+        """Consume one request from the client's quota or raise AdmissionRejected."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            bucket = self._buckets.get(client_key)
+            if bucket is None:
+                bucket = self._buckets[client_key] = TokenBucket(self.rate, self.burst)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(client_key)
+            allowed, wait = bucket.try_acquire()
+        if not allowed:
+            metrics.inc("admission_rejections_total", reason="quota")
+            raise AdmissionRejected("quota", wait)
+
+
+class AdmissionController:
+    """
+    Concurrency limiter with a bounded wait queue. Requests beyond the
+    concurrency limit wait for a slot; when the queue is full, or a slot does
+    not free up within the queue timeout, they are rejected immediately
+    instead of piling up.
+    """
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        """
+        Initialize the controller
+
+        Args:
+            max_concurrent: Requests processed at once
+            max_queue: Requests allowed to wait for a slot
+            queue_timeout: Seconds a request may wait before it is rejected
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.waiting = 0
+        # Moving average of request duration, used to estimate Retry-After
+        self.avg_service_seconds = 5.0
+
+    def _retry_after(self) -> float:
+        return max(1.0, self.avg_service_seconds * (self.waiting + 1) / self.max_concurrent)
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge("admission_in_flight", self.in_flight)
+        metrics.set_gauge("admission_queue_depth", self.waiting)
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None):
+        """
+        Hold a processing slot for the duration of the block
+
+        Args:
+            timeout: Maximum seconds to wait in the queue, e.g. the time left on
+                the request's deadline (never longer than the queue timeout)
+        """
+        queue_timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                metrics.inc("admission_rejections_total", reason="queue_full")
+                raise AdmissionRejected("queue_full", self._retry_after())
+            self.waiting += 1
+            self._update_gauges()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=queue_timeout)
+            except asyncio.TimeoutError:
+                metrics.inc("admission_rejections_total", reason="queue_timeout")
+                raise AdmissionRejected("queue_timeout", self._retry_after())
+            finally:
+                self.waiting -= 1
+                self._update_gauges()
+        else:
+            await self._semaphore.acquire()
+
+        self.in_flight += 1
+        self._update_gauges()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.avg_service_seconds = 0.9 * self.avg_service_seconds + 0.1 * (time.monotonic() - start)
+            self.in_flight -= 1
+            self._semaphore.release()
+            self._update_gauges()
+
+
+def retry_after_header(seconds: float) -> str:
+    """Format a Retry-After header value in whole seconds."""
+    return str(max(1, math.ceil(seconds))) if math.isfinite(seconds) else "60"
@@ -1,42 +1,152 @@
 from flask import Flask, render_template, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 import os
 import time
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from dotenv import load_dotenv
-from main import answer_question
+from main import (
+    answer_question, answer_cache, answer_cache_key, log_query, normalize_search_engine, profile_for,
+    warm_model_connections, REQUEST_DEADLINE_SECONDS
+)
 from flask_cors import CORS
+from deadline import Deadline
+from metrics import metrics
+from http_encoding import COMPRESS_MIN_BYTES, choose_encoding, compress, dumps, etag_for, etag_matches, is_compressible
+
+# Optional production WSGI server; falls back to the threaded Werkzeug server
+try:
+    from waitress import serve
+except ImportError:
+    serve = None
 
 # Load environment variables
 load_dotenv()
 
+# Serving: WSGI threads handling connections, and the bounded pool the
+# pipeline runs in. FLASK_MAX_CONCURRENT questions are answered at once and
+# FLASK_MAX_QUEUE more may wait; anything beyond that gets 503 at once
+FLASK_HOST = os.getenv("FLASK_HOST", "127.0.0.1")
+FLASK_PORT = int(os.getenv("FLASK_PORT", "5000"))
+FLASK_THREADS = int(os.getenv("FLASK_THREADS", "32"))
+FLASK_DEBUG = os.getenv("FLASK_DEBUG", "0") == "1"
+FLASK_MAX_CONCURRENT = int(os.getenv("FLASK_MAX_CONCURRENT", "16"))
+FLASK_MAX_QUEUE = int(os.getenv("FLASK_MAX_QUEUE", "32"))
+
+# Upper bound on client-requested deadlines, as for the FastAPI backend
+REQUEST_DEADLINE_MAX_SECONDS = float(os.getenv("REQUEST_DEADLINE_MAX_SECONDS", "120"))
+
+_pipeline_executor = ThreadPoolExecutor(max_workers=FLASK_MAX_CONCURRENT, thread_name_prefix="pipeline")
+_pipeline_slots = threading.BoundedSemaphore(FLASK_MAX_CONCURRENT + FLASK_MAX_QUEUE)
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider serializing with orjson (falls back to the standard library)"""
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode("utf-8")
+
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})  # Allow all origins for all routes
+app.json = ORJSONProvider(app)
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["ETag"])  # Allow all origins for all routes
+
+@app.after_request
+def compress_response(response):
+    """Compress responses above COMPRESS_MIN_BYTES with brotli or gzip"""
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if (encoding is None or response.direct_passthrough or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def deadline_for(data: dict) -> Deadline:
+    """Start the request's deadline from the body or X-Deadline-Ms header, or the server default."""
+    deadline_ms = data.get('deadline_ms')
+    if deadline_ms is None:
+        deadline_ms = request.headers.get('X-Deadline-Ms')
+    try:
+        deadline_ms = int(deadline_ms) if deadline_ms is not None else None
+    except (TypeError, ValueError):
+        deadline_ms = None
+    if deadline_ms is None or deadline_ms <= 0:
+        return Deadline(REQUEST_DEADLINE_SECONDS)
+    return Deadline(min(deadline_ms / 1000, REQUEST_DEADLINE_MAX_SECONDS))
+
+def answer_and_format(question: str, search_engine: str, mode: str, deadline: Deadline) -> dict:
+    """Run the pipeline for one question and format its answer (called in the pipeline pool)"""
+    raw_answer = answer_question(question, search_engine=search_engine, deadline=deadline, mode=mode)
+    formatted_answer = format_answer(raw_answer)
+    formatted_answer['degraded'] = deadline.degraded
+    return formatted_answer
+
 @app.route('/ask', methods=['POST'])
 def ask():
+    # Started before queueing so time spent waiting counts against the budget
+    data = request.get_json(silent=True) or {}
+    deadline = deadline_for(data)
     try:
-        data = request.json
         question = data.get('question', '')
         
-        if not question:
+        if not question or not question.strip():
             return jsonify({'error': 'No question provided'}), 400
         
-        # Process the question - simple and direct
-        raw_answer = answer_question(question)
+        # Same engine and mode selection as the FastAPI backend
+        search_engine = normalize_search_engine(data.get('search_engine'))
+        mode = profile_for(data.get('mode')).name
+        
+        # Record the question so popular queries can be prewarmed
+        log_query(question, search_engine, mode)
+        
+        # Turn requests away at once when the pipeline pool and its queue are full
+        if not _pipeline_slots.acquire(blocking=False):
+            metrics.inc("flask_ask_rejections_total", reason="queue_full")
+            return jsonify({'error': 'Server is busy, please retry'}), 503, {'Retry-After': '5'}
+        future = _pipeline_executor.submit(answer_and_format, question, search_engine, mode, deadline)
+        future.add_done_callback(lambda _: _pipeline_slots.release())
         
-        # Format the answer into sections
-        formatted_answer = format_answer(raw_answer)
+        # The pipeline degrades to meet the deadline; the grace period covers formatting
+        try:
+            formatted_answer = future.result(timeout=deadline.remaining() + 5)
+        except FutureTimeout:
+            metrics.inc("flask_ask_rejections_total", reason="timeout")
+            return jsonify({'error': 'Timed out answering the question', 'answer': 'The request took too long, please retry.'}), 504
         
-        return jsonify(formatted_answer)
+        return app.response_class(dumps(formatted_answer), mimetype='application/json')
         
     except Exception as e:
         print(f"Error in /ask endpoint: {str(e)}")
         return jsonify({'error': str(e), 'answer': 'An error occurred while processing your request.'}), 500
 
+@app.route('/answer', methods=['GET'])
+def cached_answer():
+    """Return the cached answer to a question without running the pipeline, revalidated with its ETag"""
+    question = request.args.get('question', '')
+    if not question.strip():
+        return jsonify({'error': 'No question provided'}), 400
+    search_engine = normalize_search_engine(request.args.get('search_engine'))
+    mode = profile_for(request.args.get('mode')).name
+    raw_answer = answer_cache.get(answer_cache_key(question, search_engine, mode))
+    if raw_answer is None:
+        return jsonify({'error': 'No cached answer for this question'}), 404
+    
+    # Compared before formatting, so a matching revalidation only costs the cache lookup
+    etag = etag_for(raw_answer.encode('utf-8'))
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return app.response_class(status=304, headers=headers)
+    formatted_answer = format_answer(raw_answer)
+    formatted_answer['degraded'] = False
+    return app.response_class(dumps(formatted_answer), mimetype='application/json', headers=headers)
+
 def format_answer(raw_answer):
     """Format the raw answer into structured sections for better display"""
     # Initialize result structure
@@ -134,406 +244,13 @@ def format_answer(raw_answer):
     return result
 
 if __name__ == '__main__':
-    # Create templates directory if it doesn't exist
-    os.makedirs('templates', exist_ok=True)
-    
-    # Create templates/index.html with a modern version
-    with open('templates/index.html', 'w') as f:
-        f.write('''
-<!DOCTYPE html>
-<html>
-<head>
-    <title>RAG Assistant</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <link href="https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600&display=swap" rel="stylesheet">
-    <style>
-        :root {
-            --primary-color: #2563eb;
-            --text-color: #1f2937;
-            --bg-color: #f9fafb;
-            --card-bg: #ffffff;
-            --border-color: #e5e7eb;
-            --hover-color: #dbeafe;
-        }
-        body {
-            font-family: 'Inter', -apple-system, BlinkMacSystemFont, sans-serif;
-            line-height: 1.6;
-            margin: 0;
-            padding: 0;
-            color: var(--text-color);
-            background-color: var(--bg-color);
-        }
-        .container {
-            max-width: 1000px;
-            margin: 2rem auto;
-            padding: 0 1rem;
-        }
-        header {
-            background-color: var(--card-bg);
-            border-radius: 12px;
-            box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06);
-            padding: 2rem;
-            margin-bottom: 2rem;
-        }
-        h1 {
-            color: var(--primary-color);
-            margin: 0;
-            font-size: 2.2rem;
-            font-weight: 600;
-        }
-        .subtitle {
-            color: #6b7280;
-            margin-top: 0.5rem;
-            font-weight: 400;
-        }
-        .search-container {
-            display: flex;
-            margin-bottom: 1.5rem;
-        }
-        #question-input {
-            flex: 1;
-            padding: 0.75rem 1rem;
-            font-size: 1rem;
-            border: 1px solid var(--border-color);
-            border-radius: 8px 0 0 8px;
-            font-family: inherit;
-        }
-        #search-button {
-            padding: 0 1.5rem;
-            background-color: var(--primary-color);
-            color: white;
-            font-weight: 500;
-            border: none;
-            border-radius: 0 8px 8px 0;
-            cursor: pointer;
-            transition: background-color 0.2s;
-        }
-        #search-button:hover {
-            background-color: #1d4ed8;
-        }
-        #loading {
-            display: none;
-            padding: 3rem 0;
-            text-align: center;
-        }
-        .spinner {
-            display: inline-block;
-            width: 50px;
-            height: 50px;
-            border: 5px solid rgba(37, 99, 235, 0.2);
-            border-radius: 50%;
-            border-top-color: var(--primary-color);
-            animation: spin 1s linear infinite;
-        }
-        @keyframes spin {
-            to { transform: rotate(360deg); }
-        }
-        #answer-container {
-            display: none;
-            background-color: var(--card-bg);
-            border-radius: 12px;
-            box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06);
-            margin-top: 1.5rem;
-            overflow: hidden;
-        }
-        .answer-header {
-            background-color: #f3f4f6;
-            padding: 1.25rem 1.5rem;
-            border-bottom: 1px solid var(--border-color);
-        }
-        .answer-header h2 {
-            margin: 0;
-            font-weight: 600;
-            font-size: 1.25rem;
-            color: var(--text-color);
-        }
-        .answer-content {
-            padding: 1.5rem;
-        }
-        #answer-text {
-            line-height: 1.8;
-            margin-bottom: 2rem;
-            white-space: pre-wrap;
-        }
-        .section {
-            margin-top: 2.5rem;
-            padding-top: 1.5rem;
-            border-top: 1px solid var(--border-color);
-        }
-        .section h3 {
-            font-size: 1.1rem;
-            color: var(--text-color);
-            margin-top: 0;
-            margin-bottom: 1rem;
-            font-weight: 600;
-        }
-        .follow-up {
-            display: flex;
-            flex-wrap: wrap;
-            gap: 0.75rem;
-            margin-bottom: 1rem;
-        }
-        .follow-up button {
-            padding: 0.7rem 1.2rem;
-            background-color: #f3f4f6;
-            border: 1px solid var(--border-color);
-            color: var(--text-color);
-            border-radius: 2rem;
-            font-size: 0.9rem;
-            cursor: pointer;
-            transition: all 0.2s;
-            font-family: inherit;
-        }
-        .follow-up button:hover {
-            background-color: var(--hover-color);
-            border-color: #bfdbfe;
-        }
-        .read-more a {
-            display: block;
-            padding: 0.75rem 1rem;
-            color: var(--primary-color);
-            text-decoration: none;
-            border-radius: 6px;
-            margin-bottom: 0.5rem;
-            transition: all 0.2s;
-            font-size: 0.95rem;
-        }
-        .read-more a:hover {
-            background-color: var(--hover-color);
-        }
-        .read-more a::before {
-            content: '🔗';
-            margin-right: 0.5rem;
-        }
-        
-        /* Responsive styling */
-        @media (max-width: 768px) {
-            .container {
-                margin: 1rem auto;
-            }
-            header {
-                padding: 1.5rem;
-            }
-            h1 {
-                font-size: 1.8rem;
-            }
-        }
-        
-        /* Dark mode toggle */
-        .theme-toggle {
-            position: absolute;
-            top: 1rem;
-            right: 1rem;
-            background: none;
-            border: none;
-            color: var(--text-color);
-            cursor: pointer;
-            font-size: 1.5rem;
-            opacity: 0.7;
-            transition: opacity 0.2s;
-        }
-        .theme-toggle:hover {
-            opacity: 1;
-        }
-        
-        /* Dark mode styles */
-        .dark-mode {
-            --primary-color: #3b82f6;
-            --text-color: #f9fafb;
-            --bg-color: #111827;
-            --card-bg: #1f2937;
-            --border-color: #374151;
-            --hover-color: #1e3a8a;
-        }
-    </style>
-</head>
-<body>
-    <button class="theme-toggle" id="theme-toggle">🌓</button>
-    
-    <div class="container">
-        <header>
-            <h1>🔍 RAG Assistant</h1>
-            <p class="subtitle">Ask a question to get comprehensive, reliable answers with sources</p>
-        
-            <div class="search-container">
-                <input type="text" id="question-input" placeholder="Enter your question..." autofocus>
-                <button id="search-button">Search</button>
-            </div>
-        </header>
-        
-        <div id="loading">
-            <div class="spinner"></div>
-            <p>Searching for the most up-to-date information...</p>
-        </div>
-        
-        <div id="answer-container">
-            <div class="answer-header">
-                <h2>Answer</h2>
-            </div>
-            
-            <div class="answer-content">
-                <div id="answer-text"></div>
-                
-                <div class="section">
-                    <h3>Follow-up questions</h3>
-                    <div id="follow-up-questions" class="follow-up"></div>
-                </div>
-                
-                <div class="section">
-                    <h3>Read more</h3>
-                    <div id="read-more-links" class="read-more"></div>
-                </div>
-            </div>
-        </div>
-    </div>
-
-    <script>
-        // Theme toggler
-        const themeToggle = document.getElementById('theme-toggle');
-        const body = document.body;
-        
-        // Check for saved theme preference or use device preference
-        const savedTheme = localStorage.getItem('theme') || 
-            (window.matchMedia('(prefers-color-scheme: dark)').matches ? 'dark' : 'light');
-        
-        if (savedTheme === 'dark') {
-            body.classList.add('dark-mode');
-        }
-        
-        themeToggle.addEventListener('click', () => {
-            body.classList.toggle('dark-mode');
-            const currentTheme = body.classList.contains('dark-mode') ? 'dark' : 'light';
-            localStorage.setItem('theme', currentTheme);
-        });
-        
-        // Search functionality
-        document.getElementById('search-button').addEventListener('click', function() {
-            const question = document.getElementById('question-input').value.trim();
-            if (!question) return;
-            
-            // Show loading, hide results
-            document.getElementById('loading').style.display = 'block';
-            document.getElementById('answer-container').style.display = 'none';
-            
-            // Make the request
-            fetch('/ask', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ question: question })
-            })
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error('Network response was not ok');
-                }
-                return response.json();
-            })
-            .then(data => {
-                // Format main answer with Markdown-like enhancements
-                const mainAnswer = formatText(data.main_answer || '');
-                document.getElementById('answer-text').innerHTML = mainAnswer;
-                
-                // Add follow-up questions
-                const followUpContainer = document.getElementById('follow-up-questions');
-                followUpContainer.innerHTML = '';
-                
-                if (data.follow_up_questions && data.follow_up_questions.length) {
-                    data.follow_up_questions.forEach(question => {
-                        const button = document.createElement('button');
-                        button.textContent = question;
-                        button.addEventListener('click', function() {
-                            document.getElementById('question-input').value = question;
-                            document.getElementById('search-button').click();
-                        });
-                        followUpContainer.appendChild(button);
-                    });
-                } else {
-                    followUpContainer.innerHTML = '<p>No follow-up questions available</p>';
-                }
-                
-                // Add read more links
-                const readMoreContainer = document.getElementById('read-more-links');
-                readMoreContainer.innerHTML = '';
-                
-                if (data.read_more && data.read_more.length) {
-                    data.read_more.forEach(item => {
-                        const link = document.createElement('a');
-                        link.href = item.url;
-                        link.textContent = item.title || item.url;
-                        link.target = '_blank';
-                        link.rel = 'noopener noreferrer';
-                        readMoreContainer.appendChild(link);
-                    });
-                } else {
-                    readMoreContainer.innerHTML = '<p>No additional resources available</p>';
-                }
-                
-                // Hide loading, show results
-                document.getElementById('loading').style.display = 'none';
-                document.getElementById('answer-container').style.display = 'block';
-            })
-            .catch(error => {
-                console.error('Error:', error);
-                document.getElementById('answer-text').innerHTML = 
-                    `<div class="error">Error: ${error.message}<br>Please try again.</div>`;
-                document.getElementById('loading').style.display = 'none';
-                document.getElementById('answer-container').style.display = 'block';
-            });
-        });
-        
-        // Handle Enter key in the input field
-        document.getElementById('question-input').addEventListener('keypress', function(event) {
-            if (event.key === 'Enter') {
-                document.getElementById('search-button').click();
-            }
-        });
-        
-        // Simple Markdown-like formatter
-        function formatText(text) {
-            if (!text) return '';
-            
-            // Bold text **example**
-            text = text.replace(/\\*\\*([^*]+)\\*\\*/g, '<strong>$1</strong>');
-            
-            // Italics *example*
-            text = text.replace(/\\*([^*]+)\\*/g, '<em>$1</em>');
-            
-            // Source citation
-            text = text.replace(/\\[Source\\s+(\\d+)\\]/g, '<span class="source">[Source $1]</span>');
-            
-            // Process paragraphs
-            let paragraphs = text.split(/\\n\\n+/);
-            let processedHtml = '';
-            
-            for (let p of paragraphs) {
-                p = p.trim();
-                if (!p) continue;
-                
-                // Check if this is a numbered list
-                if (/^\\d+\\.\\s/.test(p)) {
-                    const listItems = p.split(/\\n/).filter(line => /^\\d+\\.\\s/.test(line));
-                    if (listItems.length > 0) {
-                        let listHtml = '<ol>';
-                        for (const item of listItems) {
-                            const content = item.replace(/^\\d+\\.\\s/, '').trim();
-                            listHtml += `<li>${content}</li>`;
-                        }
-                        listHtml += '</ol>';
-                        processedHtml += listHtml;
-                    } else {
-                        processedHtml += `<p>${p}</p>`;
-                    }
-                } else {
-                    processedHtml += `<p>${p}</p>`;
-                }
-            }
-            
-            return processedHtml || text;
-        }
-    </script>
-</body>
-</html>
-        ''')
+    # Open model API connections before taking requests
+    warm_model_connections()
     
-    # Run the app with specific host and port settings
-    print("Starting server at http://127.0.0.1:5000")
-    app.run(host='127.0.0.1', port=5000, debug=True)
\ No newline at end of file
+    print(f"Starting server at http://{FLASK_HOST}:{FLASK_PORT}")
+    if serve is not None and not FLASK_DEBUG:
+        serve(app, host=FLASK_HOST, port=FLASK_PORT, threads=FLASK_THREADS)
+    else:
+        if not FLASK_DEBUG:
+            print("waitress is not installed, using the threaded Werkzeug server")
+        app.run(host=FLASK_HOST, port=FLASK_PORT, debug=FLASK_DEBUG, threaded=True)
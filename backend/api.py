@@ -1,17 +1,51 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import os
 import sys
-from typing import List, Dict, Optional
+import asyncio
+import hashlib
+import hmac
+import random
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, List, Dict, Optional
 
 # Add the parent directory to the path to import main
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from main import answer_question, SEARCH_ENGINES, DEFAULT_SEARCH_ENGINE
+from main import (
+    answer_question, generate_answer, log_query, prefetch_search, normalize_search_engine, engine_registry,
+    profile_for, search_profiles, cache_l2, usage_ledger, cache_ttl_for, answer_cache, answer_cache_key, model_warmer, warm_model_connections, SEARCH_ENGINES, DEFAULT_SEARCH_ENGINE, DEFAULT_MODE,
+    REQUEST_DEADLINE_SECONDS
+)
+from deadline import Deadline
+from http_encoding import COMPRESS_MIN_BYTES, CompressionMiddleware, dumps, etag_for, etag_matches
+from metrics import metrics
+from admission import AdmissionController, AdmissionRejected, ClientQuotas, retry_after_header
+from jobs import JobManager, JobStore, public_job
+from token_accounting import RequestUsage
+from request_profiler import RequestProfile, load_profile
+from history_store import HistoryStore
 
 class QuestionRequest(BaseModel):
     question: str
-    search_engine: str = DEFAULT_SEARCH_ENGINE  # Default to configured engine
+    search_engine: str = DEFAULT_SEARCH_ENGINE  # Option name or comma-separated engine names
+    mode: str = DEFAULT_MODE  # Search mode profile: search, focus, scholar or youtube
+    deadline_ms: Optional[int] = None  # Time budget for the answer, overrides X-Deadline-Ms
+    session_id: Optional[str] = None  # Conversation the answer is stored under in the history
+
+class PrefetchRequest(BaseModel):
+    question: str
+    search_engine: str = DEFAULT_SEARCH_ENGINE
+    mode: str = DEFAULT_MODE
+
+class JobRequest(BaseModel):
+    question: str
+    search_engine: str = DEFAULT_SEARCH_ENGINE
+    mode: str = DEFAULT_MODE
+    callback_url: Optional[str] = None  # Receives the finished job as a JSON POST
 
 class ReadMoreItem(BaseModel):
     url: str
@@ -21,8 +55,88 @@ class AnswerResponse(BaseModel):
     main_answer: str
     follow_up_questions: List[str] = []
     read_more: List[Dict[str, str]] = []
+    degraded: bool = False  # Work was cut short to meet the deadline
+    usage: Optional[Dict[str, Any]] = None  # Context size, tokens and cost of this request
+    profile_id: Optional[str] = None  # Set when the request was profiled
+    from_history: bool = False  # Reused from an earlier answer to the same question
+
+class ORJSONResponse(JSONResponse):
+    """JSON response serialized with orjson (falls back to the standard library)"""
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open model API connections before the worker starts taking requests
+    await run_in_threadpool(warm_model_connections)
+    yield
+    model_warmer.stop()
+
+app = FastAPI(title="RAG Web Search API", default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# Admission control for /api/ask: concurrent requests, waiting requests and
+# how long a request may wait, plus a per-client (API key or IP) quota
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("ASK_MAX_CONCURRENT", "16")),
+    max_queue=int(os.getenv("ASK_MAX_QUEUE", "32")),
+    queue_timeout=float(os.getenv("ASK_QUEUE_TIMEOUT", "10"))
+)
+client_quotas = ClientQuotas(
+    per_minute=float(os.getenv("CLIENT_QUOTA_PER_MINUTE", "30")),
+    burst=float(os.getenv("CLIENT_QUOTA_BURST", "10"))
+)
+
+# API keys identifying clients for quotas, usage totals and the history
+# (comma-separated). Other X-API-Key values are ignored and the client is
+# identified by its IP address, so rotating made-up keys does not reset a quota
+API_KEYS = [key.strip() for key in os.getenv("API_KEYS", "").split(",") if key.strip()]
+
+# Upper bound on client-requested deadlines
+REQUEST_DEADLINE_MAX_SECONDS = float(os.getenv("REQUEST_DEADLINE_MAX_SECONDS", "120"))
+
+# Background jobs for long-running questions: worker pool size, jobs queued
+# or running before new ones get 503, per-job time budget and how long
+# finished jobs can be polled (kept in the shared cache store when configured)
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "4"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))
+JOB_DEADLINE_SECONDS = float(os.getenv("JOB_DEADLINE_SECONDS", "600"))
+JOB_TTL = float(os.getenv("JOB_TTL", "86400"))
+JOB_CALLBACK_SECRET = os.getenv("JOB_CALLBACK_SECRET", "")
+# Comma-separated callback hosts; when empty, any host resolving to public addresses
+JOB_CALLBACK_ALLOWED_HOSTS = [host for host in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if host.strip()]
+
+# Opt-in request profiling: requests with an X-Profile header matching
+# PROFILE_TOKEN, and a PROFILE_SAMPLE_RATE share of all requests, are sampled
+# every PROFILE_INTERVAL_MS and saved as speedscope profiles in PROFILE_DIR
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
 
-app = FastAPI(title="RAG Web Search API")
+# Opt-in answer history in SQLite (set HISTORY_PATH to enable it), kept for
+# HISTORY_RETENTION_DAYS. Answers to the same question generated within
+# HISTORY_ANSWER_MAX_AGE seconds are reused (0 disables reuse)
+HISTORY_PATH = os.getenv("HISTORY_PATH", "")
+HISTORY_RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", "30"))
+HISTORY_ANSWER_MAX_AGE = float(os.getenv("HISTORY_ANSWER_MAX_AGE", "3600"))
+HISTORY_PAGE_MAX = 100
+history = HistoryStore(
+    HISTORY_PATH,
+    retention=HISTORY_RETENTION_DAYS * 86400,
+    batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5"))
+) if HISTORY_PATH else None
+
+# Speculative prefetch limits
+PREFETCH_MIN_CHARS = int(os.getenv("PREFETCH_MIN_CHARS", "8"))
+PREFETCH_DEBOUNCE_SECONDS = float(os.getenv("PREFETCH_DEBOUNCE_SECONDS", "0.3"))
+PREFETCH_MAX_PER_CLIENT = int(os.getenv("PREFETCH_MAX_PER_CLIENT", "1"))
+PREFETCH_MAX_CONCURRENT = int(os.getenv("PREFETCH_MAX_CONCURRENT", "8"))
+
+# Pending prefetch per client, and searches actually running per client
+_prefetch_tasks: Dict[str, asyncio.Task] = {}
+_prefetch_running: Dict[str, int] = {}
+_prefetch_lock = threading.Lock()
 
 # Configure CORS
 app.add_middleware(
@@ -31,8 +145,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Compress responses above COMPRESS_MIN_BYTES with brotli or gzip
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESS_MIN_BYTES)
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -43,38 +161,350 @@ async def root():
         "default_engine": DEFAULT_SEARCH_ENGINE
     }
 
+@app.get("/ready")
+async def ready():
+    """Readiness check: fails until the model API connections have been warmed"""
+    if not model_warmer.ready:
+        raise HTTPException(status_code=503, detail="Warming up")
+    return {"status": "ready"}
+
 @app.get("/engines")
 async def get_engines():
     """Get available search engines"""
     return {
         "available_engines": list(SEARCH_ENGINES.keys()),
         "descriptions": SEARCH_ENGINES,
-        "default_engine": DEFAULT_SEARCH_ENGINE
+        "default_engine": DEFAULT_SEARCH_ENGINE,
+        # Individual engines, which may also be combined as "name1,name2"
+        "engines": engine_registry.stats()
+    }
+
+@app.get("/modes")
+async def get_modes():
+    """Get the search modes and their performance profiles"""
+    return {
+        "modes": {name: profile.to_dict() for name, profile in search_profiles.items()},
+        "default_mode": DEFAULT_MODE
     }
 
+@app.get("/api/usage")
+async def get_usage(http_request: Request):
+    """Token and cost totals of the calling client and of every search mode"""
+    return {
+        "client": usage_ledger.client_totals(client_key_for(http_request)),
+        "modes": usage_ledger.mode_totals()
+    }
+
+def history_page(entries: List[dict], next_cursor: Optional[int]) -> dict:
+    return {"entries": entries, "next_cursor": next_cursor}
+
+@app.get("/api/history")
+async def get_history(http_request: Request, before: Optional[int] = None, limit: int = 20):
+    """List the calling API-key client's answered questions, newest first; pass next_cursor as before for the next page"""
+    if history is None:
+        raise HTTPException(status_code=404, detail="History is disabled")
+    user_id = user_id_for(client_key_for(http_request))
+    if user_id is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Listing the history requires an API key; list a conversation by its session ID instead"
+        )
+    entries, next_cursor = await run_in_threadpool(
+        history.list_entries, user_id=user_id, before=before, limit=max(1, min(limit, HISTORY_PAGE_MAX))
+    )
+    return history_page(entries, next_cursor)
+
+@app.get("/api/history/sessions/{session_id}")
+async def get_session_history(session_id: str, before: Optional[int] = None, limit: int = 20):
+    """List a conversation's answered questions, newest first; pass next_cursor as before for the next page"""
+    if history is None:
+        raise HTTPException(status_code=404, detail="History is disabled")
+    entries, next_cursor = await run_in_threadpool(
+        history.list_entries, session_id=session_id, before=before, limit=max(1, min(limit, HISTORY_PAGE_MAX))
+    )
+    return history_page(entries, next_cursor)
+
+@app.get("/api/profiles/{profile_id}")
+async def get_profile(profile_id: str, http_request: Request):
+    """Download a saved request profile in the speedscope format (requires the X-Profile token)"""
+    if not has_profile_token(http_request):
+        raise HTTPException(status_code=403, detail="Profiling token required")
+    profile = await run_in_threadpool(load_profile, PROFILE_DIR, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Application metrics in the Prometheus text format"""
+    return metrics.render_prometheus()
+
+def client_key_for(http_request: Request) -> str:
+    """Identify the client by a configured API key, falling back to its IP address."""
+    api_key = http_request.headers.get("x-api-key", "")
+    if api_key and any(hmac.compare_digest(api_key, key) for key in API_KEYS):
+        return f"key:{api_key}"
+    return f"ip:{http_request.client.host if http_request.client else 'unknown'}"
+
+def user_id_for(client_key: str) -> Optional[str]:
+    """
+    Identify an API-key client in the history without storing its key. Clients
+    known only by IP address get None, since one address can be shared by many
+    users behind a NAT or proxy; their entries are listed by session only.
+    """
+    if not client_key.startswith("key:"):
+        return None
+    return hashlib.sha256(client_key.encode("utf-8")).hexdigest()[:32]
+
+def has_profile_token(http_request: Request) -> bool:
+    """Whether the request carries the privileged profiling token."""
+    token = http_request.headers.get("x-profile", "")
+    return bool(PROFILE_TOKEN and token) and hmac.compare_digest(token, PROFILE_TOKEN)
+
+def profile_for_request(request: QuestionRequest, http_request: Request) -> Optional[RequestProfile]:
+    """Return a profiler for requests that opted in or were sampled, else None."""
+    if has_profile_token(http_request) or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE):
+        return RequestProfile(request.question[:100], interval=PROFILE_INTERVAL_MS / 1000)
+    return None
+
+def deadline_for(request: QuestionRequest, http_request: Request) -> Deadline:
+    """Start the request's deadline from the body or X-Deadline-Ms header, or the server default."""
+    deadline_ms = request.deadline_ms
+    if deadline_ms is None:
+        try:
+            deadline_ms = int(http_request.headers.get("x-deadline-ms", ""))
+        except ValueError:
+            deadline_ms = None
+    if deadline_ms is None or deadline_ms <= 0:
+        return Deadline(REQUEST_DEADLINE_SECONDS)
+    return Deadline(min(deadline_ms / 1000, REQUEST_DEADLINE_MAX_SECONDS))
+
 @app.post("/api/ask", response_model=AnswerResponse)
-async def ask(request: QuestionRequest):
+async def ask(request: QuestionRequest, http_request: Request):
     """Process a question and return an answer with sources and follow-up questions"""
+    # Started before admission so time spent queueing counts against the budget
+    deadline = deadline_for(request, http_request)
+    try:
+        client_key = client_key_for(http_request)
+        client_quotas.check(client_key)
+        async with admission.slot(timeout=deadline.remaining()):
+            answer = await _answer(request, deadline, client_key, profile_for_request(request, http_request))
+    except AdmissionRejected as e:
+        status_code = 429 if e.reason == "quota" else 503
+        raise HTTPException(
+            status_code=status_code,
+            detail="Rate limit exceeded" if status_code == 429 else "Server is busy, please retry",
+            headers={"Retry-After": retry_after_header(e.retry_after)}
+        )
+    return Response(dumps(AnswerResponse(**answer).model_dump()), media_type="application/json")
+
+@app.get("/api/answer", response_model=AnswerResponse)
+async def get_cached_answer(
+    question: str,
+    http_request: Request,
+    search_engine: str = DEFAULT_SEARCH_ENGINE,
+    mode: str = DEFAULT_MODE
+):
+    """
+    Return the cached answer to a question without running the pipeline (404
+    when there is none; POST /api/ask generates one). The ETag is compared
+    before the answer is formatted, so a matching revalidation only costs a
+    cache lookup and returns 304 Not Modified
+    """
+    search_engine = normalize_search_engine(search_engine)
+    mode = profile_for(mode).name
+    raw_answer = await run_in_threadpool(answer_cache.get, answer_cache_key(question, search_engine, mode))
+    if raw_answer is None:
+        raise HTTPException(status_code=404, detail="No cached answer for this question")
+    etag = etag_for(raw_answer.encode("utf-8"))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(http_request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    body = dumps(AnswerResponse(**format_answer(raw_answer)).model_dump())
+    return Response(body, media_type="application/json", headers=headers)
+
+async def _answer(
+    request: QuestionRequest,
+    deadline: Deadline,
+    client_key: Optional[str] = None,
+    profile: Optional[RequestProfile] = None
+) -> dict:
+    """Answer an admitted question within its deadline, profiling it when a profile is given"""
     try:
         if not request.question.strip():
             raise HTTPException(status_code=400, detail="Question cannot be empty")
         
         # Validate search engine
-        search_engine = request.search_engine
-        if search_engine not in SEARCH_ENGINES:
-            search_engine = DEFAULT_SEARCH_ENGINE
+        search_engine = normalize_search_engine(request.search_engine)
+        mode = profile_for(request.mode).name
+        
+        # Record the question so popular queries can be prewarmed
+        log_query(request.question, search_engine, mode)
             
-        # Get raw answer from the main module
-        raw_answer = answer_question(request.question, search_engine=search_engine)
+        # An earlier answer to the same question costs far less than a new one
+        stored_answer = None
+        if history is not None and HISTORY_ANSWER_MAX_AGE > 0:
+            stored_answer = await run_in_threadpool(
+                history.find_answer, request.question, search_engine, mode,
+                cache_ttl_for(request.question, HISTORY_ANSWER_MAX_AGE)
+            )
+        
+        # Get and format the answer without blocking the event loop
+        usage = RequestUsage(client=client_key, mode=mode)
+        def answer_and_format() -> dict:
+            raw_answer = answer_question(
+                request.question, search_engine=search_engine, deadline=deadline, mode=mode, usage=usage,
+                callbacks=[profile.callbacks] if profile else None
+            )
+            return format_answer(raw_answer)
+        
+        answered_at = None
+        if stored_answer is not None:
+            metrics.inc("history_answer_hits_total", mode=mode)
+            answered_at = stored_answer.pop("answered_at")
+            formatted_answer = stored_answer
+            formatted_answer['from_history'] = True
+        elif profile is None:
+            formatted_answer = await run_in_threadpool(answer_and_format)
+        else:
+            formatted_answer = await run_in_threadpool(profile.run, answer_and_format)
+            profile.callbacks.log(request.question)
+            await run_in_threadpool(profile.save, PROFILE_DIR)
+            formatted_answer['profile_id'] = profile.id
+        formatted_answer['degraded'] = deadline.degraded
+        formatted_answer['usage'] = usage.to_dict()
         
-        # Format the answer
-        formatted_answer = format_answer(raw_answer)
+        # Stored by the history writer thread, off the request path; error answers are not kept
+        if history is not None and client_key is not None and not deadline.failed:
+            history.record(
+                request.question, formatted_answer, search_engine, mode,
+                user_id=user_id_for(client_key), session_id=request.session_id, answered_at=answered_at
+            )
         
         return formatted_answer
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _run_prefetch_search(client_key: str, question: str, search_engine: str, mode: str) -> None:
+    """Run a prefetch search if the per-client and global limits allow it."""
+    with _prefetch_lock:
+        if (_prefetch_running.get(client_key, 0) >= PREFETCH_MAX_PER_CLIENT
+                or sum(_prefetch_running.values()) >= PREFETCH_MAX_CONCURRENT):
+            return
+        _prefetch_running[client_key] = _prefetch_running.get(client_key, 0) + 1
+    try:
+        prefetch_search(question, search_engine=search_engine, mode=mode, client=client_key)
+    except Exception as e:
+        print(f"Error in prefetch search: {e}")
+    finally:
+        with _prefetch_lock:
+            _prefetch_running[client_key] -= 1
+            if not _prefetch_running[client_key]:
+                del _prefetch_running[client_key]
+
+async def _debounced_prefetch(client_key: str, question: str, search_engine: str, mode: str) -> None:
+    """Wait out the debounce window, then start the prefetch search."""
+    try:
+        await asyncio.sleep(PREFETCH_DEBOUNCE_SECONDS)
+        await run_in_threadpool(_run_prefetch_search, client_key, question, search_engine, mode)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        if _prefetch_tasks.get(client_key) is asyncio.current_task():
+            del _prefetch_tasks[client_key]
+
+@app.post("/api/prefetch", status_code=202)
+async def prefetch(request: PrefetchRequest, http_request: Request):
+    """Start a speculative search for a partially typed question"""
+    question = request.question.strip()
+    if len(question) < PREFETCH_MIN_CHARS:
+        return {"status": "ignored"}
+    
+    search_engine = normalize_search_engine(request.search_engine)
+    
+    # Limits and supersession follow the authenticated client, not a caller-chosen ID
+    client_key = client_key_for(http_request)
+    try:
+        client_quotas.check(client_key)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429, detail="Rate limit exceeded", headers={"Retry-After": retry_after_header(e.retry_after)}
+        )
+    
+    # Newer text from the same client supersedes a prefetch that has not started yet
+    previous = _prefetch_tasks.pop(client_key, None)
+    if previous and not previous.done():
+        previous.cancel()
+    
+    mode = profile_for(request.mode).name
+    _prefetch_tasks[client_key] = asyncio.create_task(_debounced_prefetch(client_key, question, search_engine, mode))
+    return {"status": "scheduled"}
+
+def _run_job(params: dict, progress, client_key: Optional[str] = None) -> dict:
+    """Answer a job's question with the job time budget, reporting partial results."""
+    deadline = Deadline(JOB_DEADLINE_SECONDS)
+    usage = RequestUsage(client=client_key, mode=params["mode"])
+    raw_answer = generate_answer(
+        params["question"], search_engine=params["search_engine"], deadline=deadline,
+        mode=params["mode"], progress=progress, usage=usage
+    )
+    formatted_answer = format_answer(raw_answer)
+    formatted_answer['degraded'] = deadline.degraded
+    formatted_answer['usage'] = usage.to_dict()
+    return AnswerResponse(**formatted_answer).model_dump()
+
+jobs = JobManager(
+    _run_job,
+    JobStore(ttl=JOB_TTL, client=cache_l2),
+    max_workers=JOB_MAX_WORKERS,
+    max_pending=JOB_MAX_PENDING,
+    callback_secret=JOB_CALLBACK_SECRET,
+    callback_allowed_hosts=JOB_CALLBACK_ALLOWED_HOSTS
+)
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(request: JobRequest, http_request: Request):
+    """Queue a question as a background job and return its ID at once"""
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    client_key = client_key_for(http_request)
+    try:
+        client_quotas.check(client_key)
+        search_engine = normalize_search_engine(request.search_engine)
+        mode = profile_for(request.mode).name
+        log_query(request.question, search_engine, mode)
+        # The callback host is resolved during submit, so keep it off the event loop
+        job = await run_in_threadpool(
+            jobs.submit,
+            {"question": request.question, "search_engine": search_engine, "mode": mode},
+            callback_url=request.callback_url,
+            client=client_key
+        )
+    except ValueError as e:
+        # Callback URL not allowed
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionRejected as e:
+        status_code = 429 if e.reason == "quota" else 503
+        raise HTTPException(
+            status_code=status_code,
+            detail="Rate limit exceeded" if status_code == 429 else "Too many jobs, please retry",
+            headers={"Retry-After": retry_after_header(e.retry_after)}
+        )
+    return JSONResponse(
+        {"id": job["id"], "status": job["status"], "status_url": f"/api/jobs/{job['id']}"},
+        status_code=202,
+        headers={"Location": f"/api/jobs/{job['id']}"}
+    )
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get a job's status, partial results while it runs and its answer once finished"""
+    job = await run_in_threadpool(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return public_job(job)
+
 def format_answer(raw_answer: str) -> dict:
     """Format the raw answer into structured sections for better display"""
     import re
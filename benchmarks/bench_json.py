@@ -0,0 +1,86 @@
+"""
+Benchmark JSON encoding and compression of /api/ask answer payloads.
+
+Usage:
+    python benchmarks/bench_json.py --answer-words 300 1500 --links 5 20
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+from http_encoding import brotli, orjson
+
+try:
+    from api import AnswerResponse
+except Exception:
+    AnswerResponse = None
+
+WORDS = ("the", "search", "results", "show", "that", "model", "latency", "answer", "source", "recent",
+         "report", "according", "growth", "energy", "market", "climate", "percent", "study", "2024", "data")
+
+
+def build_answer(answer_words: int, links: int, seed: int = 0) -> dict:
+    """Answer payload shaped like format_answer output, with citations and unicode."""
+    rng = random.Random(seed)
+    sentences = []
+    for i in range(0, answer_words, 15):
+        words = [rng.choice(WORDS) for _ in range(min(15, answer_words - i))]
+        sentences.append(" ".join(words).capitalize() + f" [Source {rng.randint(1, 10)}] — “ok”.")
+    return {
+        "main_answer": "\n\n".join(" ".join(sentences[i:i + 4]) for i in range(0, len(sentences), 4)),
+        "follow_up_questions": [f"What about {rng.choice(WORDS)} {rng.choice(WORDS)}?" for _ in range(3)],
+        "read_more": [{"url": f"https://example.com/articles/{rng.getrandbits(48):x}/{i}",
+                       "title": f"Article {i}: {rng.choice(WORDS)} {rng.choice(WORDS)} analysis"} for i in range(links)],
+        "degraded": False
+    }
+
+
+def time_call(fn, repeats: int) -> float:
+    """Median microseconds per call."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark answer payload serialization")
+    parser.add_argument("--answer-words", type=int, nargs="+", default=[300, 1500])
+    parser.add_argument("--links", type=int, nargs="+", default=[5, 20])
+    parser.add_argument("--repeats", type=int, default=2000)
+    args = parser.parse_args()
+
+    for words in args.answer_words:
+        for links in args.links:
+            payload = build_answer(words, links)
+            encoders = {"json": lambda: json.dumps(payload).encode("utf-8")}
+            if orjson is not None:
+                encoders["orjson"] = lambda: orjson.dumps(payload)
+            if AnswerResponse is not None:
+                model = AnswerResponse(**payload)
+                encoders["pydantic"] = lambda: model.model_dump_json().encode("utf-8")
+            body = encoders.get("orjson", encoders["json"])()
+            print(f"words={words:<5} links={links:<3} body={len(body):>7} bytes")
+            for name, encode in encoders.items():
+                print(f"    encode {name:<9} {time_call(encode, args.repeats):9.1f}us")
+            codecs = {"gzip-6": lambda: gzip.compress(body, compresslevel=6, mtime=0)}
+            if brotli is not None:
+                codecs["brotli-5"] = lambda: brotli.compress(body, quality=5)
+            for name, codec in codecs.items():
+                size = len(codec())
+                print(f"    {name:<16} {time_call(codec, max(1, args.repeats // 10)):9.1f}us  "
+                      f"{size:>7} bytes ({size / len(body):.0%})")
+
+
+if __name__ == "__main__":
+    main()
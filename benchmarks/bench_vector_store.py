@@ -0,0 +1,71 @@
+"""
+Benchmark top-k lookup latency of the memory-mapped embedding store.
+
+Usage:
+    python benchmarks/bench_vector_store.py --sizes 100000 1000000 --dim 256 --dtype float32
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vector_store import EmbeddingStore
+
+
+def build_store(directory: str, size: int, dim: int, dtype: str, segment_size: int) -> EmbeddingStore:
+    store = EmbeddingStore(directory, dim=dim, dtype=dtype, segment_size=segment_size)
+    rng = np.random.default_rng(0)
+    for start in range(0, size, segment_size):
+        count = min(segment_size, size - start)
+        store.add([str(i) for i in range(start, start + count)], rng.standard_normal((count, dim), dtype=np.float32))
+    store.flush()
+    return store
+
+
+def time_lookups(store: EmbeddingStore, dim: int, batch: int, k: int, repeats: int) -> list:
+    rng = np.random.default_rng(1)
+    timings = []
+    for _ in range(repeats):
+        queries = rng.standard_normal((batch, dim), dtype=np.float32)
+        start = time.perf_counter()
+        store.search(queries, k=k)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding store lookup latency")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--dtype", choices=["float32", "int8"], default="float32")
+    parser.add_argument("--segment-size", type=int, default=100000)
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 32])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        directory = tempfile.mkdtemp(prefix="bench-vector-store-")
+        try:
+            start = time.perf_counter()
+            store = build_store(directory, size, args.dim, args.dtype, args.segment_size)
+            build_seconds = time.perf_counter() - start
+            # Warm the page cache so the numbers reflect steady state
+            time_lookups(store, args.dim, 1, args.k, 2)
+            print(f"{size:>9} vectors  dim={args.dim} {args.dtype}  built in {build_seconds:.1f}s")
+            for batch in args.batches:
+                timings = time_lookups(store, args.dim, batch, args.k, args.repeats)
+                p50, p95 = np.percentile(timings, [50, 95])
+                print(f"    batch={batch:<4} k={args.k:<3} p50={p50:8.2f}ms  p95={p95:8.2f}ms  "
+                      f"per query={p50 / batch:7.3f}ms")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Replay a recorded traffic corpus through the answer pipeline, without the
+network, to time or profile the CPU-side work (context building, prompt
+formatting, answer parsing).
+
+Record a corpus first by running the backend with
+    RECORD_MODE=record RECORD_PATH=corpus.jsonl.zst
+
+Usage:
+    python benchmarks/replay_pipeline.py corpus.jsonl.zst --rounds 5 --speed 0 --profile replay.prof
+"""
+import argparse
+import cProfile
+import os
+import sys
+import time
+
+import numpy as np
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded traffic through the answer pipeline")
+    parser.add_argument("corpus", help="Corpus written in record mode")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--speed", type=float, default=0, help="Replay speed (0 skips recorded latencies)")
+    parser.add_argument("--profile", help="Write cProfile stats to this file")
+    args = parser.parse_args()
+
+    # Configure replay before main reads its settings
+    os.environ["RECORD_MODE"] = "replay"
+    os.environ["RECORD_PATH"] = args.corpus
+    os.environ["REPLAY_SPEED"] = str(args.speed)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.append(root)
+    sys.path.append(os.path.join(root, "backend"))
+    import main
+    from api import format_answer
+
+    questions = list(dict.fromkeys(
+        (r["request"]["question"], r["request"].get("search_engine")) for r in main.recorder.records("llm")
+    ))
+    engines = {description: name for name, description in main.SEARCH_ENGINES.items()}
+    if not questions:
+        print("The corpus holds no recorded model outputs")
+        return
+
+    profiler = cProfile.Profile() if args.profile else None
+    timings = []
+    for _ in range(args.rounds):
+        # Every round runs the full pipeline rather than hitting the caches
+        main.search_cache.clear()
+        main.answer_cache.clear()
+        for question, engine in questions:
+            start = time.perf_counter()
+            if profiler:
+                profiler.enable()
+            raw_answer = main.generate_answer(question, search_engine=engines.get(engine, engine))
+            format_answer(raw_answer)
+            if profiler:
+                profiler.disable()
+            timings.append((time.perf_counter() - start) * 1000)
+
+    p50, p95 = np.percentile(timings, [50, 95])
+    print(f"{len(questions)} questions x {args.rounds} rounds  p50={p50:.2f}ms  p95={p95:.2f}ms")
+    if profiler:
+        profiler.dump_stats(args.profile)
+        print(f"Profile written to {args.profile}")
+
+
+if __name__ == "__main__":
+    main()
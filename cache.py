@@ -0,0 +1,440 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so trivially different phrasings share a cache entry."""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?!. ")
+
+
+def make_key(*parts: Any) -> Tuple:
+    """Build a hashable cache key from the given parts."""
+    return tuple(normalize_query(part) if isinstance(part, str) else part for part in parts)
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries expire after a TTL
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        """
+        Initialize the cache
+
+        Args:
+            maxsize: Maximum number of entries kept before the least recently used is evicted
+            ttl: Default time-to-live of an entry in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """Return the cached value for key, or default if it is missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store value under key, evicting the least recently used entry if full."""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] >= time.monotonic()
+
+    def items(self) -> list:
+        """Return a snapshot of the (key, value) pairs that have not expired."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at >= now]
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters for reporting."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+# Optional fast serialization; falls back to JSON + zlib when not installed
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_FORMAT_MSGPACK_ZSTD = b"\x01"
+_FORMAT_JSON_ZLIB = b"\x02"
+
+
+def serialize(value: Any) -> bytes:
+    """Serialize a cache value compactly, prefixed with a format byte."""
+    if msgpack is not None and zstandard is not None:
+        return _FORMAT_MSGPACK_ZSTD + zstandard.ZstdCompressor(level=3).compress(msgpack.packb(value, use_bin_type=True))
+    return _FORMAT_JSON_ZLIB + zlib.compress(json.dumps(value).encode("utf-8"))
+
+
+def deserialize(data: bytes) -> Any:
+    """Deserialize a value written by serialize."""
+    fmt, payload = data[:1], data[1:]
+    if fmt == _FORMAT_MSGPACK_ZSTD:
+        return msgpack.unpackb(zstandard.ZstdDecompressor().decompress(payload), raw=False)
+    if fmt == _FORMAT_JSON_ZLIB:
+        return json.loads(zlib.decompress(payload).decode("utf-8"))
+    raise ValueError(f"Unknown cache value format: {fmt!r}")
+
+
+# Deletes a lock key only when it still holds the caller's token (compare-and-delete)
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class InMemoryRedis:
+    """
+    In-process stand-in for the subset of the Redis client API used by
+    TieredCache, for tests and single-process development
+    """
+    def __init__(self):
+        self._data: Dict[str, Tuple[Optional[float], bytes]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, name: str) -> Optional[bytes]:
+        entry = self._data.get(name)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[name]
+            return None
+        return value
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            return self._live(name)
+
+    def set(self, name: str, value: Any, ex: Optional[float] = None, nx: bool = False) -> Optional[bool]:
+        with self._lock:
+            if nx and self._live(name) is not None:
+                return None
+            if isinstance(value, str):
+                value = value.encode("utf-8")
+            self._data[name] = (time.monotonic() + ex if ex else None, value)
+            return True
+
+    def delete(self, *names: str) -> int:
+        with self._lock:
+            return sum(1 for name in names if self._data.pop(name, None) is not None)
+
+    def eval(self, script: str, numkeys: int, *args: Any) -> int:
+        """Run a script; only the lock release script is supported."""
+        if script != RELEASE_LOCK_SCRIPT:
+            raise NotImplementedError("InMemoryRedis only runs the lock release script")
+        name, token = args[0], args[1]
+        if isinstance(token, str):
+            token = token.encode("utf-8")
+        with self._lock:
+            if self._live(name) != token:
+                return 0
+            del self._data[name]
+            return 1
+
+    def flushdb(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+def make_l2_client(url: str) -> Any:
+    """Create a shared cache client; 'memory://' uses the in-process stand-in."""
+    if url == "memory://":
+        return InMemoryRedis()
+    import redis
+    return redis.Redis.from_url(url)
+
+
+class TieredCache:
+    """
+    Two-tier cache: an in-process TTL LRU (L1) in front of an optional shared
+    Redis-compatible store (L2) so every worker reuses what any worker fetched.
+    Empty results are cached for a shorter time, and concurrent misses for the
+    same key are collapsed so only one caller computes the value.
+    """
+    def __init__(
+        self,
+        namespace: str,
+        l1: TTLCache,
+        l2: Any = None,
+        negative_ttl: float = 60,
+        lock_timeout: float = 30
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            namespace: Prefix for L2 keys, separating caches that share a store
+            l1: In-process cache tier
+            l2: Redis-compatible client, or None for an L1-only cache
+            negative_ttl: TTL in seconds for empty results
+            lock_timeout: Seconds a computing caller holds the shared per-key lock
+        """
+        self.namespace = namespace
+        self.l1 = l1
+        self.l2 = l2
+        self.ttl = l1.ttl
+        self.negative_ttl = negative_ttl
+        self.lock_timeout = lock_timeout
+        # Result of the computation in progress per key, shared with callers waiting for it
+        self._inflight: Dict[Hashable, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self.l2_hits = 0
+        self.l2_errors = 0
+
+    def _l2_key(self, key: Hashable) -> str:
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return f"{self.namespace}:{digest}"
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """Return the value from L1, else from L2 (promoting it to L1), else default."""
+        value = self.l1.get(key)
+        if value is not None:
+            return value
+        if self.l2 is None:
+            return default
+        try:
+            data = self.l2.get(self._l2_key(key))
+        except Exception as e:
+            self.l2_errors += 1
+            print(f"Error reading shared cache: {e}")
+            return default
+        if data is None:
+            return default
+        try:
+            value = deserialize(data)
+        except Exception as e:
+            # A corrupt or unreadable entry is a miss; it is overwritten when recomputed
+            self.l2_errors += 1
+            print(f"Error decoding shared cache value: {e}")
+            return default
+        self.l2_hits += 1
+        self.l1.set(key, value)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store value in both tiers."""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self.l1.set(key, value, ttl=ttl)
+        if self.l2 is None:
+            return
+        try:
+            self.l2.set(self._l2_key(key), serialize(value), ex=max(1, int(ttl)))
+        except Exception as e:
+            self.l2_errors += 1
+            print(f"Error writing shared cache: {e}")
+
+    def delete(self, key: Hashable) -> None:
+        self.l1.delete(key)
+        if self.l2 is not None:
+            try:
+                self.l2.delete(self._l2_key(key))
+            except Exception as e:
+                print(f"Error deleting from shared cache: {e}")
+
+    def clear(self) -> None:
+        """Clear the local tier; the shared tier expires on its own."""
+        self.l1.clear()
+
+    def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Any],
+        ttl: Optional[float] = None,
+        cacheable: Callable[[Any], bool] = lambda value: True,
+        is_empty: Callable[[Any], bool] = lambda value: not value,
+        deadline: Optional[Any] = None,
+        ttl_for: Optional[Callable[[Any], Optional[float]]] = None
+    ) -> Any:
+        """
+        Return the cached value for key, computing and caching it on a miss.
+        Only one caller per key computes at a time: within this process the
+        others wait for its result (cacheable or not), and across workers a
+        lock key in L2 makes them wait for the value to appear in L2.
+
+        Args:
+            key: Cache key
+            compute: Function producing the value on a miss
+            ttl: TTL in seconds for non-empty values
+            cacheable: Whether a computed value may be cached at all
+            is_empty: Whether a computed value is empty and gets the negative TTL
+            deadline: Request deadline (with a remaining() method) bounding the
+                wait for another caller's result
+            ttl_for: Optional shorter TTL for a computed value, e.g. a partial
+                result; None keeps the usual TTL
+
+        Returns:
+            The cached or computed value
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            # Another thread is computing this key; share its result
+            try:
+                return future.result(timeout=self._wait_timeout(deadline))
+            except FutureTimeoutError:
+                # Out of time waiting: compute without coalescing rather than wait on
+                return self._compute(key, compute, ttl, cacheable, is_empty, deadline, ttl_for)
+
+        try:
+            value = self._compute(key, compute, ttl, cacheable, is_empty, deadline, ttl_for)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+    def _wait_timeout(self, deadline: Optional[Any]) -> float:
+        """Seconds to wait for another caller: the lock timeout, capped by the deadline."""
+        if deadline is None:
+            return self.lock_timeout
+        return min(self.lock_timeout, deadline.remaining())
+
+    def _compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Any],
+        ttl: Optional[float],
+        cacheable: Callable[[Any], bool],
+        is_empty: Callable[[Any], bool],
+        deadline: Optional[Any],
+        ttl_for: Optional[Callable[[Any], Optional[float]]] = None
+    ) -> Any:
+        """Compute and cache a value, first waiting for another worker holding the L2 lock."""
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        lock_name = self._l2_key(key) + ":lock"
+        token = uuid.uuid4().hex
+        have_l2_lock = self._acquire_l2_lock(lock_name, token)
+        if not have_l2_lock:
+            # Another worker is computing; wait for its result before giving up
+            wait_until = time.monotonic() + self._wait_timeout(deadline)
+            while time.monotonic() < wait_until:
+                time.sleep(0.05)
+                value = self.get(key)
+                if value is not None:
+                    return value
+                # The lock is gone without a cached value (the result was not
+                # cacheable, or the lock expired): compute instead of waiting on
+                if not self._l2_lock_held(lock_name) and self._acquire_l2_lock(lock_name, token):
+                    have_l2_lock = True
+                    value = self.get(key)
+                    if value is not None:
+                        self._release_l2_lock(lock_name, token)
+                        return value
+                    break
+        try:
+            value = compute()
+            if cacheable(value):
+                value_ttl = self.negative_ttl if is_empty(value) else (self.ttl if ttl is None else ttl)
+                shorter_ttl = ttl_for(value) if ttl_for is not None else None
+                self.set(key, value, ttl=value_ttl if shorter_ttl is None else min(value_ttl, shorter_ttl))
+            return value
+        finally:
+            if have_l2_lock:
+                self._release_l2_lock(lock_name, token)
+
+    def _acquire_l2_lock(self, lock_name: str, token: str) -> bool:
+        if self.l2 is None:
+            return True
+        try:
+            return bool(self.l2.set(lock_name, token.encode("utf-8"), ex=max(1, int(self.lock_timeout)), nx=True))
+        except Exception as e:
+            print(f"Error acquiring shared cache lock: {e}")
+            return True
+
+    def _l2_lock_held(self, lock_name: str) -> bool:
+        try:
+            return self.l2.get(lock_name) is not None
+        except Exception as e:
+            print(f"Error checking shared cache lock: {e}")
+            return False
+
+    def _release_l2_lock(self, lock_name: str, token: str) -> None:
+        """Delete the lock only if it is still ours; once it expired another worker may hold it."""
+        if self.l2 is None:
+            return
+        try:
+            self.l2.eval(RELEASE_LOCK_SCRIPT, 1, lock_name, token)
+        except Exception as e:
+            print(f"Error releasing shared cache lock: {e}")
+
+    def stats(self) -> dict:
+        """Return hit/miss counters for reporting."""
+        stats = self.l1.stats()
+        stats.update({"l2_hits": self.l2_hits, "l2_errors": self.l2_errors})
+        return stats
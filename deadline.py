@@ -0,0 +1,55 @@
+import time
+from typing import Optional
+
+
+class Deadline:
+    """
+    Point in time by which a request must be answered. Each pipeline stage
+    asks for its share of the remaining budget and marks the request as
+    degraded when it had to cut work short.
+    """
+    def __init__(self, seconds: float):
+        """
+        Initialize a deadline
+
+        Args:
+            seconds: Time budget from now
+        """
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.degraded = False
+        # The pipeline failed and the answer is an error message
+        self.failed = False
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, fraction: float = 1.0, cap: Optional[float] = None, minimum: float = 0.5) -> float:
+        """
+        Time a stage may spend: a fraction of the remaining budget, optionally
+        capped, but at least a small minimum so calls are not started with zero timeout
+
+        Args:
+            fraction: Share of the remaining budget given to the stage
+            cap: Upper bound, e.g. the stage's own default timeout
+            minimum: Lower bound in seconds
+        """
+        seconds = self.remaining() * fraction
+        if cap is not None:
+            seconds = min(seconds, cap)
+        return max(minimum, seconds)
+
+    def degrade(self, reason: str) -> None:
+        """Record that a stage reduced its work to meet the deadline."""
+        if not self.degraded:
+            print(f"Degrading request to meet deadline: {reason} ({self.remaining():.1f}s left)")
+        self.degraded = True
+
+    def fail(self, reason: str) -> None:
+        """Record that the pipeline failed, so its answer must not be stored or reused."""
+        print(f"Request failed: {reason}")
+        self.failed = True
@@ -0,0 +1,150 @@
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+# Words too common to be useful in a full-text query
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for",
+    "from", "how", "in", "is", "it", "of", "on", "or", "the", "to", "was",
+    "what", "when", "where", "which", "who", "why", "will", "with"
+}
+
+
+def fts_query(query: str) -> str:
+    """Turn free text into an FTS5 query that matches any of its terms."""
+    terms = [t for t in re.findall(r"\w+", query.lower()) if t not in STOP_WORDS and len(t) > 1]
+    return " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+
+
+class LocalDocumentIndex:
+    """
+    Persistent full-text index of fetched web pages backed by SQLite FTS5 (BM25 ranking)
+    """
+    def __init__(self, path: str = "doc_index.sqlite3", ttl: float = 7 * 86400, evict_interval: float = 3600):
+        """
+        Initialize the index, creating the database if needed
+
+        Args:
+            path: Path of the SQLite database file
+            ttl: Seconds after which an indexed page is evicted
+            evict_interval: Minimum seconds between automatic eviction passes
+        """
+        self.path = path
+        self.ttl = ttl
+        self.evict_interval = evict_interval
+        self._last_evicted = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                url TEXT UNIQUE NOT NULL,
+                title TEXT,
+                content TEXT,
+                engine TEXT,
+                fetched_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS documents_fetched_at ON documents(fetched_at);
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                title, content, content='documents', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+                INSERT INTO documents_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+                INSERT INTO documents_fts(documents_fts, rowid, title, content)
+                VALUES ('delete', old.id, old.title, old.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+                INSERT INTO documents_fts(documents_fts, rowid, title, content)
+                VALUES ('delete', old.id, old.title, old.content);
+                INSERT INTO documents_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+            END;
+        """)
+        self._conn.commit()
+
+    def add_documents(self, documents: List[Document]) -> int:
+        """
+        Insert or refresh web page documents; documents without a URL are skipped
+
+        Args:
+            documents: Documents with source (URL), title and engine metadata
+
+        Returns:
+            Number of documents written
+        """
+        now = time.time()
+        rows = [
+            (doc.metadata["source"], doc.metadata.get("title", ""), doc.page_content,
+             doc.metadata.get("engine", "unknown"), doc.metadata.get("fetched_at", now))
+            for doc in documents
+            if str(doc.metadata.get("source", "")).startswith("http")
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            self._conn.executemany("""
+                INSERT INTO documents(url, title, content, engine, fetched_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    title=excluded.title, content=excluded.content,
+                    engine=excluded.engine, fetched_at=excluded.fetched_at
+            """, rows)
+            self._conn.commit()
+        if now - self._last_evicted > self.evict_interval:
+            self.evict_expired()
+        return len(rows)
+
+    def search(self, query: str, k: int = 10, max_age: Optional[float] = None) -> List[Dict]:
+        """
+        Find indexed pages matching a query, best BM25 match first
+
+        Args:
+            query: The search query
+            k: Maximum number of results to return
+            max_age: Only return pages fetched within this many seconds
+
+        Returns:
+            List of search result dictionaries in the same shape as engine results
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        min_fetched_at = time.time() - (self.ttl if max_age is None else max_age)
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT d.url, d.title, d.content, d.engine, d.fetched_at, bm25(documents_fts) AS rank
+                FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid
+                WHERE documents_fts MATCH ? AND d.fetched_at >= ?
+                ORDER BY rank LIMIT ?
+            """, (match, min_fetched_at, k)).fetchall()
+        return [
+            {
+                "title": title,
+                "url": url,
+                "content": content,
+                # bm25() is lower for better matches, flip it so higher is better
+                "score": -rank,
+                "source": "index",
+                "engine": engine,
+                "fetched_at": fetched_at,
+                "position": i + 1
+            }
+            for i, (url, title, content, engine, fetched_at, rank) in enumerate(rows)
+        ]
+
+    def evict_expired(self) -> int:
+        """Delete pages older than the TTL and return how many were removed."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM documents WHERE fetched_at < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+            self._last_evicted = time.time()
+            return cursor.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
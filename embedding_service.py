@@ -0,0 +1,207 @@
+import hashlib
+import math
+import queue
+import re
+import sqlite3
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from cache import TTLCache
+
+
+def content_hash(text: str) -> str:
+    """Stable hash identifying a text's content."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic local embeddings using the hashing trick over word unigrams
+    and bigrams. Needs no network access, for offline testing and development.
+    """
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        words = re.findall(r"\w+", text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket, sign = struct.unpack("<IB3x", digest)
+            vector[bucket % self.dim] += 1.0 if sign & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class PersistentEmbeddingCache:
+    """
+    SQLite-backed content-hash to vector cache, so identical texts are never
+    embedded twice, even across restarts
+    """
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    def get_many(self, hashes: List[str]) -> Dict[str, List[float]]:
+        if not hashes:
+            return {}
+        found = {}
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE hash IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = list(struct.unpack(f"<{len(blob) // 4}f", blob))
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        rows = [(h, struct.pack(f"<{len(v)}f", *v)) for h, v in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings(hash, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+
+class EmbeddingService(Embeddings):
+    """
+    Embeddings front-end that dedupes texts by content hash, serves repeats from
+    an in-memory and optional persistent cache, and micro-batches cache misses
+    from concurrent callers into a single backend call
+    """
+    def __init__(
+        self,
+        backend: Embeddings,
+        cache_path: Optional[str] = None,
+        batch_window: float = 0.01,
+        max_batch_size: int = 256,
+        memory_cache_size: int = 10000,
+        result_timeout: float = 60
+    ):
+        """
+        Initialize the service and start its batching thread
+
+        Args:
+            backend: Embeddings implementation that does the actual work
+            cache_path: Path of the persistent SQLite cache (None keeps vectors in memory only)
+            batch_window: Seconds to wait for more texts after the first one arrives
+            max_batch_size: Maximum texts sent to the backend in one call
+            memory_cache_size: Number of vectors kept in the in-memory LRU
+            result_timeout: Seconds a caller waits for its batch before giving up
+        """
+        self.backend = backend
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.result_timeout = result_timeout
+        self._memory = TTLCache(maxsize=memory_cache_size, ttl=float("inf"))
+        self._persistent = PersistentEmbeddingCache(cache_path) if cache_path else None
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self.backend_calls = 0
+        self.backend_texts = 0
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [content_hash(text) for text in texts]
+        vectors: Dict[str, List[float]] = {}
+        for h in dict.fromkeys(hashes):
+            cached = self._memory.get(h)
+            if cached is not None:
+                vectors[h] = cached
+
+        missing = [h for h in dict.fromkeys(hashes) if h not in vectors]
+        if missing and self._persistent:
+            for h, vector in self._persistent.get_many(missing).items():
+                self._memory.set(h, vector)
+                vectors[h] = vector
+            missing = [h for h in missing if h not in vectors]
+
+        futures = {}
+        text_by_hash = dict(zip(hashes, texts))
+        with self._inflight_lock:
+            for h in missing:
+                # Share the pending computation when another caller already asked
+                future = self._inflight.get(h)
+                if future is None:
+                    future = Future()
+                    self._inflight[h] = future
+                    self._queue.put((h, text_by_hash[h], future))
+                futures[h] = future
+        # Never block forever, even if the batcher stalls on a hung backend call
+        for h, future in futures.items():
+            vectors[h] = future.result(timeout=self.result_timeout)
+
+        return [vectors[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._process(batch)
+            except Exception as e:
+                # Fail this batch's callers but keep the thread serving later batches
+                print(f"Error embedding batch of {len(batch)} texts: {e}")
+                with self._inflight_lock:
+                    for h, _, future in batch:
+                        self._inflight.pop(h, None)
+                        if not future.done():
+                            future.set_exception(e)
+
+    def _process(self, batch: List[tuple]) -> None:
+        self.backend_calls += 1
+        self.backend_texts += len(batch)
+        results = self.backend.embed_documents([text for _, text, _ in batch])
+        if len(results) != len(batch):
+            raise ValueError(f"Embedding backend returned {len(results)} vectors for {len(batch)} texts")
+
+        computed = {h: list(vector) for (h, _, _), vector in zip(batch, results)}
+        for h, vector in computed.items():
+            self._memory.set(h, vector)
+        if self._persistent:
+            try:
+                self._persistent.put_many(computed)
+            except Exception as e:
+                print(f"Error writing embedding cache: {e}")
+        with self._inflight_lock:
+            for h, _, future in batch:
+                self._inflight.pop(h, None)
+                future.set_result(computed[h])
+
+    def stats(self) -> dict:
+        """Return cache and batching counters for reporting."""
+        return {
+            "memory_cache": self._memory.stats(),
+            "backend_calls": self.backend_calls,
+            "backend_texts": self.backend_texts
+        }
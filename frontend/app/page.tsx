@@ -1,6 +1,6 @@
 'use client';
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef, useCallback } from 'react';
 import { v4 as uuidv4 } from 'uuid';
 import Sidebar from '../components/Sidebar';
 import Conversation, { MessageType } from '../components/Conversation';
@@ -17,6 +17,12 @@ interface AnswerResponse {
   }[];
 }
 
+interface HistoryEntry extends AnswerResponse {
+  id: number;
+  question: string;
+  created_at: number;
+}
+
 export default function Home() {
   const [searchMode, setSearchMode] = useState('search');
   const [isLoading, setIsLoading] = useState(false);
@@ -24,6 +30,45 @@ export default function Home() {
   const [messages, setMessages] = useState<MessageType[]>([]);
   const [sidebarOpen, setSidebarOpen] = useState(false);
   const [isDarkMode, setIsDarkMode] = useState(false);
+  const sessionId = useRef('');
+  const prefetchController = useRef<AbortController | null>(null);
+
+  // Restore the current conversation from the server-side history
+  useEffect(() => {
+    let storedSessionId = localStorage.getItem('sessionId');
+    if (!storedSessionId) {
+      storedSessionId = uuidv4();
+      localStorage.setItem('sessionId', storedSessionId);
+    }
+    sessionId.current = storedSessionId;
+    
+    fetch(`${API_URL}/api/history/sessions/${storedSessionId}?limit=50`)
+      .then(response => (response.ok ? response.json() : { entries: [] }))
+      .then((data: { entries: HistoryEntry[] }) => {
+        // Entries come newest first
+        const restored = data.entries.slice().reverse().flatMap(entry => [
+          {
+            id: `${entry.id}-question`,
+            role: 'user' as const,
+            content: entry.question,
+            timestamp: new Date(entry.created_at * 1000)
+          },
+          {
+            id: `${entry.id}-answer`,
+            role: 'assistant' as const,
+            content: entry.main_answer,
+            timestamp: new Date(entry.created_at * 1000),
+            sources: convertToSources(entry.read_more)
+          }
+        ]);
+        if (restored.length) {
+          setMessages(prev => (prev.length ? prev : restored));
+        }
+      })
+      .catch(() => {
+        // Starting with an empty conversation is fine
+      });
+  }, []);
 
   // Initialize dark mode based on user preference
   useEffect(() => {
@@ -52,6 +97,8 @@ export default function Home() {
 
   // Start a new chat
   const handleStartNewChat = () => {
+    sessionId.current = uuidv4();
+    localStorage.setItem('sessionId', sessionId.current);
     setMessages([]);
     setSidebarOpen(false); // Close sidebar on mobile
   };
@@ -71,8 +118,26 @@ export default function Home() {
     }));
   };
 
+  // Prefetch search results for the text typed so far
+  const handlePrefetch = useCallback((question: string) => {
+    prefetchController.current?.abort();
+    const controller = new AbortController();
+    prefetchController.current = controller;
+    
+    fetch(`${API_URL}/api/prefetch`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ question: question, mode: searchMode }),
+      signal: controller.signal
+    }).catch(() => {
+      // Prefetching is best effort
+    });
+  }, [searchMode]);
+
   // Handle search
   const handleSearch = async (question: string) => {
+    prefetchController.current?.abort();
+    
     // Add user message
     const userMessage: MessageType = {
       id: uuidv4(),
@@ -100,7 +165,7 @@ export default function Home() {
       const response = await fetch(`${API_URL}/api/ask`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ question: question })
+        body: JSON.stringify({ question: question, mode: searchMode, session_id: sessionId.current })
       });
       
       if (!response.ok) {
@@ -177,6 +242,7 @@ export default function Home() {
           <Conversation
             messages={messages}
             onAsk={handleSearch}
+            onPrefetch={handlePrefetch}
             isLoading={isLoading}
             onFollowUpClick={handleSearch}
           />
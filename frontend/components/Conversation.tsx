@@ -19,6 +19,7 @@ export interface MessageType {
 export interface ConversationProps {
   messages: MessageType[];
   onAsk: (question: string) => void;
+  onPrefetch?: (question: string) => void;
   isLoading: boolean;
   onFollowUpClick: (question: string) => void;
 }
@@ -26,6 +27,7 @@ export interface ConversationProps {
 export default function Conversation({ 
   messages, 
   onAsk, 
+  onPrefetch,
   isLoading, 
   onFollowUpClick 
 }: ConversationProps) {
@@ -116,7 +118,7 @@ export default function Conversation({
       )}
       
       <div className="conversation-input">
-        <Search onSearch={onAsk} isLoading={isLoading} />
+        <Search onSearch={onAsk} onPrefetch={onPrefetch} isLoading={isLoading} />
       </div>
     </div>
   );
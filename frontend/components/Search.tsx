@@ -1,15 +1,26 @@
 'use client';
 
-import { useState } from 'react';
+import { useState, useEffect } from 'react';
+
+// Pause in typing before the current text is prefetched
+const PREFETCH_DEBOUNCE_MS = 400;
 
 interface SearchProps {
   onSearch: (question: string) => void;
+  onPrefetch?: (question: string) => void;
   isLoading: boolean;
 }
 
-export default function Search({ onSearch, isLoading }: SearchProps) {
+export default function Search({ onSearch, onPrefetch, isLoading }: SearchProps) {
   const [question, setQuestion] = useState('');
 
+  // Prefetch search results once the user pauses typing
+  useEffect(() => {
+    if (!onPrefetch || isLoading || !question.trim()) return;
+    const timer = setTimeout(() => onPrefetch(question), PREFETCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [question, isLoading, onPrefetch]);
+
   const handleSearch = () => {
     if (question.trim() && !isLoading) {
       onSearch(question);
@@ -0,0 +1,265 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import normalize_query
+from metrics import metrics
+
+# Start of the answer text returned when the pipeline fails
+ERROR_ANSWER_PREFIX = "An error occurred while processing your question: "
+
+
+class HistoryStore:
+    """
+    Persistent history of answered questions in SQLite (WAL mode). Entries
+    are queued and written by a background thread in batched transactions,
+    so recording never blocks a request. Entries are listed per user or
+    session with keyset pagination (newest first) and deleted once older
+    than the retention period.
+    """
+    def __init__(
+        self,
+        path: str = "history.sqlite3",
+        retention: float = 30 * 86400,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        max_queue: int = 10000,
+        compact_interval: float = 3600
+    ):
+        """
+        Initialize the store, creating the database if needed
+
+        Args:
+            path: Path of the SQLite database file
+            retention: Seconds entries are kept (0 keeps them forever)
+            batch_size: Maximum entries written per transaction
+            flush_interval: Maximum seconds an entry waits in the queue
+            max_queue: Entries queued before new ones are dropped
+            compact_interval: Minimum seconds between retention passes
+        """
+        self.path = path
+        self.retention = retention
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self._queue: "queue.Queue[Tuple]" = queue.Queue(maxsize=max_queue)
+        # Reads and the writer thread use separate connections; WAL lets them run concurrently
+        self._read_lock = threading.Lock()
+        self._read_conn = self._connect()
+        self._read_conn.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY,
+                user_id TEXT,
+                session_id TEXT,
+                question TEXT NOT NULL,
+                question_key TEXT NOT NULL,
+                search_engine TEXT,
+                mode TEXT,
+                main_answer TEXT NOT NULL,
+                follow_up_questions TEXT,
+                sources TEXT,
+                degraded INTEGER NOT NULL DEFAULT 0,
+                answered_at REAL NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS history_user ON history(user_id, id);
+            CREATE INDEX IF NOT EXISTS history_session ON history(session_id, id);
+            CREATE INDEX IF NOT EXISTS history_question ON history(question_key, search_engine, mode, answered_at);
+            CREATE INDEX IF NOT EXISTS history_created_at ON history(created_at);
+        """)
+        self._read_conn.commit()
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL keeps the database consistent with NORMAL; only the last commits can be lost on power failure
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(
+        self,
+        question: str,
+        answer: Dict[str, Any],
+        search_engine: str = "",
+        mode: str = "",
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        answered_at: Optional[float] = None
+    ) -> bool:
+        """
+        Queue an answered question for writing
+
+        Args:
+            question: The user's question
+            answer: Formatted answer with main_answer, follow_up_questions, read_more and degraded
+            search_engine: Search engine option used
+            mode: Search mode used
+            user_id: Identifies the user for listing
+            session_id: Identifies the conversation for listing
+            answered_at: When the answer was generated, for answers reused from
+                the history, so reuse does not extend their age
+
+        Returns:
+            False when the queue is full and the entry was dropped
+        """
+        now = time.time()
+        entry = (
+            user_id, session_id, question, normalize_query(question), search_engine, mode,
+            answer.get("main_answer", ""), json.dumps(answer.get("follow_up_questions", [])),
+            json.dumps(answer.get("read_more", [])), int(bool(answer.get("degraded"))),
+            answered_at or now, now
+        )
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            metrics.inc("history_dropped_total")
+            return False
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        last_compacted = 0.0
+        while True:
+            batch = [self._queue.get()]
+            # Collect more entries until the batch is full or the flush interval is over
+            flush_at = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = flush_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    conn.executemany("""
+                        INSERT INTO history(user_id, session_id, question, question_key, search_engine, mode,
+                                            main_answer, follow_up_questions, sources, degraded, answered_at,
+                                            created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, batch)
+                metrics.inc("history_written_total", len(batch))
+            except sqlite3.Error as e:
+                metrics.inc("history_dropped_total", len(batch))
+                print(f"Error writing answer history: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if self.retention > 0 and time.monotonic() - last_compacted > self.compact_interval:
+                last_compacted = time.monotonic()
+                self._compact(conn)
+
+    def _compact(self, conn: sqlite3.Connection, chunk: int = 1000) -> int:
+        """Delete entries past the retention period in small transactions."""
+        cutoff = time.time() - self.retention
+        deleted = 0
+        try:
+            while True:
+                with conn:
+                    cursor = conn.execute(
+                        "DELETE FROM history WHERE id IN (SELECT id FROM history WHERE created_at < ? LIMIT ?)",
+                        (cutoff, chunk)
+                    )
+                deleted += cursor.rowcount
+                if cursor.rowcount < chunk:
+                    break
+            if deleted:
+                conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+                print(f"Compacted answer history: deleted {deleted} entries older than the retention period")
+        except sqlite3.Error as e:
+            print(f"Error compacting answer history: {e}")
+        metrics.inc("history_compacted_total", deleted)
+        return deleted
+
+    def compact(self) -> int:
+        """Delete entries past the retention period now and return how many were removed."""
+        conn = self._connect()
+        try:
+            return self._compact(conn)
+        finally:
+            conn.close()
+
+    def flush(self) -> None:
+        """Wait until every queued entry has been written."""
+        self._queue.join()
+
+    def _entries(self, rows: List[Tuple]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": entry_id,
+                "session_id": session_id,
+                "question": question,
+                "search_engine": search_engine,
+                "mode": mode,
+                "main_answer": main_answer,
+                "follow_up_questions": json.loads(follow_up_questions or "[]"),
+                "read_more": json.loads(sources or "[]"),
+                "degraded": bool(degraded),
+                "created_at": created_at
+            }
+            for (entry_id, session_id, question, search_engine, mode, main_answer,
+                 follow_up_questions, sources, degraded, created_at) in rows
+        ]
+
+    def list_entries(
+        self,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        before: Optional[int] = None,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        List a user's or session's entries, newest first
+
+        Args:
+            user_id: Only entries of this user
+            session_id: Only entries of this session
+            before: Cursor from the previous page (entries with a lower ID)
+            limit: Page size
+
+        Returns:
+            The entries and the cursor of the next page (None on the last page)
+        """
+        column, value = ("session_id", session_id) if session_id is not None else ("user_id", user_id)
+        with self._read_lock:
+            rows = self._read_conn.execute(f"""
+                SELECT id, session_id, question, search_engine, mode, main_answer,
+                       follow_up_questions, sources, degraded, created_at
+                FROM history WHERE {column} = ? AND id < ? ORDER BY id DESC LIMIT ?
+            """, (value, before if before is not None else 2 ** 63 - 1, limit)).fetchall()
+        entries = self._entries(rows)
+        next_cursor = entries[-1]["id"] if len(entries) == limit else None
+        return entries, next_cursor
+
+    def find_answer(self, question: str, search_engine: str, mode: str, max_age: float) -> Optional[Dict[str, Any]]:
+        """
+        Return the newest answer to the same question (after normalization)
+        with the same engine and mode, if it was generated within max_age
+        seconds and was neither degraded nor an error message; answered_at
+        tells when it was generated
+        """
+        with self._read_lock:
+            row = self._read_conn.execute("""
+                SELECT main_answer, follow_up_questions, sources, answered_at FROM history
+                WHERE question_key = ? AND search_engine = ? AND mode = ? AND answered_at >= ? AND degraded = 0
+                      AND substr(main_answer, 1, ?) != ?
+                ORDER BY answered_at DESC LIMIT 1
+            """, (
+                normalize_query(question), search_engine, mode, time.time() - max_age,
+                len(ERROR_ANSWER_PREFIX), ERROR_ANSWER_PREFIX
+            )).fetchone()
+        if row is None:
+            return None
+        main_answer, follow_up_questions, sources, answered_at = row
+        return {
+            "main_answer": main_answer,
+            "follow_up_questions": json.loads(follow_up_questions or "[]"),
+            "read_more": json.loads(sources or "[]"),
+            "answered_at": answered_at
+        }
@@ -0,0 +1,181 @@
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from typing import Any, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+
+
+def dumps(value: Any) -> bytes:
+    """Serialize a value to JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def etag_for(body: bytes) -> str:
+    """
+    Weak ETag derived from a response body; weak because the same tag covers
+    the identity, gzip and brotli encodings of the body
+    """
+    return 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    def opaque(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+    return opaque(etag) in [opaque(tag) for tag in if_none_match.split(",")]
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the content encoding to use for a client
+
+    Args:
+        accept_encoding: The request's Accept-Encoding header
+
+    Returns:
+        "br", "gzip" or None when the client accepts neither
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+    wildcard = weights.get("*", 0.0)
+    supported = ["br", "gzip"] if brotli is not None else ["gzip"]
+    # Highest q-value wins; on ties the order above prefers brotli
+    best = max(supported, key=lambda name: weights.get(name, wildcard))
+    return best if weights.get(best, wildcard) > 0 else None
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a complete response body with the given content encoding."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class StreamCompressor:
+    """Incremental compressor that flushes after every chunk, for streamed responses"""
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with brotli or gzip, depending on
+    the client's Accept-Encoding. Complete bodies below the size threshold are
+    left alone; streamed bodies are compressed chunk by chunk.
+    """
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = next(
+            (value.decode("latin-1") for name, value in scope["headers"] if name == b"accept-encoding"), None
+        )
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough, compressor
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is not None:
+                chunk = compressor.compress(body)
+                if not more_body:
+                    chunk += compressor.finish()
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                return
+
+            # First body message: decide whether this response gets compressed
+            headers = [(name.lower(), value) for name, value in start_message.get("headers", [])]
+            header_names = {name for name, _ in headers}
+            content_type = next((value.decode("latin-1") for name, value in headers if name == b"content-type"), None)
+            if (b"content-encoding" in header_names or start_message["status"] in (204, 304)
+                    or not is_compressible(content_type)
+                    or (not more_body and len(body) < self.minimum_size)):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            headers = [(name, value) for name, value in headers if name != b"content-length"]
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+            headers.append((b"vary", b"Accept-Encoding"))
+            if more_body:
+                compressor = StreamCompressor(encoding)
+                body = compressor.compress(body)
+            else:
+                body = compress(body, encoding)
+                headers.append((b"content-length", str(len(body)).encode("latin-1")))
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,261 @@
+import hashlib
+import hmac
+import ipaddress
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from admission import AdmissionRejected
+from cache import TTLCache, deserialize, serialize
+from http_encoding import dumps
+from metrics import metrics
+
+# Job states; finished jobs are kept until their TTL runs out
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+def check_callback_url(url: str, allowed_hosts: Iterable[str] = ()) -> None:
+    """
+    Check that a callback URL may be called from the server. Hosts listed in
+    allowed_hosts are always allowed, and when the list is set no others are.
+    Otherwise the host must resolve only to public addresses, so callbacks
+    cannot reach loopback, private, link-local (cloud metadata) or other
+    internal addresses
+
+    Raises:
+        ValueError: When the URL is not allowed, with the reason
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("Callback URL must be an http or https URL with a host")
+    host = parts.hostname.lower()
+    allowed_hosts = {h.strip().lower() for h in allowed_hosts if h.strip()}
+    if host in allowed_hosts:
+        return
+    if allowed_hosts:
+        raise ValueError(f"Callback host {host} is not allowed")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or None, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"Callback host {host} does not resolve: {e}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"Callback host {host} resolves to a non-public address")
+
+
+class JobStore:
+    """
+    Job states kept for a TTL, in a shared Redis-compatible store when one is
+    configured so that any worker can answer a poll, otherwise in process
+    """
+    def __init__(self, ttl: float = 86400, client: Any = None, maxsize: int = 10000):
+        """
+        Initialize the store
+
+        Args:
+            ttl: Seconds a job is kept after its last update
+            client: Redis-compatible client, or None to keep jobs in this process
+            maxsize: Maximum number of jobs kept in process
+        """
+        self.ttl = ttl
+        self.client = client
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def save(self, job: Dict[str, Any]) -> None:
+        if self.client is None:
+            self._local.set(job["id"], dict(job))
+            return
+        try:
+            self.client.set(f"job:{job['id']}", serialize(job), ex=max(1, int(self.ttl)))
+        except Exception as e:
+            print(f"Error saving job {job['id']}: {e}")
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if self.client is None:
+            job = self._local.get(job_id)
+            return dict(job) if job is not None else None
+        try:
+            data = self.client.get(f"job:{job_id}")
+        except Exception as e:
+            print(f"Error loading job {job_id}: {e}")
+            return None
+        return deserialize(data) if data is not None else None
+
+
+class JobManager:
+    """
+    Runs long requests (e.g. deep searches with the large model) in a bounded
+    worker pool so HTTP workers return at once. Clients poll the job for its
+    status and partial results, or give a callback URL that receives the
+    finished job as a JSON POST.
+    """
+    def __init__(
+        self,
+        run: Callable[[Dict[str, Any], Callable[..., None], Optional[str]], Dict[str, Any]],
+        store: JobStore,
+        max_workers: int = 4,
+        max_pending: int = 100,
+        callback_timeout: float = 10,
+        callback_retries: int = 3,
+        callback_secret: str = "",
+        callback_allowed_hosts: Iterable[str] = (),
+        callback_backoff: float = 1.0
+    ):
+        """
+        Initialize the manager
+
+        Args:
+            run: Function (params, progress, client) -> result; progress(**partial)
+                merges partial results into the job while it runs, and client is
+                the key of the client that submitted the job
+            store: Where job states are kept
+            max_workers: Jobs running at the same time
+            max_pending: Jobs queued or running before new ones are rejected
+            callback_timeout: Timeout of one callback POST in seconds
+            callback_retries: Callback attempts before giving up
+            callback_secret: Signs callbacks with an HMAC-SHA256 X-Signature header when set
+            callback_allowed_hosts: Only these callback hosts are allowed when
+                set; otherwise any host resolving to public addresses is
+            callback_backoff: Seconds before the first callback retry, doubled for each further retry
+        """
+        self.run = run
+        self.store = store
+        self.max_pending = max_pending
+        self.callback_timeout = callback_timeout
+        self.callback_retries = callback_retries
+        self.callback_secret = callback_secret
+        self.callback_allowed_hosts = list(callback_allowed_hosts)
+        self.callback_backoff = callback_backoff
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+    def submit(
+        self,
+        params: Dict[str, Any],
+        callback_url: Optional[str] = None,
+        client: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Queue a job
+
+        Args:
+            params: JSON-serializable parameters passed to run
+            callback_url: Optional http(s) URL notified when the job finishes
+            client: Key of the submitting client, passed to run in memory; the
+                job only stores its hash, as the store may be shared (Redis)
+
+        Returns:
+            The queued job
+
+        Raises:
+            AdmissionRejected: When max_pending jobs are already queued or running
+            ValueError: When the callback URL is not allowed
+        """
+        if callback_url:
+            check_callback_url(callback_url, self.callback_allowed_hosts)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                metrics.inc("jobs_rejected_total")
+                raise AdmissionRejected("jobs", 5.0)
+            self._pending += 1
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": JOB_QUEUED,
+            "params": params,
+            "callback_url": callback_url,
+            "client": hashlib.sha256(client.encode("utf-8")).hexdigest()[:32] if client else None,
+            "partial": {},
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now
+        }
+        self.store.save(job)
+        metrics.inc("jobs_submitted_total")
+        queued = dict(job)
+        self._executor.submit(self._execute, job, client)
+        return queued
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.load(job_id)
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def _update(self, job: Dict[str, Any], **fields) -> None:
+        job.update(fields, updated_at=time.time())
+        self.store.save(job)
+
+    def _execute(self, job: Dict[str, Any], client: Optional[str] = None) -> None:
+        start = time.monotonic()
+        self._update(job, status=JOB_RUNNING, started_at=time.time())
+
+        def progress(**partial) -> None:
+            self._update(job, partial={**job["partial"], **partial})
+
+        try:
+            result = self.run(job["params"], progress, client)
+            self._update(job, status=JOB_SUCCEEDED, result=result, finished_at=time.time())
+        except Exception as e:
+            print(f"Error running job {job['id']}: {e}")
+            self._update(job, status=JOB_FAILED, error=str(e), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._pending -= 1
+        metrics.inc("jobs_finished_total", status=job["status"])
+        metrics.observe("job_duration_seconds", time.monotonic() - start)
+        if job.get("callback_url"):
+            self._notify(job)
+
+    def _notify(self, job: Dict[str, Any]) -> None:
+        """POST the finished job to its callback URL, retrying with backoff."""
+        # Checked again when sending, in case the host now resolves elsewhere
+        try:
+            check_callback_url(job["callback_url"], self.callback_allowed_hosts)
+        except ValueError as e:
+            print(f"Not calling job callback {job['callback_url']}: {e}")
+            metrics.inc("job_callbacks_total", outcome="blocked")
+            return
+        body = dumps(public_job(job))
+        headers = {"Content-Type": "application/json"}
+        if self.callback_secret:
+            signature = hmac.new(self.callback_secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+            headers["X-Signature"] = f"sha256={signature}"
+        for attempt in range(self.callback_retries):
+            try:
+                # Redirects are not followed, they could point at internal hosts
+                response = requests.post(
+                    job["callback_url"], data=body, headers=headers, timeout=self.callback_timeout,
+                    allow_redirects=False
+                )
+                if response.status_code < 500:
+                    metrics.inc("job_callbacks_total", outcome="ok" if response.ok else "rejected")
+                    return
+                print(f"Job callback to {job['callback_url']} returned {response.status_code}")
+            except requests.RequestException as e:
+                print(f"Error calling job callback {job['callback_url']}: {e}")
+            if attempt + 1 < self.callback_retries:
+                time.sleep(self.callback_backoff * 2 ** attempt)
+        metrics.inc("job_callbacks_total", outcome="failed")
+
+
+# Job fields never shown to clients or sent to callbacks
+PRIVATE_JOB_FIELDS = ("callback_url", "client")
+
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields of a job shown to clients (the callback URL and client key are left out)."""
+    return {key: value for key, value in job.items() if key not in PRIVATE_JOB_FIELDS}
@@ -1,5 +1,5 @@
 import os
-from typing import List, Dict, Any, Optional, Union, Literal
+from typing import List, Dict, Any, Callable, Optional, Union, Literal, Iterator, Tuple
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
@@ -7,10 +7,34 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.documents import Document
 from langchain_openai import OpenAIEmbeddings
+import asyncio
+import atexit
 import json
+import sys
+import time
+import argparse
 import datetime
+import threading
 import requests
+from collections import Counter
+from contextlib import closing
+from concurrent.futures import Future, ThreadPoolExecutor
+from difflib import SequenceMatcher
 from tavily import TavilyClient
+from cache import TTLCache, TieredCache, make_key, make_l2_client, normalize_query
+from metrics import metrics
+from doc_index import LocalDocumentIndex
+from vector_store import EmbeddingStore
+from embedding_service import EmbeddingService, HashingEmbeddings
+from tavily_async import AsyncTavilyClient, BackgroundLoop
+from deadline import Deadline
+from recorder import TrafficRecorder
+from search_engines import EngineRegistry, FunctionEngine
+from search_profiles import SearchProfile, load_profiles
+from query_decomposition import decompose_question, llm_decompose, merge_results
+from token_accounting import RequestUsage, TokenCounter, UsageLedger, load_prices, price_for
+from openai_http import DEFAULT_OPENAI_BASE_URL, ConnectionWarmer, make_http_client
+from history_store import ERROR_ANSWER_PREFIX
 
 # Load environment variables
 load_dotenv()
@@ -19,16 +43,87 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "your-openai-api-key")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY", "") # You'll need to set this in your .env file
 
+# Shared HTTP client for the OpenAI API: pool size, HTTP/2 (needs the h2
+# package), keep-alive and timeouts. OPENAI_BASE_URL points the models at an
+# OpenAI-compatible stand-in, e.g. for testing
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "") or DEFAULT_OPENAI_BASE_URL
+openai_http_client = make_http_client(
+    max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "50")),
+    keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "120")),
+    http2=os.getenv("OPENAI_HTTP2", "1") == "1",
+    connect_timeout=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5")),
+    read_timeout=float(os.getenv("OPENAI_READ_TIMEOUT", "120"))
+)
+
+# Connections opened at startup, and kept open by a cheap request after
+# OPENAI_KEEP_WARM_INTERVAL idle seconds (0 disables keep-warm)
+OPENAI_WARM_CONNECTIONS = int(os.getenv("OPENAI_WARM_CONNECTIONS", "2"))
+model_warmer = ConnectionWarmer(
+    openai_http_client,
+    base_url=OPENAI_BASE_URL,
+    api_key=OPENAI_API_KEY,
+    interval=float(os.getenv("OPENAI_KEEP_WARM_INTERVAL", "60"))
+)
+
 # Initialize the model
 model = ChatOpenAI(
     model_name=os.getenv("MODEL_NAME", "gpt-4o"),
     temperature=float(os.getenv("TEMPERATURE", "0")),
-    openai_api_key=OPENAI_API_KEY
+    openai_api_key=OPENAI_API_KEY,
+    base_url=OPENAI_BASE_URL,
+    http_client=openai_http_client,
+    timeout=openai_http_client.timeout
 )
 
+# Model tiers used by the router; the large tier is always the main model.
+# Routing is enabled by configuring a small model, e.g. SMALL_MODEL_NAME=gpt-4o-mini
+SMALL_MODEL_NAME = os.getenv("SMALL_MODEL_NAME", "")
+models = {"large": model}
+if SMALL_MODEL_NAME:
+    models["small"] = ChatOpenAI(
+        model_name=SMALL_MODEL_NAME,
+        temperature=float(os.getenv("TEMPERATURE", "0")),
+        openai_api_key=OPENAI_API_KEY,
+        base_url=OPENAI_BASE_URL,
+        http_client=openai_http_client,
+        timeout=openai_http_client.timeout
+    )
+
+def warm_model_connections() -> None:
+    """Open model API connections before serving traffic and keep them warm while idle."""
+    if recorder.replaying or OPENAI_WARM_CONNECTIONS <= 0:
+        model_warmer.ready = True
+        return
+    model_warmer.warm(OPENAI_WARM_CONNECTIONS)
+    model_warmer.start()
+
+# Router thresholds above which a question is sent to the large model
+ROUTER_MAX_SIMPLE_WORDS = int(os.getenv("ROUTER_MAX_SIMPLE_WORDS", "20"))
+ROUTER_MAX_SMALL_CONTEXT_CHARS = int(os.getenv("ROUTER_MAX_SMALL_CONTEXT_CHARS", "24000"))
+
 # Initialize Tavily client
 tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
 
+# Optional async Tavily client with a shared keep-alive pool and request hedging
+TAVILY_ASYNC = os.getenv("TAVILY_ASYNC", "0") == "1"
+TAVILY_BASE_URL = os.getenv("TAVILY_BASE_URL", "https://api.tavily.com")
+TAVILY_TIMEOUT = float(os.getenv("TAVILY_TIMEOUT", "30"))
+tavily_async_client = None
+tavily_loop = None
+if TAVILY_ASYNC:
+    tavily_async_client = AsyncTavilyClient(
+        api_key=TAVILY_API_KEY,
+        base_url=TAVILY_BASE_URL,
+        max_connections=int(os.getenv("TAVILY_MAX_CONNECTIONS", "20")),
+        timeout=TAVILY_TIMEOUT,
+        hedge=os.getenv("TAVILY_HEDGE", "1") == "1",
+        # Empty uses the observed p95 latency as the hedge delay
+        hedge_delay=float(os.getenv("TAVILY_HEDGE_DELAY")) if os.getenv("TAVILY_HEDGE_DELAY") else None,
+        hedge_quantile=float(os.getenv("TAVILY_HEDGE_QUANTILE", "0.95")),
+        hedges_per_minute=int(os.getenv("TAVILY_HEDGES_PER_MINUTE", "30"))
+    )
+    tavily_loop = BackgroundLoop(name="tavily")
+
 # SearxNG Client class for search functionality
 class SearxNGClient:
     """
@@ -53,7 +148,8 @@ class SearxNGClient:
                category: str = "general", 
                time_range: Optional[str] = None,
                language: str = "en",
-               max_results: int = 10) -> List[Dict[str, str]]:
+               max_results: int = 10,
+               timeout: float = 10) -> List[Dict[str, str]]:
         """
         Perform a search using SearxNG API
         
@@ -63,6 +159,7 @@ class SearxNGClient:
             time_range: Time range for search results
             language: Language code
             max_results: Maximum number of results to return
+            timeout: Request timeout in seconds
             
         Returns:
             List of search result dictionaries
@@ -86,7 +183,7 @@ class SearxNGClient:
                 search_url,
                 params=params,
                 headers=self.headers,
-                timeout=10
+                timeout=timeout
             )
             
             if response.status_code != 200:
@@ -131,14 +228,164 @@ if SEARXNG_URL:
 SEARCH_ENGINES = {
     "tavily": "Tavily Search API",
     "searxng": "SearxNG Search Engine",
-    "both": "Both Search Engines (Combined Results)"
+    "both": "Both Search Engines (Combined Results)",
+    "auto": "Fastest Available Engine (measured latency)"
 }
 
+# Search engine plugins. Tavily and SearxNG are registered below; more engines
+# are loaded from SEARCH_ENGINE_PLUGINS ("module:attribute" entries), and any
+# comma-separated subset of engine names is also accepted as a search engine
+engine_registry = EngineRegistry(max_workers=int(os.getenv("SEARCH_MAX_WORKERS", "16")), loop=tavily_loop)
+for plugin_engine in engine_registry.load_plugins(os.getenv("SEARCH_ENGINE_PLUGINS", "")):
+    SEARCH_ENGINES[plugin_engine.name] = plugin_engine.description
+# Number of engines the "auto" option queries
+SEARCH_AUTO_ENGINES = int(os.getenv("SEARCH_AUTO_ENGINES", "1"))
+
+# Search mode profiles (search, focus, scholar, youtube), overridable and
+# extendable from the JSON file at SEARCH_PROFILES_PATH
+SEARCH_PROFILES_PATH = os.getenv("SEARCH_PROFILES_PATH", "")
+search_profiles = load_profiles(SEARCH_PROFILES_PATH)
+DEFAULT_MODE = "search"
+for search_profile in search_profiles.values():
+    metrics.set_gauge("search_profile_max_results", search_profile.max_results, mode=search_profile.name)
+    metrics.set_gauge("search_profile_context_tokens", search_profile.context_tokens, mode=search_profile.name)
+
+def profile_for(mode: Optional[str]) -> SearchProfile:
+    """Return the profile of a search mode, falling back to the default mode."""
+    return search_profiles.get(mode or DEFAULT_MODE) or search_profiles[DEFAULT_MODE]
+
+# Local index of previously fetched pages (disabled when DOC_INDEX_PATH is empty)
+DOC_INDEX_PATH = os.getenv("DOC_INDEX_PATH", "")
+DOC_INDEX_TTL = float(os.getenv("DOC_INDEX_TTL", str(7 * 86400)))
+# Index hits are only used when they are this fresh and enough of them score well
+DOC_INDEX_FRESH_SECONDS = float(os.getenv("DOC_INDEX_FRESH_SECONDS", "86400"))
+DOC_INDEX_MIN_SCORE = float(os.getenv("DOC_INDEX_MIN_SCORE", "1.0"))
+DOC_INDEX_MIN_HITS = int(os.getenv("DOC_INDEX_MIN_HITS", "3"))
+local_index = None
+if DOC_INDEX_PATH:
+    local_index = LocalDocumentIndex(path=DOC_INDEX_PATH, ttl=DOC_INDEX_TTL)
+    SEARCH_ENGINES["index"] = "Local Index First (web search fallback)"
+
 # Default search engine to use
 DEFAULT_SEARCH_ENGINE = os.getenv("DEFAULT_SEARCH_ENGINE", "tavily")
 if DEFAULT_SEARCH_ENGINE not in SEARCH_ENGINES:
     DEFAULT_SEARCH_ENGINE = "tavily"
 
+# Web engine used by the index-first mode when the index cannot answer
+DOC_INDEX_FALLBACK_ENGINE = os.getenv("DOC_INDEX_FALLBACK_ENGINE", "tavily")
+if DOC_INDEX_FALLBACK_ENGINE not in SEARCH_ENGINES or DOC_INDEX_FALLBACK_ENGINE == "index":
+    DOC_INDEX_FALLBACK_ENGINE = "tavily"
+
+# Cache configuration (TTLs in seconds, 0 disables a cache)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "3600"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "1800"))
+# Time-sensitive queries go stale quickly, so they are cached for a shorter time
+TIME_SENSITIVE_CACHE_TTL = float(os.getenv("TIME_SENSITIVE_CACHE_TTL", "300"))
+
+# Empty search results are cached for a shorter time
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "60"))
+CACHE_LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", "30"))
+# Shared cache tier for all workers, e.g. redis://localhost:6379/0
+# ("memory://" for an in-process stand-in, empty for local caches only)
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "")
+cache_l2 = make_l2_client(CACHE_REDIS_URL) if CACHE_REDIS_URL else None
+
+# Caches for search results and final answers
+search_cache = TieredCache(
+    "search",
+    TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=SEARCH_CACHE_TTL),
+    cache_l2,
+    negative_ttl=NEGATIVE_CACHE_TTL,
+    lock_timeout=CACHE_LOCK_TIMEOUT
+)
+answer_cache = TieredCache(
+    "answer",
+    TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=ANSWER_CACHE_TTL),
+    cache_l2,
+    negative_ttl=NEGATIVE_CACHE_TTL,
+    lock_timeout=CACHE_LOCK_TIMEOUT
+)
+
+# Embeddings are computed through a batching, content-hash caching service.
+# EMBEDDING_BACKEND=local uses offline hashing embeddings for testing
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "1536"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "10"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "256"))
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "60"))
+# Reorder search results by embedding similarity to the question
+RERANK_WITH_EMBEDDINGS = os.getenv("RERANK_WITH_EMBEDDINGS", "0") == "1"
+
+# Semantic question cache backed by the memory-mapped embedding store
+# (disabled when EMBEDDING_STORE_DIR is empty)
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "")
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "float32")
+EMBEDDING_SEGMENT_SIZE = int(os.getenv("EMBEDDING_SEGMENT_SIZE", "256"))
+# Seconds before new vectors are flushed for other workers to see, if fewer than a segment
+EMBEDDING_FLUSH_INTERVAL = float(os.getenv("EMBEDDING_FLUSH_INTERVAL", "5"))
+EMBEDDING_COMPACT_SEGMENTS = int(os.getenv("EMBEDDING_COMPACT_SEGMENTS", "32"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+embeddings = None
+if EMBEDDING_STORE_DIR or RERANK_WITH_EMBEDDINGS:
+    if EMBEDDING_BACKEND == "local":
+        embedding_backend = HashingEmbeddings(dim=EMBEDDING_DIM)
+    else:
+        embedding_backend = OpenAIEmbeddings(
+            model=EMBEDDING_MODEL,
+            openai_api_key=OPENAI_API_KEY,
+            base_url=OPENAI_BASE_URL,
+            http_client=openai_http_client
+        )
+    embeddings = EmbeddingService(
+        embedding_backend,
+        cache_path=EMBEDDING_CACHE_PATH or None,
+        batch_window=EMBEDDING_BATCH_WINDOW_MS / 1000,
+        max_batch_size=EMBEDDING_MAX_BATCH,
+        result_timeout=EMBEDDING_TIMEOUT
+    )
+
+question_store = None
+if EMBEDDING_STORE_DIR:
+    question_store = EmbeddingStore(
+        os.path.join(EMBEDDING_STORE_DIR, "questions"),
+        dim=EMBEDDING_DIM,
+        dtype=EMBEDDING_DTYPE,
+        segment_size=EMBEDDING_SEGMENT_SIZE,
+        flush_interval=EMBEDDING_FLUSH_INTERVAL
+    )
+    # Buffered vectors would otherwise be lost when the worker exits
+    atexit.register(question_store.close)
+
+# Query log used to prewarm the caches (disabled when empty)
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "")
+_query_log_lock = threading.Lock()
+
+# End-to-end request deadline (seconds) used when the caller does not set one
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+# Below this much remaining time the pipeline degrades: fewer results,
+# shorter context and a smaller completion
+DEADLINE_DEGRADE_SECONDS = float(os.getenv("DEADLINE_DEGRADE_SECONDS", "15"))
+# Share of the remaining budget the search stage may use
+SEARCH_BUDGET_FRACTION = float(os.getenv("SEARCH_BUDGET_FRACTION", "0.5"))
+DEGRADED_MAX_RESULTS = int(os.getenv("DEGRADED_MAX_RESULTS", "5"))
+DEGRADED_CONTENT_CHARS = int(os.getenv("DEGRADED_CONTENT_CHARS", "800"))
+DEGRADED_MAX_TOKENS = int(os.getenv("DEGRADED_MAX_TOKENS", "600"))
+
+# Record search responses and model outputs to a corpus ("record"), or serve
+# them from it without the network ("replay") at REPLAY_SPEED times the
+# recorded latency (0 replays instantly)
+RECORD_MODE = os.getenv("RECORD_MODE", "off")
+RECORD_PATH = os.getenv("RECORD_PATH", "traffic_corpus.jsonl.zst")
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", "1.0"))
+recorder = TrafficRecorder(RECORD_MODE, RECORD_PATH, REPLAY_SPEED)
+# Remote embeddings are recorded and replayed like the other network calls
+if embeddings is not None and EMBEDDING_BACKEND != "local":
+    embeddings = recorder.wrap_embeddings(embeddings, {"model": EMBEDDING_MODEL})
+
 # Function to detect if a query is time-sensitive
 def is_time_sensitive(query: str) -> bool:
     """Determine if a query is about current events or time-sensitive information."""
@@ -155,97 +402,459 @@ def is_time_sensitive(query: str) -> bool:
     # Check for time-sensitive keywords
     return any(keyword in query_lower for keyword in time_keywords)
 
+def cache_ttl_for(query: str, default_ttl: float) -> float:
+    """Return the cache TTL to use for a query, shortened for time-sensitive queries."""
+    if is_time_sensitive(query):
+        return min(default_ttl, TIME_SENSITIVE_CACHE_TTL)
+    return default_ttl
+
+# Prompt layout: "default" keeps the original template, "cache_friendly" puts the
+# static instructions first so providers with automatic prefix caching can reuse them
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "default")
+# Granularity (seconds) the prompt time is rounded down to in the cache-friendly layout
+PROMPT_TIME_GRANULARITY = int(os.getenv("PROMPT_TIME_GRANULARITY", "3600"))
+
+# Token accounting: prompts are counted locally (with tiktoken when installed)
+# before the model call and priced per million tokens, e.g.
+# MODEL_PRICES='{"gpt-4o": [2.5, 10]}'. The search context is trimmed to
+# MAX_CONTEXT_TOKENS (0 disables the cap) instead of sending an oversized prompt
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", "12000"))
+MODEL_PRICES = load_prices(os.getenv("MODEL_PRICES", ""))
+token_counter = TokenCounter(os.getenv("MODEL_NAME", "gpt-4o"))
+usage_ledger = UsageLedger()
+
+def prompt_now() -> datetime.datetime:
+    """Return the time shown to the model, rounded down in the cache-friendly layout."""
+    now = datetime.datetime.now()
+    if PROMPT_LAYOUT == "cache_friendly" and PROMPT_TIME_GRANULARITY > 1:
+        seconds = int(now.timestamp()) // PROMPT_TIME_GRANULARITY * PROMPT_TIME_GRANULARITY
+        now = datetime.datetime.fromtimestamp(seconds)
+    return now
+
+def log_query(question: str, search_engine: str = DEFAULT_SEARCH_ENGINE, mode: str = DEFAULT_MODE) -> None:
+    """Append a question to the query log so it can be replayed by the prewarmer."""
+    if not QUERY_LOG_PATH:
+        return
+    entry = {
+        "ts": time.time(),
+        "question": question,
+        "search_engine": search_engine,
+        "mode": mode
+    }
+    try:
+        with _query_log_lock:
+            with open(QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        print(f"Error writing query log: {e}")
+
+def tavily_request(
+    query: str,
+    search_depth: str,
+    max_results: int,
+    categories: Optional[str] = None,
+    include_domains: Optional[List[str]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Build the Tavily query (dated for time-sensitive questions) and its search parameters."""
+    # For time-sensitive queries, we want to ensure fresh results
+    include_answer = False
+    tavily_query = query
+    if is_time_sensitive(query):
+        tavily_query = f"{query} (latest information as of {datetime.datetime.now().strftime('%Y-%m-%d')})"
+        include_answer = True
+    
+    search_params = {
+        "search_depth": search_depth,
+        "include_answer": include_answer,
+        "include_raw_content": True,
+        "max_results": max_results
+    }
+    if categories and "news" in categories.split(","):
+        search_params["topic"] = "news"
+    if include_domains:
+        search_params["include_domains"] = include_domains
+    return tavily_query, search_params
+
+def tavily_results(search_response: Dict[str, Any]) -> List[Dict]:
+    """Tavily results tagged with their source engine."""
+    results = search_response.get('results', [])
+    for result in results:
+        result["source"] = "tavily"
+    return results
+
+def tavily_error(e: Exception) -> List[Dict]:
+    print(f"Error in Tavily search: {e}")
+    return [{
+        "title": "Tavily Search API Error",
+        "url": "",
+        "content": f"Error performing Tavily search: {str(e)}",
+        "source": "tavily_error"
+    }]
+
+# Function to search with Tavily
+def search_tavily(
+    query: str,
+    search_depth: str = "basic",
+    max_results: int = 10,
+    timeout: Optional[float] = None,
+    categories: Optional[str] = None,
+    include_domains: Optional[List[str]] = None
+) -> List[Dict]:
+    """
+    Perform a search using the Tavily API
+    
+    Args:
+        query: The search query
+        search_depth: "basic" or "advanced"
+        max_results: Maximum number of results to return
+        timeout: Request timeout in seconds (defaults to TAVILY_TIMEOUT)
+        categories: Search mode categories; "news" selects Tavily's news topic
+        include_domains: Restrict results to these domains
+        
+    Returns:
+        List of search result dictionaries tagged with their source engine
+    """
+    if not TAVILY_API_KEY and not recorder.replaying:
+        print("Warning: Tavily API key not found. Skipping Tavily search.")
+        return []
+    try:
+        tavily_query, search_params = tavily_request(query, search_depth, max_results, categories, include_domains)
+        timeout = TAVILY_TIMEOUT if timeout is None else min(timeout, TAVILY_TIMEOUT)
+        
+        def fetch():
+            if tavily_async_client:
+                return tavily_loop.run(
+                    tavily_async_client.search(tavily_query, **search_params),
+                    timeout=timeout
+                )
+            return tavily_client.search(query=tavily_query, timeout=timeout, **search_params)
+        
+        # Keyed on the original query, the dated one changes every day
+        return tavily_results(recorder.call("tavily", {"query": query, **search_params}, fetch))
+    except Exception as e:
+        return tavily_error(e)
+
+async def asearch_tavily(
+    query: str,
+    search_depth: str = "basic",
+    max_results: int = 10,
+    timeout: Optional[float] = None,
+    categories: Optional[str] = None,
+    include_domains: Optional[List[str]] = None
+) -> List[Dict]:
+    """
+    Perform a Tavily search with the async client (TAVILY_ASYNC=1), hedging
+    slow requests; awaited by the engine registry on the client's event loop.
+    Takes the same arguments as search_tavily.
+    """
+    if recorder.mode != "off":
+        # Recording and replay go through the recorder in the synchronous path
+        return await asyncio.to_thread(search_tavily, query, search_depth, max_results, timeout, categories, include_domains)
+    if not TAVILY_API_KEY:
+        print("Warning: Tavily API key not found. Skipping Tavily search.")
+        return []
+    try:
+        tavily_query, search_params = tavily_request(query, search_depth, max_results, categories, include_domains)
+        timeout = TAVILY_TIMEOUT if timeout is None else min(timeout, TAVILY_TIMEOUT)
+        return tavily_results(await asyncio.wait_for(tavily_async_client.search(tavily_query, **search_params), timeout))
+    except Exception as e:
+        return tavily_error(e)
+
+# Function to search with SearxNG
+def search_searxng(
+    query: str,
+    search_depth: str = "basic",
+    max_results: int = 10,
+    timeout: Optional[float] = None,
+    categories: Optional[str] = None,
+    include_domains: Optional[List[str]] = None
+) -> List[Dict]:
+    """
+    Perform a search using the configured SearxNG instance
+    
+    Args:
+        query: The search query
+        search_depth: "basic" or "advanced"
+        max_results: Maximum number of results to return
+        timeout: Request timeout in seconds (defaults to 10)
+        categories: SearxNG categories set by the search mode (overrides the depth mapping)
+        include_domains: Unused; SearxNG categories select the sources instead
+        
+    Returns:
+        List of search result dictionaries tagged with their source engine
+    """
+    if not searxng_client and not recorder.replaying:
+        return []
+    try:
+        # Map search depth to a suitable category for SearxNG
+        category = "general"
+        if categories:
+            category = categories
+        elif search_depth == "advanced":
+            category = "general,news"  # Multiple categories for deeper search
+            
+        # Set time range if it's a time-sensitive query
+        time_range = None
+        if is_time_sensitive(query):
+            time_range = "day"  # Use 'day' for recent results
+            
+        # Get results from SearxNG
+        return recorder.call(
+            "searxng",
+            {"query": query, "category": category, "time_range": time_range, "max_results": max_results},
+            lambda: searxng_client.search(
+                query=query,
+                category=category,
+                time_range=time_range,
+                max_results=max_results,
+                timeout=10 if timeout is None else min(timeout, 10)
+            )
+        )
+    except Exception as e:
+        print(f"Error in SearxNG search: {e}")
+        return [{
+            "title": "SearxNG Search Error",
+            "url": "",
+            "content": f"Error performing SearxNG search: {str(e)}",
+            "source": "searxng_error"
+        }]
+
+engine_registry.register(FunctionEngine(
+    "tavily", SEARCH_ENGINES["tavily"], search_tavily,
+    # With TAVILY_ASYNC=1 the registry awaits the hedging async client on its loop
+    async_search=asearch_tavily if tavily_async_client else None,
+    capabilities=("web", "news", "raw_content"),
+    cost_per_query=float(os.getenv("TAVILY_COST_PER_QUERY", "0.008")),
+    latency_hint=1.5,
+    available=lambda: bool(TAVILY_API_KEY) or recorder.replaying
+))
+engine_registry.register(FunctionEngine(
+    "searxng", SEARCH_ENGINES["searxng"], search_searxng,
+    capabilities=("web", "news"),
+    latency_hint=1.0,
+    available=lambda: searxng_client is not None or recorder.replaying
+))
+
+# Search engine options that stand for several engines, in result order
+ENGINE_GROUPS = {
+    "both": ["tavily", "searxng"]
+}
+
+def engines_for(search_engine: str) -> List[str]:
+    """
+    Resolve a search engine option to the engines to query
+    
+    Args:
+        search_engine: An option from SEARCH_ENGINES or a comma-separated list of engine names
+        
+    Returns:
+        Engine names in result order
+    """
+    if search_engine == "auto":
+        return engine_registry.fastest(SEARCH_AUTO_ENGINES, capability="web") or ["tavily"]
+    if search_engine in ENGINE_GROUPS:
+        return ENGINE_GROUPS[search_engine]
+    names = [name.strip() for name in search_engine.split(",") if name.strip() in engine_registry]
+    if names:
+        return list(dict.fromkeys(names))
+    return engines_for(DOC_INDEX_FALLBACK_ENGINE) if search_engine != DOC_INDEX_FALLBACK_ENGINE else ["tavily"]
+
+def normalize_search_engine(search_engine: Optional[str]) -> str:
+    """Return search_engine if it names an option or a subset of engines, else the default."""
+    if search_engine in SEARCH_ENGINES:
+        return search_engine
+    names = [name.strip() for name in (search_engine or "").split(",")]
+    if names and all(name in engine_registry for name in names):
+        return ",".join(dict.fromkeys(names))
+    return DEFAULT_SEARCH_ENGINE
+
+# Early-exit settings: stop waiting for slower engines once this many results
+# scoring at least SEARCH_MIN_SCORE have arrived (0 waits for every engine)
+SEARCH_EARLY_EXIT_QUOTA = int(os.getenv("SEARCH_EARLY_EXIT_QUOTA", "0"))
+SEARCH_MIN_SCORE = float(os.getenv("SEARCH_MIN_SCORE", "0.5"))
+# Results cut short by an early exit miss the slower engines, so they are cached briefly
+SEARCH_PARTIAL_CACHE_TTL = float(os.getenv("SEARCH_PARTIAL_CACHE_TTL", "60"))
+
+def stream_search_results(
+    query: str,
+    search_engine: str = DEFAULT_SEARCH_ENGINE,
+    search_depth: str = "basic",
+    max_results: int = 10,
+    timeout: Optional[float] = None,
+    options: Optional[Dict[str, Any]] = None
+) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    Query every engine of a search engine option in parallel and yield results
+    as each engine returns. Engines still running when the generator is closed
+    are cancelled and their results discarded.
+    
+    Args:
+        query: The search query
+        search_engine: A search engine option or comma-separated engine names
+        search_depth: "basic" or "advanced"
+        max_results: Maximum number of results to request from each engine
+        timeout: Stop waiting for engines after this many seconds
+        options: Search mode hints (categories, include_domains) passed to every engine
+        
+    Yields:
+        Tuples of (engine name, list of search result dictionaries)
+    """
+    return engine_registry.search_many(engines_for(search_engine), query, search_depth, max_results, timeout, options)
+
+def is_high_score(result: Dict) -> bool:
+    """Check whether a search result counts towards the early-exit quota."""
+    if result.get("source", "").endswith("_error"):
+        return False
+    try:
+        return float(result.get("score") or 0) >= SEARCH_MIN_SCORE
+    except (TypeError, ValueError):
+        return False
+
+def search_local_index(query: str, max_results: int = 10) -> Optional[List[Dict]]:
+    """
+    Answer a search from the local document index
+    
+    Args:
+        query: The search query
+        max_results: Maximum number of results to return
+        
+    Returns:
+        List of search result dictionaries, or None when there are not enough
+        fresh, high-scoring hits and the web should be searched instead
+    """
+    if local_index is None:
+        return None
+    try:
+        hits = local_index.search(query, k=max_results, max_age=DOC_INDEX_FRESH_SECONDS)
+    except Exception as e:
+        print(f"Error searching local index: {e}")
+        return None
+    strong_hits = [hit for hit in hits if hit["score"] >= DOC_INDEX_MIN_SCORE]
+    if len(strong_hits) < DOC_INDEX_MIN_HITS:
+        metrics.inc("doc_index_searches_total", outcome="miss")
+        return None
+    metrics.inc("doc_index_searches_total", outcome="hit")
+    return strong_hits
+
 # Function to perform a search using the specified search engine
 def search_with_engine(
     query: str, 
     search_engine: str = DEFAULT_SEARCH_ENGINE,
     search_depth: str = "basic", 
-    max_results: int = 10
+    max_results: int = 10,
+    early_exit_quota: Optional[int] = None,
+    deadline: Optional[Deadline] = None,
+    search_options: Optional[Dict[str, Any]] = None,
+    cache_ttl: Optional[float] = None
 ) -> List[Dict]:
     """
     Perform a search using the specified search engine
     
     Args:
         query: The search query
-        search_engine: Which search engine to use ('tavily', 'searxng', or 'both')
+        search_engine: A search engine option (e.g. 'tavily', 'both', 'auto' or 'index') or engine names
+        search_depth: "basic" or "advanced"
+        max_results: Maximum number of results to return
+        early_exit_quota: Stop waiting for slower engines once this many high-score
+            results have arrived (defaults to SEARCH_EARLY_EXIT_QUOTA, 0 disables)
+        deadline: Request deadline bounding how long engines are waited for
+        search_options: Search mode hints (categories, include_domains) passed to the engines
+        cache_ttl: Search cache TTL (defaults to SEARCH_CACHE_TTL)
+        
+    Returns:
+        List of search result dictionaries
+    """
+    # Ask for fewer results when the request is running out of time
+    if deadline and deadline.remaining() < DEADLINE_DEGRADE_SECONDS and max_results > DEGRADED_MAX_RESULTS:
+        deadline.degrade("fewer search results")
+        max_results = DEGRADED_MAX_RESULTS
+    
+    # Index-first mode answers from previously fetched pages when possible;
+    # time-sensitive questions always go to the web, as indexed pages may be a day old
+    if search_engine == "index":
+        indexed_results = None if is_time_sensitive(query) else search_local_index(query, max_results)
+        if indexed_results is not None:
+            print(f"Answering '{query}' from the local index ({len(indexed_results)} hits)")
+            return indexed_results
+        search_engine = DOC_INDEX_FALLBACK_ENGINE
+    
+    search_options = search_options or {}
+    options_key = json.dumps(search_options, sort_keys=True) if search_options else ""
+    cache_key = make_key("search", search_engine, search_depth, max_results, options_key, query)
+    cached_results = search_cache.get(cache_key)
+    if cached_results is not None:
+        print(f"Search cache hit for: '{query}' with {search_engine} engine")
+        return cached_results
+    
+    # Concurrent misses for the same search are collapsed into one engine call
+    return search_cache.get_or_compute(
+        cache_key,
+        lambda: run_search(query, search_engine, search_depth, max_results, early_exit_quota, deadline, search_options),
+        ttl=cache_ttl_for(query, SEARCH_CACHE_TTL if cache_ttl is None else cache_ttl),
+        # Errors are transient and never cached, "no results" is cached briefly;
+        # results cut short by a deadline are not cached either
+        cacheable=lambda results: not (deadline and deadline.degraded)
+            and not any(r.get("source", "").endswith("_error") for r in results),
+        is_empty=lambda results: all(r.get("source") == "no_results" for r in results),
+        deadline=deadline,
+        ttl_for=lambda results: SEARCH_PARTIAL_CACHE_TTL if any(r.get("partial") for r in results) else None
+    )
+
+def run_search(
+    query: str,
+    search_engine: str = DEFAULT_SEARCH_ENGINE,
+    search_depth: str = "basic",
+    max_results: int = 10,
+    early_exit_quota: Optional[int] = None,
+    deadline: Optional[Deadline] = None,
+    search_options: Optional[Dict[str, Any]] = None
+) -> List[Dict]:
+    """
+    Query the engines of a search engine option without consulting the cache
+    
+    Args:
+        query: The search query
+        search_engine: A search engine option or comma-separated engine names
         search_depth: "basic" or "advanced"
         max_results: Maximum number of results to return
+        early_exit_quota: Stop waiting for slower engines once this many high-score
+            results have arrived (defaults to SEARCH_EARLY_EXIT_QUOTA, 0 disables)
+        deadline: Request deadline bounding how long engines are waited for
+        search_options: Search mode hints (categories, include_domains) passed to the engines
         
     Returns:
         List of search result dictionaries
     """
     print(f"Searching for: '{query}' with {search_engine} engine, depth {search_depth}")
     
-    results = []
+    quota = SEARCH_EARLY_EXIT_QUOTA if early_exit_quota is None else early_exit_quota
+    engines = engines_for(search_engine)
+    engine_results = {}
+    high_score_count = 0
+    early_exit = False
+    timeout = deadline.timeout(SEARCH_BUDGET_FRACTION) if deadline else None
     
-    # Determine if we should use Tavily
-    use_tavily = search_engine in ["tavily", "both"]
-    if use_tavily:
-        try:
-            if not TAVILY_API_KEY:
-                print("Warning: Tavily API key not found. Skipping Tavily search.")
-            else:
-                # For time-sensitive queries, we want to ensure fresh results
-                include_answer = False
-                tavily_query = query
-                if is_time_sensitive(query):
-                    tavily_query = f"{query} (latest information as of {datetime.datetime.now().strftime('%Y-%m-%d')})"
-                    include_answer = True
-                
-                # Call Tavily search API
-                search_response = tavily_client.search(
-                    query=tavily_query,
-                    search_depth=search_depth,
-                    include_answer=include_answer,
-                    include_raw_content=True,
-                    max_results=max_results
-                )
-                
-                if 'results' in search_response:
-                    # Add a source tag to Tavily results
-                    for result in search_response['results']:
-                        result["source"] = "tavily"
-                    results.extend(search_response['results'])
-        except Exception as e:
-            print(f"Error in Tavily search: {e}")
-            results.append({
-                "title": "Tavily Search API Error",
-                "url": "",
-                "content": f"Error performing Tavily search: {str(e)}",
-                "source": "tavily_error"
-            })
-    
-    # Determine if we should use SearxNG
-    use_searxng = search_engine in ["searxng", "both"]
-    if use_searxng and searxng_client:
-        try:
-            # Map search depth to a suitable category for SearxNG
-            category = "general"
-            if search_depth == "advanced":
-                category = "general,news"  # Multiple categories for deeper search
-                
-            # Set time range if it's a time-sensitive query
-            time_range = None
-            if is_time_sensitive(query):
-                time_range = "day"  # Use 'day' for recent results
-                
-            # Get results from SearxNG
-            searxng_results = searxng_client.search(
-                query=query,
-                category=category,
-                time_range=time_range,
-                max_results=max_results
-            )
-            
-            results.extend(searxng_results)
-        except Exception as e:
-            print(f"Error in SearxNG search: {e}")
-            results.append({
-                "title": "SearxNG Search Error",
-                "url": "",
-                "content": f"Error performing SearxNG search: {str(e)}",
-                "source": "searxng_error"
-            })
+    with closing(stream_search_results(query, search_engine, search_depth, max_results, timeout, search_options)) as stream:
+        for engine, results_for_engine in stream:
+            engine_results[engine] = results_for_engine
+            high_score_count += sum(1 for r in results_for_engine if is_high_score(r))
+            if quota and high_score_count >= quota and len(engine_results) < len(engines):
+                pending = [name for name in engines if name not in engine_results]
+                print(f"Early exit after {engine}: {high_score_count} high-score results, cancelling {', '.join(pending)}")
+                early_exit = True
+                break
+    
+    if deadline and len(engine_results) < len(engines) and not (quota and high_score_count >= quota):
+        deadline.degrade("slow search engines skipped")
+    
+    # Keep results in engine order regardless of which engine returned first, stamped
+    # with when they were fetched so copies served from the cache keep that time;
+    # results of an early exit are marked partial
+    fetched_at = time.time()
+    results = [
+        {**r, "fetched_at": r.get("fetched_at", fetched_at), **({"partial": True} if early_exit else {})}
+        for name in engines for r in engine_results.get(name, [])
+    ]
     
     # If no results were found from any engine
     if not results:
@@ -262,10 +871,251 @@ def search_with_engine(
         
     return results
 
+# Speculative (typeahead) prefetch settings
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "120"))
+PREFETCH_MATCH_RATIO = float(os.getenv("PREFETCH_MATCH_RATIO", "0.92"))
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "5"))
+# Texts per client and engine/mode compared for near matches, newest first
+PREFETCH_FUZZY_CANDIDATES = 16
+
+# Recent prefetches keyed by (engine, mode, normalized text), each holding a Future
+# that resolves to the search results once the speculative search finishes
+_prefetches = TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=PREFETCH_TTL)
+# Normalized texts each client recently prefetched, keyed by (client, engine, mode),
+# so near matches are only looked for among the asking client's own prefetches
+_client_prefetch_texts = TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=PREFETCH_TTL)
+_client_prefetch_texts_lock = threading.Lock()
+
+def search_profile_kwargs(query: str, profile: SearchProfile) -> Dict[str, Any]:
+    """search_with_engine arguments implementing a search mode profile."""
+    return {
+        "search_depth": profile.depth_for(is_time_sensitive(query)),
+        "max_results": profile.max_results,
+        "search_options": profile.search_options()
+    }
+
+def prefetch_search(
+    query: str,
+    search_engine: str = DEFAULT_SEARCH_ENGINE,
+    mode: str = DEFAULT_MODE,
+    client: Optional[str] = None
+) -> List[Dict]:
+    """
+    Run a speculative search for partially typed text and keep the results
+    so a matching question submitted shortly after can skip the search stage
+    
+    Args:
+        query: The text typed so far
+        search_engine: Which search engine to use
+        mode: Search mode whose profile shapes the search
+        client: Client typing the text, whose question may nearly match it
+        
+    Returns:
+        List of search result dictionaries
+    """
+    search_engine = normalize_search_engine(search_engine)
+    profile = profile_for(mode)
+    key = make_key(search_engine, profile.name, query)
+    if client is not None:
+        texts_key = (client, search_engine, profile.name)
+        with _client_prefetch_texts_lock:
+            texts = _client_prefetch_texts.get(texts_key, ())
+            texts = (key[2],) + tuple(text for text in texts if text != key[2])
+            _client_prefetch_texts.set(texts_key, texts[:PREFETCH_FUZZY_CANDIDATES])
+    existing = _prefetches.get(key)
+    if existing is not None and not (existing.done() and existing.exception()):
+        return existing.result()
+    
+    future = Future()
+    _prefetches.set(key, future)
+    try:
+        results = search_with_engine(query, search_engine=search_engine, **search_profile_kwargs(query, profile))
+    except Exception as e:
+        future.set_exception(e)
+        _prefetches.delete(key)
+        raise
+    future.set_result(results)
+    return results
+
+def find_prefetched_results(
+    query: str,
+    search_engine: str = DEFAULT_SEARCH_ENGINE,
+    mode: str = DEFAULT_MODE,
+    client: Optional[str] = None
+) -> Optional[List[Dict]]:
+    """
+    Return results of a prefetch whose text matches the query, or nearly
+    matches it among the client's own prefetches, waiting briefly for one
+    that is still in flight
+    
+    Args:
+        query: The submitted question
+        search_engine: Which search engine the question uses
+        mode: Search mode the question uses
+        client: Client asking the question (None only matches exactly)
+        
+    Returns:
+        List of search result dictionaries, or None when nothing usable was prefetched
+    """
+    normalized = normalize_query(query)
+    best_ratio, best_future = 1.0, _prefetches.get((search_engine, mode, normalized))
+    if best_future is None and client is not None:
+        best_ratio = 0.0
+        for text in _client_prefetch_texts.get((client, search_engine, mode), ()):
+            # Cheap upper bounds first: the length ratio, then real_quick_ratio
+            if 2 * min(len(text), len(normalized)) / (len(text) + len(normalized)) < PREFETCH_MATCH_RATIO:
+                continue
+            matcher = SequenceMatcher(None, text, normalized)
+            if matcher.real_quick_ratio() < PREFETCH_MATCH_RATIO or matcher.quick_ratio() < PREFETCH_MATCH_RATIO:
+                continue
+            ratio = matcher.ratio()
+            future = _prefetches.get((search_engine, mode, text))
+            if ratio > best_ratio and future is not None:
+                best_ratio, best_future = ratio, future
+    
+    if best_future is None or best_ratio < PREFETCH_MATCH_RATIO:
+        return None
+    try:
+        results = best_future.result(timeout=PREFETCH_WAIT_SECONDS)
+    except Exception:
+        return None
+    print(f"Using prefetched search results for: '{query}' (match {best_ratio:.2f})")
+    return results
+
+# Opt-in: multi-part questions ("compare X and Y pricing") are split into
+# sub-queries searched in parallel with the question itself, which keeps its
+# full result budget; each sub-query adds up to SUBQUERY_MAX_RESULTS results.
+# The LLM fallback is only asked when the local heuristics find no split in a
+# question that looks multi-part
+DECOMPOSE_QUERIES = os.getenv("DECOMPOSE_QUERIES", "0") == "1"
+DECOMPOSE_LLM_FALLBACK = os.getenv("DECOMPOSE_LLM_FALLBACK", "0") == "1"
+MAX_SUBQUERIES = int(os.getenv("MAX_SUBQUERIES", "3"))
+SUBQUERY_MAX_RESULTS = int(os.getenv("SUBQUERY_MAX_RESULTS", "3"))
+
+# Separate pool from the engine workers, which the sub-query searches wait on
+_subquery_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SUBQUERY_MAX_WORKERS", "8")),
+    thread_name_prefix="subquery"
+)
+
+def decompose_query(query: str, deadline: Optional[Deadline] = None) -> List[str]:
+    """
+    Split a multi-part question into independent search queries
+    
+    Args:
+        query: The user's question
+        deadline: Request deadline; the LLM fallback is skipped when time is short
+        
+    Returns:
+        Sub-queries, or an empty list to search the question as is
+    """
+    if not DECOMPOSE_QUERIES:
+        return []
+    sub_queries = decompose_question(query, MAX_SUBQUERIES)
+    method = "heuristic"
+    query_lower = f" {query.lower()} "
+    looks_multi_part = " and " in query_lower or any(keyword in query_lower for keyword in SYNTHESIS_KEYWORDS)
+    if (not sub_queries and DECOMPOSE_LLM_FALLBACK and looks_multi_part
+            and not (deadline and deadline.remaining() < DEADLINE_DEGRADE_SECONDS)):
+        method = "llm"
+        decomposer = models.get("small") or models["large"]
+        if deadline:
+            decomposer = decomposer.bind(timeout=deadline.timeout(0.1, cap=10))
+        decomposer = recorder.wrap_model(decomposer, {"question": query, "max_subqueries": MAX_SUBQUERIES}, kind="decompose")
+        try:
+            sub_queries = llm_decompose(query, decomposer | RunnableLambda(record_usage), MAX_SUBQUERIES)
+        except Exception as e:
+            print(f"Error decomposing query: {e}")
+    metrics.inc("query_decompositions_total", method=method if sub_queries else "none")
+    return sub_queries
+
+def search_subqueries(
+    query: str,
+    sub_queries: List[str],
+    search_engine: str = DEFAULT_SEARCH_ENGINE,
+    deadline: Optional[Deadline] = None,
+    profile: Optional[SearchProfile] = None
+) -> List[Dict]:
+    """
+    Search the original question and its sub-queries in parallel, then merge
+    and deduplicate the results: the question's own results (its full result
+    budget) come first, followed by the sub-queries' results in turn
+    
+    Args:
+        query: The user's question
+        sub_queries: Sub-queries from decompose_query
+        search_engine: Which search engine to use
+        deadline: Request deadline shared by all searches
+        profile: Search mode profile setting the result budget
+        
+    Returns:
+        Merged search result dictionaries
+    """
+    profile = profile or profile_for(DEFAULT_MODE)
+    normalized = normalize_query(query)
+    queries = [query] + [q for q in sub_queries if normalize_query(q) != normalized]
+    print(f"Searching {len(queries)} queries in parallel for: '{query}'")
+    
+    # The question is searched exactly as without decomposition (sharing its
+    # cache entry); sub-queries add a few results each; all share the deadline
+    search_kwargs = search_profile_kwargs(query, profile)
+    futures = [
+        _subquery_executor.submit(
+            search_with_engine, q, search_engine=search_engine, deadline=deadline,
+            cache_ttl=profile.cache_ttl,
+            **{**search_kwargs, "max_results": search_kwargs["max_results"] if i == 0 else SUBQUERY_MAX_RESULTS}
+        )
+        for i, q in enumerate(queries)
+    ]
+    result_lists = []
+    for q, future in zip(queries, futures):
+        try:
+            result_lists.append(future.result())
+        except Exception as e:
+            print(f"Error searching sub-query '{q}': {e}")
+            result_lists.append([])
+    sub_query_results = SUBQUERY_MAX_RESULTS * (len(queries) - 1)
+    return merge_results(result_lists, profile.max_results + sub_query_results, primary_results=profile.max_results)
+
+def rerank_documents(query: str, documents: List[Document]) -> List[Document]:
+    """
+    Order web documents by embedding similarity to the query, keeping system
+    documents first and renumbering sources so Source 1 is the best match
+    
+    Args:
+        query: The search query
+        documents: Documents built from search results
+        
+    Returns:
+        Reordered list of Document objects
+    """
+    system_docs = [doc for doc in documents if "index" not in doc.metadata]
+    web_docs = [doc for doc in documents if "index" in doc.metadata]
+    if len(web_docs) < 2:
+        return documents
+    try:
+        query_vector = embeddings.embed_query(query)
+        doc_vectors = embeddings.embed_documents([doc.page_content for doc in web_docs])
+    except Exception as e:
+        print(f"Error reranking documents: {e}")
+        return documents
+    
+    def similarity(vector):
+        norm = (sum(v * v for v in vector) * sum(q * q for q in query_vector)) ** 0.5 or 1.0
+        return sum(v * q for v, q in zip(vector, query_vector)) / norm
+    
+    ranked = [doc for _, doc in sorted(zip(map(similarity, doc_vectors), web_docs), key=lambda pair: -pair[0])]
+    for i, doc in enumerate(ranked):
+        doc.metadata["index"] = i + 1
+    return system_docs + ranked
+
 # Function to get documents from search results
 def get_content_from_search(
     query: str, 
-    search_engine: str = DEFAULT_SEARCH_ENGINE
+    search_engine: str = DEFAULT_SEARCH_ENGINE,
+    deadline: Optional[Deadline] = None,
+    profile: Optional[SearchProfile] = None,
+    client: Optional[str] = None
 ) -> List[Document]:
     """
     Get search results and convert them to Document objects
@@ -273,24 +1123,45 @@ def get_content_from_search(
     Args:
         query: The search query
         search_engine: Which search engine to use
+        deadline: Request deadline; search and context size shrink as it nears
+        profile: Search mode profile setting result count, depth and context budget
+        client: Client asking, whose near-matching prefetches may be reused
         
     Returns:
         List of Document objects
     """
-    # Determine search depth based on query type
-    search_depth = "advanced" if is_time_sensitive(query) else "basic"
+    profile = profile or profile_for(DEFAULT_MODE)
     
-    # Get search results
-    search_results = search_with_engine(
-        query, 
-        search_engine=search_engine,
-        search_depth=search_depth
-    )
+    # Reuse a speculative search made while the question was being typed
+    search_results = find_prefetched_results(query, search_engine, profile.name, client=client)
+    
+    # Get search results, searching the parts of multi-part questions in parallel
+    if search_results is None:
+        sub_queries = decompose_query(query, deadline)
+        if sub_queries:
+            search_results = search_subqueries(query, sub_queries, search_engine, deadline, profile)
+        else:
+            search_results = search_with_engine(
+                query, 
+                search_engine=search_engine,
+                deadline=deadline,
+                cache_ttl=profile.cache_ttl,
+                **search_profile_kwargs(query, profile)
+            )
+    
+    # Split the profile's context budget (about 4 characters per token) over the results
+    content_chars = min(2000, profile.context_tokens * 4 // max(1, len(search_results)))
+    
+    # Shorter per-document context keeps the model call fast when time is short
+    if deadline and deadline.remaining() < DEADLINE_DEGRADE_SECONDS:
+        deadline.degrade("shorter context")
+        content_chars = min(content_chars, DEGRADED_CONTENT_CHARS)
     
     documents = []
+    index_documents = []
     
     # Add a timestamp document
-    now = datetime.datetime.now()
+    now = prompt_now()
     current_date = now.strftime("%Y-%m-%d")
     current_time = now.strftime("%H:%M:%S")
     
@@ -311,27 +1182,59 @@ def get_content_from_search(
         # Use raw content if available, otherwise use regular content
         page_content = raw_content if raw_content else content
         
+        # Pages from the local index are stored already formatted
+        if source_engine == "index":
+            document_content = content[:content_chars] if content_chars < 2000 else content
+        else:
+            document_content = f"Title: {title}\n\nContent: {page_content[:content_chars]}\n\nSearch Engine: {source_engine}"
+        
         # Create document from the search result
-        documents.append(Document(
-            page_content=f"Title: {title}\n\nContent: {page_content[:2000]}\n\nSearch Engine: {source_engine}",
-            metadata={
-                "source": url, 
-                "title": title, 
-                "index": i+1,
-                "engine": source_engine
-            }
-        ))
+        metadata = {
+            "source": url, 
+            "title": title, 
+            "index": i+1,
+            "engine": result.get("engine", source_engine),
+            "fetched_at": result.get("fetched_at", time.time())
+        }
+        documents.append(Document(page_content=document_content, metadata=metadata))
+        
+        # The index keeps the page at full document length, whatever this request's
+        # budget, and only with a known fetch time so it is never made to look fresher
+        if source_engine != "index" and result.get("fetched_at") is not None:
+            index_documents.append(Document(
+                page_content=f"Title: {title}\n\nContent: {page_content[:2000]}\n\nSearch Engine: {source_engine}",
+                metadata=metadata
+            ))
+    
+    if RERANK_WITH_EMBEDDINGS:
+        documents = rerank_documents(query, documents)
+    
+    # Keep freshly fetched pages in the local index for later questions
+    if local_index is not None and index_documents:
+        try:
+            local_index.add_documents(index_documents)
+        except Exception as e:
+            print(f"Error updating local index: {e}")
     
     return documents
 
 # Function to generate a response with real-time search results
-def generate_response(query: str, search_engine: str = DEFAULT_SEARCH_ENGINE) -> List[Document]:
+def generate_response(
+    query: str,
+    search_engine: str = DEFAULT_SEARCH_ENGINE,
+    deadline: Optional[Deadline] = None,
+    profile: Optional[SearchProfile] = None,
+    client: Optional[str] = None
+) -> List[Document]:
     """
     Generate a response using real-time web search
     
     Args:
         query: The search query
         search_engine: Which search engine to use
+        deadline: Request deadline passed on to the search stage
+        profile: Search mode profile passed on to the search stage
+        client: Client asking, passed on to the search stage
         
     Returns:
         List of Document objects with response content
@@ -345,7 +1248,9 @@ def generate_response(query: str, search_engine: str = DEFAULT_SEARCH_ENGINE) ->
     
     # Get content from search
     try:
-        web_documents = get_content_from_search(query, search_engine=search_engine)
+        web_documents = get_content_from_search(
+            query, search_engine=search_engine, deadline=deadline, profile=profile, client=client
+        )
         if web_documents:
             documents.extend(web_documents)
     except Exception as e:
@@ -369,6 +1274,46 @@ def generate_response(query: str, search_engine: str = DEFAULT_SEARCH_ENGINE) ->
 def format_docs(docs):
     return "\n\n".join([f"Source {doc.metadata.get('index', i+1)}:\n{doc.page_content}\nURL: {doc.metadata.get('source', 'No URL')}" for i, doc in enumerate(docs)])
 
+def fit_context(docs: List[Document], max_tokens: int = MAX_CONTEXT_TOKENS, usage: Optional[RequestUsage] = None) -> List[Document]:
+    """
+    Keep the documents that fit a token budget, in rank order, truncating the
+    first one that does not fit and dropping the rest
+    
+    Args:
+        docs: Documents as passed to format_docs
+        max_tokens: Token budget for the formatted context (0 keeps everything)
+        usage: Request usage receiving the context size
+        
+    Returns:
+        The documents to format into the context
+    """
+    kept = []
+    used = 0
+    trimmed = False
+    for doc in docs:
+        # Source label, URL line and separators take a few tokens per document
+        overhead = token_counter.count(doc.metadata.get("source", "")) + 8
+        tokens = token_counter.count(doc.page_content) + overhead
+        if max_tokens and used + tokens > max_tokens:
+            trimmed = True
+            remaining = max_tokens - used - overhead
+            if remaining >= 50:
+                content = token_counter.truncate(doc.page_content, remaining)
+                kept.append(Document(page_content=content, metadata=doc.metadata))
+                used += token_counter.count(content) + overhead
+            break
+        kept.append(doc)
+        used += tokens
+    
+    if trimmed:
+        print(f"Trimmed the search context to {used} tokens ({len(kept)} of {len(docs)} sources)")
+        metrics.inc("context_trimmed_total")
+    metrics.observe("context_tokens", used)
+    if usage is not None:
+        usage.context_tokens = used
+        usage.context_trimmed = trimmed
+    return kept
+
 # Prompt for generating final answers
 template = """
 You are an AI research assistant that provides accurate and helpful information.
@@ -400,6 +1345,39 @@ Follow these special instructions:
 Answer:
 """
 
+# Same instructions with all static text first and the per-request data last,
+# so consecutive requests share the longest possible cacheable prompt prefix
+cache_friendly_template = """
+You are an AI research assistant that provides accurate and helpful information.
+Answer the question using ONLY the information from web search results given below. If you cannot answer the question with the provided information,
+state that you don't have enough information and suggest what else to search for.
+
+Provide a comprehensive answer that:
+1. Directly answers the question based ONLY on the information in the search results
+2. Includes specific facts from the provided information 
+3. Cites your sources with [Source X] notation after each fact (where X is the number of the source)
+4. If the question is about current events or time-sensitive information, explicitly mention the date of the information
+5. At the end, list 3 follow-up questions that would be interesting to explore next
+6. At the end, include a "Read More" section with the most relevant source URLs from the search results
+
+Follow these special instructions:
+- Don't make up information that's not in the search results
+- Don't rely on your general knowledge or training data
+- If the search results contain contradictory information, acknowledge this and present multiple perspectives
+- Be clear about which information comes from which source
+
+Search performed using: {search_engine}
+Current Date: {current_date}
+Current Time: {current_time}
+
+Information from web search:
+{context}
+
+Question: {question}
+
+Answer:
+"""
+
 # Create prompt from template
 prompt = PromptTemplate(
     input_variables=["context", "question", "current_date", "current_time"],
@@ -407,17 +1385,28 @@ prompt = PromptTemplate(
 )
 
 # Updated chain with current date and time information
-def process_with_date(question, search_engine=DEFAULT_SEARCH_ENGINE):
-    """Process a question with date information and search engine selection"""
+def process_with_date(question, search_engine=DEFAULT_SEARCH_ENGINE, deadline=None, profile=None, progress=None, usage=None):
+    """Process a question with date information, search engine selection, an optional deadline and search mode profile"""
     # Get current date and time
-    now = datetime.datetime.now()
+    now = prompt_now()
     current_date = now.strftime("%Y-%m-%d")
     current_time = now.strftime("%H:%M:%S")
     
     # Generate response with real-time web search
-    docs = generate_response(question, search_engine=search_engine)
+    docs = generate_response(
+        question, search_engine=search_engine, deadline=deadline, profile=profile,
+        client=usage.client if usage else None
+    )
+    docs = fit_context(docs, usage=usage)
     context = format_docs(docs)
     
+    # Report the sources as a partial result before the model call
+    if progress is not None:
+        progress(stage="generating", sources=[
+            {"title": doc.metadata.get("title", ""), "url": doc.metadata["source"]}
+            for doc in docs if doc.metadata.get("source", "").startswith("http")
+        ])
+    
     # Return all needed variables
     return {
         "context": context,
@@ -435,40 +1424,515 @@ rag_chain = (
     | StrOutputParser()
 )
 
-def answer_question(question: str, search_engine: str = DEFAULT_SEARCH_ENGINE) -> str:
+def build_answer_prompt() -> PromptTemplate:
+    """Build the answer prompt for the configured prompt layout."""
+    if PROMPT_LAYOUT == "cache_friendly":
+        answer_template = cache_friendly_template
+    else:
+        # Update the template to include search engine info
+        answer_template = template + f"\nSearch performed using: {{search_engine}}\n"
+    return PromptTemplate(
+        input_variables=["context", "question", "current_date", "current_time", "search_engine"],
+        template=answer_template
+    )
+
+def record_usage(message: Any, request_usage: Optional[RequestUsage] = None, model_name: str = "") -> Any:
     """
-    Process a user question and return an answer with citations and follow-up questions.
+    Record token usage, including provider-side cached prompt tokens, from a
+    model response and pass the response through unchanged
+    
+    Args:
+        message: Model response
+        request_usage: Request usage receiving the tokens and their cost;
+            usage the provider did not report is counted locally
+        model_name: Model used to price the call when the response does not name it
+    """
+    prompt_tokens = completion_tokens = cached_tokens = 0
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        prompt_tokens = usage.get("input_tokens", 0)
+        completion_tokens = usage.get("output_tokens", 0)
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0)
+    else:
+        token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+        prompt_tokens = token_usage.get("prompt_tokens", 0)
+        completion_tokens = token_usage.get("completion_tokens", 0)
+        cached_tokens = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    
+    if prompt_tokens:
+        metrics.inc("llm_prompt_tokens_total", prompt_tokens, layout=PROMPT_LAYOUT)
+        metrics.inc("llm_cached_prompt_tokens_total", cached_tokens or 0, layout=PROMPT_LAYOUT)
+        metrics.inc("llm_completion_tokens_total", completion_tokens, layout=PROMPT_LAYOUT)
+        total_prompt = metrics.get("llm_prompt_tokens_total", layout=PROMPT_LAYOUT)
+        total_cached = metrics.get("llm_cached_prompt_tokens_total", layout=PROMPT_LAYOUT)
+        metrics.set_gauge("llm_cached_prompt_token_ratio", total_cached / total_prompt, layout=PROMPT_LAYOUT)
+    
+    if request_usage is not None:
+        estimated = not prompt_tokens
+        if estimated:
+            prompt_tokens = request_usage.estimated_prompt_tokens
+            completion_tokens = token_counter.count(str(getattr(message, "content", message)))
+        model_name = (getattr(message, "response_metadata", None) or {}).get("model_name") or model_name
+        prompt_price, completion_price = price_for(model_name, MODEL_PRICES)
+        cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+        request_usage.add_call(prompt_tokens, completion_tokens, cached_tokens or 0, cost, estimated)
+        metrics.inc("llm_cost_usd_total", cost, mode=request_usage.mode or DEFAULT_MODE)
+    return message
+
+# Phrases indicating a question needs synthesis across several sources
+SYNTHESIS_KEYWORDS = [
+    "compare", "comparison", " vs ", " vs.", "versus", "difference between",
+    "pros and cons", "advantages", "disadvantages", "analyze", "analyse",
+    "evaluate", "explain why", "summarize", "summarise", "impact of",
+    "relationship between", "trade-off", "tradeoff"
+]
+
+# Phrases the model uses when the context was not enough to answer
+INSUFFICIENT_INFORMATION_PHRASES = [
+    "don't have enough information", "do not have enough information",
+    "not enough information", "insufficient information",
+    "cannot answer the question", "unable to answer"
+]
+
+def route_model(question: str, context: str = "") -> Tuple[str, str]:
+    """
+    Pick a model tier for a question from cheap local signals
+    
+    Args:
+        question: The user's question
+        context: The formatted search context that will be sent to the model
+        
+    Returns:
+        Tuple of (model tier, reason for the decision)
+    """
+    if "small" not in models:
+        return "large", "single_model"
+    
+    question_lower = f" {question.lower()} "
+    if any(keyword in question_lower for keyword in SYNTHESIS_KEYWORDS):
+        return "large", "synthesis"
+    if len(question.split()) > ROUTER_MAX_SIMPLE_WORDS or question.count("?") > 1:
+        return "large", "complex_query"
+    if len(context) > ROUTER_MAX_SMALL_CONTEXT_CHARS:
+        return "large", "large_context"
+    if is_time_sensitive(question):
+        return "large", "time_sensitive"
+    return "small", "simple_lookup"
+
+def signals_insufficient_information(answer: str) -> bool:
+    """Check whether an answer says the context was not enough to answer."""
+    answer_lower = answer.lower().replace("\u2019", "'")
+    return any(phrase in answer_lower for phrase in INSUFFICIENT_INFORMATION_PHRASES)
+
+def model_for_deadline(tier: str, deadline: Optional[Deadline] = None):
+    """
+    Return the chat model for a tier, bound to the time left on the deadline
+    and to a smaller completion when the request is running out of time
+    """
+    if deadline is None:
+        return models[tier]
+    options = {"timeout": deadline.timeout()}
+    if deadline.remaining() < DEADLINE_DEGRADE_SECONDS:
+        deadline.degrade("shorter completion")
+        options["max_tokens"] = DEGRADED_MAX_TOKENS
+    return models[tier].bind(**options)
+
+def invoke_routed_model(
+    inputs: Dict[str, Any],
+    deadline: Optional[Deadline] = None,
+    model_tier: str = "auto",
+    usage: Optional[RequestUsage] = None
+) -> str:
+    """
+    Answer with the model tier chosen by the router, retrying on the large
+    model when a smaller one reports it could not answer
+    
+    Args:
+        inputs: Prompt variables produced by process_with_date
+        deadline: Request deadline bounding the model calls
+        model_tier: Tier fixed by the search mode, or "auto" to route
+        usage: Request usage receiving token counts and cost
+        
+    Returns:
+        str: The model's answer
+    """
+    if model_tier == "auto":
+        tier, reason = route_model(inputs["question"], inputs["context"])
+    else:
+        tier, reason = (model_tier if model_tier in models else "large"), "mode"
+    metrics.inc("model_route_total", tier=tier, reason=reason)
+    
+    answer_prompt = build_answer_prompt()
+    
+    # Count the prompt before sending it: the template, the question and the
+    # context, whose per-document counts are already cached
+    context_tokens = usage.context_tokens if usage is not None else token_counter.count(inputs["context"])
+    prompt_tokens = token_counter.count(answer_prompt.template) + token_counter.count(inputs["question"]) + context_tokens
+    metrics.observe("prompt_tokens_estimated", prompt_tokens)
+    if usage is not None:
+        usage.estimated_prompt_tokens = prompt_tokens
+    
+    def usage_recorder(tier_name: str) -> RunnableLambda:
+        return RunnableLambda(
+            lambda message: record_usage(message, usage, getattr(models[tier_name], "model_name", "")),
+            name="record_usage"
+        )
+    
+    model_request = {"tier": tier, "question": inputs["question"], "search_engine": inputs["search_engine"]}
+    chat_model = recorder.wrap_model(model_for_deadline(tier, deadline), model_request)
+    answer = (answer_prompt | chat_model | usage_recorder(tier) | StrOutputParser()).invoke(inputs)
+    
+    if tier != "large" and signals_insufficient_information(answer):
+        # A second model call is only worth it when there is time to finish it
+        if deadline and deadline.remaining() < DEADLINE_DEGRADE_SECONDS:
+            deadline.degrade("large model fallback skipped")
+            return answer
+        print(f"Model tier '{tier}' reported insufficient information, falling back to the large model")
+        metrics.inc("model_fallback_total", from_tier=tier)
+        chat_model = recorder.wrap_model(model_for_deadline("large", deadline), {**model_request, "tier": "large"})
+        answer = (answer_prompt | chat_model | usage_recorder("large") | StrOutputParser()).invoke(inputs)
+    return answer
+
+def answer_cache_key(question: str, search_engine: str, mode: str = DEFAULT_MODE) -> Tuple:
+    """Answer cache key; answers differ per search engine and search mode."""
+    return make_key("answer", search_engine, mode, question)
+
+def find_similar_answer(
+    question: str,
+    search_engine: str,
+    mode: str = DEFAULT_MODE
+) -> Tuple[Optional[str], Optional[List[float]]]:
+    """
+    Look for a cached answer to a semantically equivalent earlier question
+    
+    Args:
+        question: The user's question
+        search_engine: Which search engine the question uses
+        mode: Which search mode the question uses
+        
+    Returns:
+        Tuple of (cached answer or None, question embedding or None)
+    """
+    # Time-sensitive answers go stale and similar wording often asks about different events
+    if question_store is None or is_time_sensitive(question):
+        return None, None
+    try:
+        vector = embeddings.embed_query(question)
+        hits = question_store.search(vector, k=3)[0]
+    except Exception as e:
+        print(f"Error in semantic cache lookup: {e}")
+        return None, None
+    for _, similarity, meta in hits:
+        if similarity < SEMANTIC_CACHE_THRESHOLD:
+            break
+        if meta["search_engine"] != search_engine or meta.get("mode", DEFAULT_MODE) != mode:
+            continue
+        cached_answer = answer_cache.get(answer_cache_key(meta["question"], search_engine, mode))
+        if cached_answer is not None:
+            print(f"Semantic cache hit for: '{question}' (similar to '{meta['question']}', {similarity:.3f})")
+            metrics.inc("semantic_cache_lookups_total", outcome="hit")
+            return cached_answer, vector
+    metrics.inc("semantic_cache_lookups_total", outcome="miss")
+    return None, vector
+
+def remember_question(
+    question: str,
+    search_engine: str,
+    vector: Optional[List[float]],
+    mode: str = DEFAULT_MODE
+) -> None:
+    """Add an answered question to the embedding store for semantic cache lookups."""
+    if question_store is None or vector is None:
+        return
+    try:
+        question_store.add(
+            [f"{search_engine}:{mode}:{normalize_query(question)}"],
+            [vector],
+            [{"question": question, "search_engine": search_engine, "mode": mode}]
+        )
+        # Merging segments can take seconds on large stores, so it runs off the request path
+        if question_store.segment_count > EMBEDDING_COMPACT_SEGMENTS:
+            question_store.compact_in_background()
+    except Exception as e:
+        print(f"Error updating embedding store: {e}")
+
+def generate_answer(
+    question: str,
+    search_engine: str = DEFAULT_SEARCH_ENGINE,
+    deadline: Optional[Deadline] = None,
+    mode: str = DEFAULT_MODE,
+    progress: Optional[Callable[..., None]] = None,
+    usage: Optional[RequestUsage] = None,
+    callbacks: Optional[List[Any]] = None
+) -> str:
+    """
+    Generate an answer for a question, using the answer cache when possible.
+    Unlike answer_question, errors are raised to the caller.
     
     Args:
         question: The user's question
         search_engine: Which search engine to use
+        deadline: Request deadline; stages degrade gracefully as it nears
+        mode: Search mode whose profile shapes the pipeline
+        progress: Optional callback receiving partial results as keyword
+            arguments (stage, sources) while the answer is generated
+        usage: Request usage receiving context size, tokens and cost; added
+            to the per-mode and per-client totals when the answer is done
+        callbacks: LangChain callback handlers for the chain run, e.g. to time runnables
     
     Returns:
         str: Response with answer, citations, and follow-up questions
     """
+    # Validate search engine and mode choice
+    search_engine = normalize_search_engine(search_engine)
+    profile = profile_for(mode)
+    mode = profile.name
+    if usage is None:
+        usage = RequestUsage(mode=mode)
+    usage.mode = mode
+    
     try:
-        # Validate search engine choice
-        if search_engine not in SEARCH_ENGINES:
-            search_engine = DEFAULT_SEARCH_ENGINE
-            
-        # Update the template to include search engine info
-        updated_template = template + f"\nSearch performed using: {{search_engine}}\n"
-        updated_prompt = PromptTemplate(
-            input_variables=["context", "question", "current_date", "current_time", "search_engine"],
-            template=updated_template
-        )
+        cache_key = answer_cache_key(question, search_engine, mode)
+        cached_answer = answer_cache.get(cache_key)
+        if cached_answer is not None:
+            return cached_answer
         
-        # Create a temporary chain with the updated prompt
+        similar_answer, question_vector = find_similar_answer(question, search_engine, mode)
+        if similar_answer is not None:
+            return similar_answer
+        
+        if progress is not None:
+            progress(stage="searching")
+            
+        # Create a temporary chain that routes the prompt to a model tier
         temp_chain = (
-            RunnableLambda(lambda q: process_with_date(q, search_engine))
-            | updated_prompt
-            | model
-            | StrOutputParser()
+            RunnableLambda(lambda q: process_with_date(q, search_engine, deadline, profile, progress, usage),
+                           name="process_with_date")
+            | RunnableLambda(lambda inputs: invoke_routed_model(inputs, deadline, profile.model_tier, usage),
+                             name="invoke_routed_model")
         )
         
-        return temp_chain.invoke(question)
+        # Concurrent misses for the same question are collapsed into one model call;
+        # answers degraded to meet a deadline are not cached
+        answer = answer_cache.get_or_compute(
+            cache_key,
+            lambda: temp_chain.invoke(question, config={"callbacks": callbacks}),
+            ttl=cache_ttl_for(question, ANSWER_CACHE_TTL if profile.cache_ttl is None else profile.cache_ttl),
+            cacheable=lambda _: not (deadline and deadline.degraded),
+            deadline=deadline
+        )
+        if deadline and deadline.degraded:
+            metrics.inc("deadline_degraded_total")
+        else:
+            remember_question(question, search_engine, question_vector, mode)
+        return answer
+    finally:
+        usage_ledger.record(usage)
+
+def answer_question(
+    question: str,
+    search_engine: str = DEFAULT_SEARCH_ENGINE,
+    deadline: Optional[Deadline] = None,
+    mode: str = DEFAULT_MODE,
+    usage: Optional[RequestUsage] = None,
+    callbacks: Optional[List[Any]] = None
+) -> str:
+    """
+    Process a user question and return an answer with citations and follow-up questions.
+    
+    Args:
+        question: The user's question
+        search_engine: Which search engine to use
+        deadline: Request deadline (defaults to REQUEST_DEADLINE_SECONDS from now)
+        mode: Search mode ('search', 'focus', 'scholar', 'youtube' or a configured profile)
+        usage: Request usage receiving context size, tokens and cost
+        callbacks: LangChain callback handlers for the chain run
+    
+    Returns:
+        str: Response with answer, citations, and follow-up questions
+    """
+    if deadline is None:
+        deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+    mode = profile_for(mode).name
+    metrics.inc("search_mode_requests_total", mode=mode)
+    start = time.monotonic()
+    try:
+        return generate_answer(
+            question, search_engine=search_engine, deadline=deadline, mode=mode, usage=usage, callbacks=callbacks
+        )
     except Exception as e:
-        return f"An error occurred while processing your question: {str(e)}"
+        deadline.fail(str(e))
+        return f"{ERROR_ANSWER_PREFIX}{str(e)}"
+    finally:
+        metrics.observe("answer_duration_seconds", time.monotonic() - start, mode=mode)
+
+def load_top_queries(log_path: str, top_k: int = 200, hours: float = 24) -> List[Dict[str, Any]]:
+    """
+    Read the query log and return the most frequent recent questions
+    
+    Args:
+        log_path: Path to the JSONL query log
+        top_k: Number of questions to return
+        hours: Only consider queries logged within this many hours
+        
+    Returns:
+        List of dicts with question, search_engine, mode and count, most frequent first
+    """
+    cutoff = time.time() - hours * 3600
+    counts = Counter()
+    originals = {}
+    
+    with open(log_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry.get("ts", 0) < cutoff or not entry.get("question"):
+                continue
+            engine = entry.get("search_engine", DEFAULT_SEARCH_ENGINE)
+            key = (normalize_query(entry["question"]), engine, entry.get("mode", DEFAULT_MODE))
+            counts[key] += 1
+            # Replay the first phrasing seen for each normalized question
+            originals.setdefault(key, entry["question"])
+    
+    return [
+        {"question": originals[key], "search_engine": key[1], "mode": key[2], "count": count}
+        for key, count in counts.most_common(top_k)
+    ]
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Check whether an exception was caused by a provider rate limit."""
+    text = f"{type(error).__name__} {error}".lower()
+    return "ratelimit" in text or "rate limit" in text or "429" in text
+
+def cost_report(usage: Optional[RequestUsage], repeats: int) -> Dict[str, Any]:
+    """Token and cost fields of a prewarm report; the cost saved covers every expected repeat."""
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0, "saved_cost_usd": 0.0}
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "cost_usd": usage.cost_usd,
+        "saved_cost_usd": usage.cost_usd * repeats
+    }
+
+def prewarm_caches(
+    log_path: str,
+    top_k: int = 200,
+    hours: float = 24,
+    concurrency: int = 4,
+    queries_per_minute: float = 60,
+    max_retries: int = 3,
+    api_url: str = ""
+) -> List[Dict[str, Any]]:
+    """
+    Replay the most frequent recent questions to warm the search and answer caches
+    
+    Args:
+        log_path: Path to the JSONL query log
+        top_k: Number of distinct questions to replay
+        hours: Only replay questions logged within this many hours
+        concurrency: Maximum number of questions processed at once
+        queries_per_minute: Maximum rate at which questions are started
+        max_retries: Retries with exponential backoff after a rate-limit error
+        api_url: Replay through a running API server instead of in-process
+        
+    Returns:
+        List of per-query reports with duration, tokens and cost, and the
+        time and cost saved for the expected repeats
+    """
+    queries = load_top_queries(log_path, top_k=top_k, hours=hours)
+    min_interval = 60.0 / queries_per_minute if queries_per_minute > 0 else 0
+    pacing_lock = threading.Lock()
+    next_start = [time.monotonic()]
+    
+    def wait_for_slot(delay: float = 0):
+        # Space out query starts and push back every worker after a rate limit
+        with pacing_lock:
+            start = max(next_start[0], time.monotonic() + delay)
+            next_start[0] = start + min_interval
+        time.sleep(max(0.0, start - time.monotonic()))
+    
+    def run_query(item):
+        if not api_url and answer_cache.get(answer_cache_key(item["question"], item["search_engine"], item.get("mode", DEFAULT_MODE))) is not None:
+            return {**item, "status": "already_warm", "seconds": 0.0, "saved_seconds": 0.0, **cost_report(None, 0)}
+        
+        backoff = 0.0
+        for attempt in range(max_retries + 1):
+            wait_for_slot(backoff)
+            start = time.monotonic()
+            usage = RequestUsage(mode=item.get("mode", DEFAULT_MODE))
+            try:
+                if api_url:
+                    response = requests.post(
+                        f"{api_url.rstrip('/')}/api/ask",
+                        json={"question": item["question"], "search_engine": item["search_engine"], "mode": item.get("mode", DEFAULT_MODE)},
+                        timeout=300
+                    )
+                    if response.status_code == 429:
+                        raise RuntimeError(f"429 rate limited: {response.text}")
+                    response.raise_for_status()
+                    usage_report = response.json().get("usage") or {}
+                    usage.prompt_tokens = usage_report.get("prompt_tokens", 0)
+                    usage.completion_tokens = usage_report.get("completion_tokens", 0)
+                    usage.cost_usd = usage_report.get("cost_usd", 0.0)
+                else:
+                    generate_answer(
+                        item["question"], search_engine=item["search_engine"], mode=item.get("mode", DEFAULT_MODE),
+                        usage=usage
+                    )
+            except Exception as e:
+                if is_rate_limit_error(e) and attempt < max_retries:
+                    backoff = max(1.0, backoff * 2)
+                    print(f"Rate limited while prewarming, backing off {backoff:.0f}s")
+                    continue
+                return {**item, "status": f"error: {e}", "seconds": time.monotonic() - start, "saved_seconds": 0.0,
+                        **cost_report(usage, 0)}
+            
+            seconds = time.monotonic() - start
+            # Every expected repeat of the question is now served from the cache
+            return {**item, "status": "warmed", "seconds": seconds, "saved_seconds": seconds * item["count"],
+                    **cost_report(usage, item["count"])}
+    
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return list(executor.map(run_query, queries))
+
+def prewarm_main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Prewarm the search and answer caches from a query log")
+    parser.add_argument("--log", default=QUERY_LOG_PATH, help="Path to the JSONL query log")
+    parser.add_argument("--top-k", type=int, default=200, help="Number of distinct questions to replay")
+    parser.add_argument("--hours", type=float, default=24, help="Only replay questions from the last N hours")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum questions processed at once")
+    parser.add_argument("--rate", type=float, default=60, help="Maximum questions started per minute")
+    parser.add_argument("--api-url", default="", help="Replay through a running API server, e.g. http://localhost:8000")
+    args = parser.parse_args(argv)
+    
+    if not args.log:
+        parser.error("no query log given (use --log or set QUERY_LOG_PATH)")
+    
+    print(f"Prewarming caches from {args.log} (top {args.top_k} questions, last {args.hours:g}h)")
+    reports = prewarm_caches(
+        args.log,
+        top_k=args.top_k,
+        hours=args.hours,
+        concurrency=args.concurrency,
+        queries_per_minute=args.rate,
+        api_url=args.api_url
+    )
+    
+    for report in reports:
+        print(f"{report['seconds']:7.2f}s  ${report['cost_usd']:.4f}  {report['prompt_tokens'] + report['completion_tokens']:>6} tok  "
+              f"x{report['count']:<4} {report['status']:<14} [{report['search_engine']}] {report['question']}")
+    
+    total_seconds = sum(r["seconds"] for r in reports)
+    saved_seconds = sum(r["saved_seconds"] for r in reports)
+    warmed = sum(1 for r in reports if r["status"] == "warmed")
+    print("\n" + "-"*50)
+    print(f"Warmed {warmed}/{len(reports)} questions in {total_seconds:.1f}s of pipeline time")
+    print(f"Estimated time saved for repeat traffic: {saved_seconds:.1f}s")
+    print(f"Prewarm cost: ${sum(r['cost_usd'] for r in reports):.4f}, "
+          f"estimated cost saved for repeat traffic: ${sum(r['saved_cost_usd'] for r in reports):.4f}")
 
 def main():
     print("🔍 Web Search RAG Assistant 🔍")
@@ -490,7 +1954,7 @@ def main():
         # Check for engine change command
         if command.lower().startswith("engine:"):
             new_engine = command.lower().split(":", 1)[1].strip()
-            if new_engine in SEARCH_ENGINES:
+            if normalize_search_engine(new_engine) == new_engine:
                 current_engine = new_engine
                 print(f"Search engine changed to: {current_engine}")
             else:
@@ -505,4 +1969,7 @@ def main():
         print("\n" + "-"*50)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "prewarm":
+        prewarm_main(sys.argv[2:])
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,88 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Tuple
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metrics:
+    """
+    Minimal thread-safe in-process metrics registry with counters, gauges and
+    summaries (count and sum), rendered in the Prometheus text format
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._summaries = defaultdict(lambda: [0, 0.0])
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """Increase a counter."""
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        """Set a gauge to the given value."""
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def add_gauge(self, name: str, value: float, **labels) -> None:
+        """Add to a gauge, e.g. +1/-1 around an in-flight operation."""
+        with self._lock:
+            key = (name, _label_key(labels))
+            self._gauges[key] = self._gauges.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record an observation, e.g. a latency in seconds."""
+        with self._lock:
+            summary = self._summaries[(name, _label_key(labels))]
+            summary[0] += 1
+            summary[1] += value
+
+    def get(self, name: str, **labels) -> float:
+        """Return the current value of a counter or gauge."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            if key in self._gauges:
+                return self._gauges[key]
+            return self._counters.get(key, 0.0)
+
+    def snapshot(self) -> dict:
+        """Return all metrics as a JSON-friendly dict."""
+        def fmt(name, labels):
+            if not labels:
+                return name
+            return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+        with self._lock:
+            return {
+                "counters": {fmt(*key): value for key, value in self._counters.items()},
+                "gauges": {fmt(*key): value for key, value in self._gauges.items()},
+                "summaries": {
+                    fmt(*key): {"count": count, "sum": total}
+                    for key, (count, total) in self._summaries.items()
+                }
+            }
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        def fmt(name, labels, suffix=""):
+            label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+            return f"{name}{suffix}{{{label_str}}}" if label_str else f"{name}{suffix}"
+
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{fmt(name, labels)} {value}")
+            for (name, labels), value in sorted(self._gauges.items()):
+                lines.append(f"{fmt(name, labels)} {value}")
+            for (name, labels), (count, total) in sorted(self._summaries.items()):
+                lines.append(f"{fmt(name, labels, '_count')} {count}")
+                lines.append(f"{fmt(name, labels, '_sum')} {total}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared registry used across the application
+metrics = Metrics()
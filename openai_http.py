@@ -0,0 +1,121 @@
+import importlib.util
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import httpx
+
+from metrics import metrics
+
+DEFAULT_OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+
+def make_http_client(
+    max_connections: int = 50,
+    keepalive_expiry: float = 120,
+    http2: bool = True,
+    connect_timeout: float = 5,
+    read_timeout: float = 60
+) -> httpx.Client:
+    """
+    Create the HTTP client shared by the OpenAI models
+
+    Args:
+        max_connections: Size of the connection pool, all kept alive when idle
+        keepalive_expiry: Seconds idle connections are kept open
+        http2: Use HTTP/2 when the h2 package is installed
+        connect_timeout: Timeout for opening a connection, in seconds
+        read_timeout: Default timeout for reading a response (requests bound to a deadline override it)
+
+    Returns:
+        A pooled httpx client
+    """
+    if http2 and importlib.util.find_spec("h2") is None:
+        print("The h2 package is not installed, using HTTP/1.1 for the OpenAI API")
+        http2 = False
+    return httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry
+        ),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+    )
+
+
+class ConnectionWarmer:
+    """
+    Opens connections to the model API ahead of traffic so the first request
+    on a worker does not pay DNS, TCP and TLS setup, and keeps them open
+    during idle periods with a cheap request (listing models) whenever no
+    request has used the client for an interval.
+    """
+    def __init__(self, client: httpx.Client, base_url: str = DEFAULT_OPENAI_BASE_URL,
+                 api_key: str = "", interval: float = 60):
+        """
+        Initialize the warmer
+
+        Args:
+            client: Client shared by the models
+            base_url: API base URL the models use
+            api_key: Sent with the warm-up requests; any response, even an
+                error, leaves a warm connection in the pool
+            interval: Idle seconds before a keep-warm request (0 disables keep-warm)
+        """
+        self.client = client
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.interval = interval
+        self.ready = False
+        self.last_used = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Every request through the client counts as activity
+        client.event_hooks["request"].append(self.touch)
+
+    def touch(self, request: Optional[httpx.Request] = None) -> None:
+        self.last_used = time.monotonic()
+
+    def _ping(self) -> bool:
+        try:
+            self.client.get(f"{self.base_url}/models", headers={"Authorization": f"Bearer {self.api_key}"})
+            return True
+        except httpx.HTTPError as e:
+            print(f"Error warming model API connection: {e}")
+            return False
+
+    def warm(self, connections: int = 2) -> int:
+        """
+        Open connections to the API with concurrent requests
+
+        Args:
+            connections: Number of connections to open
+
+        Returns:
+            Number of requests that reached the API
+        """
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, connections)) as executor:
+            warmed = sum(executor.map(lambda _: self._ping(), range(connections)))
+        elapsed = time.monotonic() - start
+        metrics.observe("model_api_warmup_seconds", elapsed)
+        print(f"Warmed {warmed} of {connections} model API connections in {elapsed * 1000:.0f}ms")
+        self.ready = True
+        return warmed
+
+    def start(self) -> None:
+        """Start the keep-warm thread."""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._keep_warm, name="model-keep-warm", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _keep_warm(self) -> None:
+        while not self._stop.wait(self.interval / 2):
+            if time.monotonic() - self.last_used >= self.interval:
+                metrics.inc("model_api_keep_warm_total", outcome="ok" if self._ping() else "error")
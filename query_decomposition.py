@@ -0,0 +1,180 @@
+import re
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+# Phrases that introduce the compared aspects: "compare X and Y in terms of price"
+ASPECT_MARKERS = [" in terms of ", " regarding ", " with respect to ", " when it comes to "]
+
+# Prepositions introducing a context shared by all subjects, kept in every
+# sub-query: "a list and a tuple in Python" -> "list in Python", "tuple in Python"
+CONTEXT_MARKERS = [" for ", " on ", " in ", " with ", " using ", " under "]
+
+# Words that cannot be searched on their own as a compared subject
+NON_SUBJECTS = {
+    "it", "its", "this", "that", "these", "those", "them", "they", "other", "others", "another", "more", "less",
+    "both", "either", "neither", "which", "what", "one", "ones", "same", "else", "etc", "so", "on"
+}
+
+# Words that usually start the aspect part when there is no marker:
+# "compare X and Y pricing and performance"
+ASPECT_WORDS = {
+    "price", "prices", "pricing", "cost", "costs", "performance", "speed", "latency", "features",
+    "specs", "specifications", "benefits", "quality", "reliability", "security", "safety",
+    "battery", "size", "weight", "efficiency", "accuracy", "popularity", "usage", "history",
+    "reviews", "ratings", "pros", "advantages", "disadvantages", "differences", "support",
+    "ecosystem", "licensing", "scalability", "availability", "camera", "display", "screen", "design"
+}
+
+# Question shapes naming the things being compared
+COMPARISON_PATTERNS = [
+    re.compile(r"^(?:what(?:'s| is| are) the )?differences? between (?P<subjects>.+)$", re.IGNORECASE),
+    re.compile(r"^(?:compare|comparing|comparison of|contrast)\s+(?P<subjects>.+)$", re.IGNORECASE),
+    re.compile(r"^(?:which is better|which one is better|should i (?:use|choose|buy|pick))[,:]?\s+(?P<subjects>.+)$",
+               re.IGNORECASE),
+    re.compile(r"^(?P<subjects>.+?\s(?:vs\.?|versus)\s.+)$", re.IGNORECASE),
+]
+
+SUBJECT_SEPARATOR = re.compile(r"\s*(?:,\s*(?:and|or)\s+|,\s*|\s+vs\.?\s+|\s+versus\s+|\s+and\s+|\s+or\s+)\s*",
+                               re.IGNORECASE)
+# "vs" separates whole subjects, so "Tom and Jerry vs Looney Tunes" keeps "Tom and Jerry"
+VERSUS_SEPARATOR = re.compile(r"\s+(?:vs\.?|versus)\s+", re.IGNORECASE)
+
+
+def _split_aspects(text: str) -> Tuple[str, str]:
+    """Split "X and Y pricing and performance" into the subject and aspect parts."""
+    lowered = text.lower()
+    for marker in ASPECT_MARKERS + CONTEXT_MARKERS:
+        index = lowered.find(marker)
+        if index > 0:
+            # Context markers stay with the aspect: "tuple in Python" -> "in Python"
+            return text[:index], text[index + (1 if marker in CONTEXT_MARKERS else len(marker)):]
+    words = text.split()
+    # The aspect part starts at the first aspect word after at least two subject words
+    for i in range(2, len(words)):
+        if words[i].lower().strip(",.?!") in ASPECT_WORDS:
+            return " ".join(words[:i]), " ".join(words[i:])
+    return text, ""
+
+
+def _is_subject(subject: str) -> bool:
+    """Whether a split-off part names something searchable on its own (not "3", "it" or "a")."""
+    words = re.findall(r"[^\W\d_][\w'+#.-]*", subject)
+    if not words:
+        return False
+    if len(words) == 1:
+        word = words[0].lower()
+        return len(word) >= 2 and word not in NON_SUBJECTS and word not in ASPECT_WORDS
+    return True
+
+
+def decompose_question(question: str, max_subqueries: int = 3) -> List[str]:
+    """
+    Split a multi-part question into independent search queries using local
+    heuristics: several questions in one ("What is X? How does Y work?") and
+    comparisons ("compare X and Y pricing", "X vs Y", "difference between X and Y")
+
+    Args:
+        question: The user's question
+        max_subqueries: Maximum number of sub-queries to return
+
+    Returns:
+        Sub-queries, or an empty list when the question does not look multi-part
+    """
+    text = re.sub(r"\s+", " ", question).strip()
+
+    # Several questions asked at once
+    parts = [part.strip() for part in re.split(r"(?<=\?)\s+", text) if len(part.strip().split()) >= 3]
+    if len(parts) > 1:
+        return parts[:max_subqueries]
+
+    text = text.rstrip("?!. ")
+    for pattern in COMPARISON_PATTERNS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        subjects_text, aspects = _split_aspects(match.group("subjects"))
+        separator = VERSUS_SEPARATOR if VERSUS_SEPARATOR.search(subjects_text) else SUBJECT_SEPARATOR
+        subjects = [s.strip(" ,") for s in separator.split(subjects_text) if s.strip(" ,")]
+        subjects = [re.sub(r"^(?:the|a|an)\s+", "", s, flags=re.IGNORECASE) for s in subjects]
+        # Elliptical parts ("Python 2 and 3") cannot be searched alone; search the question as is
+        if len(subjects) < 2 or not all(_is_subject(subject) for subject in subjects):
+            return []
+        return [f"{subject} {aspects}".strip() for subject in subjects[:max_subqueries]]
+    return []
+
+
+DECOMPOSITION_PROMPT = """Split the question below into at most {max_subqueries} independent web search queries that together cover every part of it.
+Return one query per line with no numbering or commentary. If the question asks about a single thing, return it unchanged on one line.
+
+Question: {question}"""
+
+
+def llm_decompose(question: str, model: Any, max_subqueries: int = 3) -> List[str]:
+    """
+    Ask a chat model to split a question into search queries
+
+    Args:
+        question: The user's question
+        model: LangChain chat model
+        max_subqueries: Maximum number of sub-queries to return
+
+    Returns:
+        Sub-queries, or an empty list when the model returned a single query
+    """
+    response = model.invoke(DECOMPOSITION_PROMPT.format(question=question, max_subqueries=max_subqueries))
+    content = getattr(response, "content", response)
+    lines = [re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line).strip() for line in str(content).splitlines()]
+    queries = list(dict.fromkeys(line for line in lines if line))
+    return queries[:max_subqueries] if len(queries) > 1 else []
+
+
+def url_key(url: str) -> str:
+    """Normalize a URL so trivially different links to the same page compare equal."""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return f"{host}{parts.path.rstrip('/')}{'?' + parts.query if parts.query else ''}"
+
+
+def merge_results(result_lists: List[List[Dict]], max_results: int, primary_results: int = 0) -> List[Dict]:
+    """
+    Merge the results of several sub-queries into one list, taking them in
+    turn from each sub-query so every part of the question is covered, and
+    dropping duplicate pages and placeholder results
+
+    Args:
+        result_lists: Results per sub-query, in sub-query order
+        max_results: Maximum number of results to keep
+        primary_results: Results of the first list (the original question)
+            kept in order ahead of the others, up to this many
+
+    Returns:
+        Merged search result dictionaries
+    """
+    usable = [
+        [r for r in results if r.get("url") and r.get("source") != "no_results" and not r.get("source", "").endswith("_error")]
+        for results in result_lists
+    ]
+    merged, seen = [], set()
+
+    def take(result: Dict) -> None:
+        key = url_key(result["url"])
+        if key not in seen and len(merged) < max_results:
+            seen.add(key)
+            merged.append(result)
+
+    if primary_results and usable:
+        for result in usable[0][:primary_results]:
+            take(result)
+        usable = [usable[0][primary_results:]] + usable[1:]
+    position = 0
+    while len(merged) < max_results and any(position < len(results) for results in usable):
+        for results in usable:
+            if position < len(results):
+                take(results[position])
+        position += 1
+    if merged:
+        return merged
+    # Nothing usable: keep the first sub-query's errors or "no results" marker
+    return next((results for results in result_lists if results), [])[:max_results]
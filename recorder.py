@@ -0,0 +1,205 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.runnables import RunnableLambda
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ReplayMiss(LookupError):
+    """Raised in replay mode when the corpus holds no response for a request"""
+
+
+def request_key(kind: str, request: Dict[str, Any]) -> str:
+    """Stable identifier of a recorded request."""
+    return kind + ":" + json.dumps(request, sort_keys=True, default=str)
+
+
+def read_corpus(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over the records of a corpus file
+
+    Args:
+        path: Corpus path; files ending in .zst are zstd-compressed, anything else gzip
+
+    Yields:
+        Record dictionaries in the order they were written
+    """
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("Reading a .zst corpus requires the zstandard package")
+        with open(path, "rb") as raw:
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            data = reader.read()
+    else:
+        with gzip.open(path, "rb") as f:
+            data = f.read()
+    for line in data.decode("utf-8").splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+
+class RecordedEmbeddings:
+    """Embeddings client whose calls go through a TrafficRecorder"""
+    def __init__(self, recorder: "TrafficRecorder", embeddings: Any, request: Dict[str, Any]):
+        self.recorder = recorder
+        self.embeddings = embeddings
+        self.request = request
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+        return self.recorder.call(
+            "embedding", {**self.request, "texts": hashes}, lambda: self.embeddings.embed_documents(texts),
+            encode=lambda vectors: [[float(x) for x in vector] for vector in vectors]
+        )
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class TrafficRecorder:
+    """
+    Records search engine responses and model outputs to a compact JSONL
+    corpus (zstd, or gzip when zstandard is not installed), or replays them
+    from it instead of calling the network.
+
+    In record mode every record is written as its own compressed frame or
+    gzip member, so a corpus stays readable when the process is killed.
+    In replay mode each recorded latency is slept for, divided by the replay
+    speed (0 replays instantly); repeated requests cycle through their
+    recorded responses in order.
+    """
+    def __init__(self, mode: str = "off", path: Optional[str] = None, speed: float = 1.0):
+        """
+        Initialize the recorder
+
+        Args:
+            mode: "off", "record" or "replay"
+            path: Corpus path (".zst" suffix for zstd)
+            speed: Replay speed relative to the recorded latencies
+        """
+        if mode not in ("off", "record", "replay"):
+            raise ValueError(f"Unknown record mode: {mode}")
+        if mode != "off" and not path:
+            raise ValueError(f"Record mode '{mode}' needs a corpus path")
+        self.mode = mode
+        self.path = path
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._records: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._positions: Dict[str, int] = defaultdict(int)
+        if mode == "record" and path.endswith(".zst") and zstandard is None:
+            # Keep the corpus readable by read_corpus
+            self.path = path[:-len(".zst")] + ".gz"
+            print(f"zstandard is not installed, recording to {self.path} instead")
+        if mode == "replay":
+            for record in read_corpus(path):
+                self._records[request_key(record["kind"], record["request"])].append(record)
+            print(f"Loaded {sum(len(r) for r in self._records.values())} recorded responses from {path}")
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def records(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return the loaded replay records, optionally of one kind only."""
+        return [r for records in self._records.values() for r in records if kind is None or r["kind"] == kind]
+
+    def call(
+        self,
+        kind: str,
+        request: Dict[str, Any],
+        fetch: Callable[[], Any],
+        encode: Callable[[Any], Any] = lambda value: value,
+        decode: Callable[[Any], Any] = lambda value: value
+    ) -> Any:
+        """
+        Fetch a response, recording or replaying it depending on the mode
+
+        Args:
+            kind: Response source, e.g. "tavily", "searxng" or "llm"
+            request: JSON-serializable parameters identifying the request
+            fetch: Function performing the real call
+            encode: Converts the response to a JSON-serializable value
+            decode: Converts a recorded value back to a response
+
+        Returns:
+            The live, or replayed, response
+        """
+        if self.mode == "replay":
+            return decode(self._replay(kind, request))
+        if self.mode == "off":
+            return fetch()
+        start = time.monotonic()
+        response = fetch()
+        self._write({
+            "kind": kind,
+            "request": request,
+            "response": encode(response),
+            "latency": time.monotonic() - start,
+            "recorded_at": time.time()
+        })
+        return response
+
+    def wrap_model(self, model, request: Dict[str, Any], kind: str = "llm"):
+        """
+        Wrap a chat model so its output message is recorded or replayed
+
+        Args:
+            model: Chat model (or bound model) to call when not replaying
+            request: Parameters identifying the call; the prompt itself contains
+                timestamps, so callers pass e.g. the question and model tier
+            kind: Record kind; answer calls use "llm", other model calls their own kind
+        """
+        if self.mode == "off":
+            return model
+        return RunnableLambda(lambda prompt_value: self.call(
+            kind, request, lambda: model.invoke(prompt_value),
+            encode=message_to_dict,
+            decode=lambda data: messages_from_dict([data])[0]
+        ))
+
+    def wrap_embeddings(self, embeddings, request: Dict[str, Any]):
+        """
+        Wrap an embeddings client so its vectors are recorded or replayed
+
+        Args:
+            embeddings: Client with embed_documents and embed_query methods
+            request: Parameters identifying the calls, e.g. the model; the
+                texts are identified by their hashes
+        """
+        if self.mode == "off":
+            return embeddings
+        return RecordedEmbeddings(self, embeddings, request)
+
+    def _replay(self, kind: str, request: Dict[str, Any]) -> Any:
+        key = request_key(kind, request)
+        with self._lock:
+            records = self._records.get(key)
+            if not records:
+                raise ReplayMiss(f"No recorded {kind} response for {request}")
+            record = records[self._positions[key] % len(records)]
+            self._positions[key] += 1
+        if self.speed > 0:
+            time.sleep(record.get("latency", 0) / self.speed)
+        return record["response"]
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        line = (json.dumps(record, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            if self.path.endswith(".zst"):
+                frame = zstandard.ZstdCompressor(level=10).compress(line)
+                with open(self.path, "ab") as f:
+                    f.write(frame)
+            else:
+                with gzip.open(self.path, "ab") as f:
+                    f.write(line)
@@ -0,0 +1,196 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class RunTimingHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler recording the wall time of every runnable,
+    chat model and parser in a chain run, with its nesting depth
+    """
+    def __init__(self):
+        self._starts: Dict[UUID, Tuple[str, float, int]] = {}
+        self._depths: Dict[UUID, int] = {}
+        self._lock = threading.Lock()
+        self.timings: List[Dict[str, Any]] = []
+
+    def _start(self, name: str, run_id: UUID, parent_run_id: Optional[UUID]) -> None:
+        with self._lock:
+            depth = self._depths.get(parent_run_id, -1) + 1 if parent_run_id else 0
+            self._depths[run_id] = depth
+            self._starts[run_id] = (name, time.perf_counter(), depth)
+
+    def _end(self, run_id: UUID, error: bool = False) -> None:
+        with self._lock:
+            entry = self._starts.pop(run_id, None)
+            if entry is None:
+                return
+            name, start, depth = entry
+            self.timings.append({
+                "name": name,
+                "depth": depth,
+                "start": start,
+                "seconds": time.perf_counter() - start,
+                "error": error
+            })
+
+    @staticmethod
+    def _name(serialized: Optional[Dict[str, Any]], kwargs: Dict[str, Any], default: str) -> str:
+        if kwargs.get("name"):
+            return kwargs["name"]
+        serialized = serialized or {}
+        return serialized.get("name") or (serialized.get("id") or [default])[-1]
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._start(self._name(serialized, kwargs, "chain"), run_id, parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(self._name(serialized, kwargs, "chat_model"), run_id, parent_run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(self._name(serialized, kwargs, "llm"), run_id, parent_run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Timings in start order, as name, nesting depth and milliseconds."""
+        with self._lock:
+            timings = sorted(self.timings, key=lambda timing: timing["start"])
+        return [
+            {"name": t["name"], "depth": t["depth"], "ms": round(t["seconds"] * 1000, 2), "error": t["error"]}
+            for t in timings
+        ]
+
+    def log(self, label: str = "") -> None:
+        print(f"Runnable timings{' for ' + label if label else ''}:")
+        for timing in self.report():
+            print(f"  {'  ' * timing['depth']}{timing['name']}: {timing['ms']:.1f}ms{' (error)' if timing['error'] else ''}")
+
+
+class RequestProfile:
+    """
+    Sampling profiler attached to the thread handling one request. A sampler
+    thread reads that thread's stack every interval while the request runs,
+    so requests that are not profiled pay nothing. The samples are exported
+    in the speedscope format (https://www.speedscope.app) together with the
+    LangChain runnable timings.
+    """
+    def __init__(self, name: str, interval: float = 0.005):
+        """
+        Initialize the profile
+
+        Args:
+            name: Label shown in speedscope, e.g. the question
+            interval: Seconds between stack samples
+        """
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.interval = interval
+        self.callbacks = RunTimingHandler()
+        self._frames: Dict[Tuple[str, str, int], int] = {}
+        self._samples: List[List[int]] = []
+        self._weights: List[float] = []
+        self._stop = threading.Event()
+        self._thread_id: Optional[int] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._started = 0.0
+        self._elapsed = 0.0
+
+    def __enter__(self) -> "RequestProfile":
+        self._thread_id = threading.get_ident()
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._sampler.join()
+        self._elapsed = time.perf_counter() - self._started
+
+    def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call func in the current thread with the profiler attached."""
+        with self:
+            return func(*args, **kwargs)
+
+    def _frame_index(self, frame) -> int:
+        code = frame.f_code
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self._frames.get(key)
+        if index is None:
+            index = self._frames[key] = len(self._frames)
+        return index
+
+    def _sample(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_index(frame))
+                frame = frame.f_back
+            stack.reverse()
+            self._samples.append(stack)
+            self._weights.append(now - last)
+            last = now
+
+    def to_speedscope(self) -> Dict[str, Any]:
+        """The profile as a speedscope JSON document."""
+        frames = [{"name": name, "file": file, "line": line} for (name, file, line) in self._frames]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "request_profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self._elapsed,
+                "samples": self._samples,
+                "weights": self._weights
+            }],
+            # Not part of the speedscope schema; ignored by the viewer
+            "runnableTimings": self.callbacks.report()
+        }
+
+    def save(self, directory: str) -> str:
+        """Write the speedscope profile to directory and return its path."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.id}.speedscope.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_speedscope(), f)
+        return path
+
+
+def load_profile(directory: str, profile_id: str) -> Optional[Dict[str, Any]]:
+    """Read a saved profile, or None if there is none with that ID."""
+    if not profile_id.isalnum():
+        return None
+    try:
+        with open(os.path.join(directory, f"{profile_id}.speedscope.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except OSError:
+        return None
@@ -0,0 +1,329 @@
+import asyncio
+import importlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+from metrics import metrics
+from tavily_async import BackgroundLoop, LatencyTracker
+
+
+class SearchEngine:
+    """
+    Base class of search engine plugins. Subclasses set a unique name and
+    implement search; asearch runs search in a worker thread unless an engine
+    has a native async client. Results are dictionaries with at least title,
+    url, content and source keys, as produced by search_tavily. Keyword
+    options are hints from the search mode (categories, include_domains) that
+    engines may ignore.
+    """
+    name: str = ""
+    description: str = ""
+    # What the engine offers, e.g. "web", "news", "raw_content", "local"
+    capabilities: FrozenSet[str] = frozenset({"web"})
+    # Hints used for routing until enough latency has been measured
+    cost_per_query: float = 0.0
+    latency_hint: float = 1.0
+
+    def available(self) -> bool:
+        """Whether the engine is configured and can take queries."""
+        return True
+
+    @property
+    def native_async(self) -> bool:
+        """Whether asearch is native, so the registry awaits it instead of calling search in a thread."""
+        return type(self).asearch is not SearchEngine.asearch
+
+    def search(self, query: str, search_depth: str = "basic", max_results: int = 10,
+               timeout: Optional[float] = None, **options) -> List[Dict]:
+        raise NotImplementedError
+
+    async def asearch(self, query: str, search_depth: str = "basic", max_results: int = 10,
+                      timeout: Optional[float] = None, **options) -> List[Dict]:
+        return await asyncio.to_thread(self.search, query, search_depth, max_results, timeout, **options)
+
+
+class FunctionEngine(SearchEngine):
+    """Search engine plugin wrapping plain search functions"""
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        search: Callable[..., List[Dict]],
+        async_search: Optional[Callable[..., Any]] = None,
+        capabilities: Iterable[str] = ("web",),
+        cost_per_query: float = 0.0,
+        latency_hint: float = 1.0,
+        available: Callable[[], bool] = lambda: True
+    ):
+        """
+        Initialize the engine
+
+        Args:
+            name: Unique engine name used in search engine options
+            description: Human-readable name shown to clients
+            search: Function (query, search_depth, max_results, timeout, **options) -> results
+            async_search: Optional coroutine function with the same arguments
+            capabilities: What the engine offers, e.g. "web", "news", "local"
+            cost_per_query: Approximate cost of one query in USD
+            latency_hint: Expected latency in seconds before any is measured
+            available: Returns whether the engine is configured
+        """
+        self.name = name
+        self.description = description
+        self._search = search
+        self._async_search = async_search
+        self.capabilities = frozenset(capabilities)
+        self.cost_per_query = cost_per_query
+        self.latency_hint = latency_hint
+        self._available = available
+
+    def available(self) -> bool:
+        return self._available()
+
+    @property
+    def native_async(self) -> bool:
+        return self._async_search is not None
+
+    def search(self, query, search_depth="basic", max_results=10, timeout=None, **options):
+        return self._search(query, search_depth, max_results, timeout, **options)
+
+    async def asearch(self, query, search_depth="basic", max_results=10, timeout=None, **options):
+        if self._async_search is None:
+            return await super().asearch(query, search_depth, max_results, timeout, **options)
+        return await self._async_search(query, search_depth, max_results, timeout, **options)
+
+
+class EngineRegistry:
+    """
+    Registered search engines with their measured latency and error rate.
+    Queries any subset of engines in parallel under one shared time budget:
+    engines with a native async search run as coroutines on a shared event
+    loop, the others in a thread pool.
+    """
+    def __init__(self, max_workers: int = 16, min_samples: int = 10, loop: Optional[BackgroundLoop] = None):
+        """
+        Initialize the registry
+
+        Args:
+            max_workers: Worker threads shared by all engine queries
+            min_samples: Latency samples needed before measurements replace the latency hint
+            loop: Event loop for async engines, e.g. the one their clients are
+                bound to (created on first use when None)
+        """
+        self.min_samples = min_samples
+        self.loop = loop
+        self._engines: Dict[str, SearchEngine] = {}
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self._outcomes: Dict[str, Dict[str, int]] = {}
+        # Recent failures (True) and successes, so routing recovers after an outage
+        self._recent_failures: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+
+    def register(self, engine: SearchEngine) -> SearchEngine:
+        """Add an engine, replacing any engine of the same name."""
+        if not engine.name:
+            raise ValueError("Search engines need a name")
+        with self._lock:
+            self._engines[engine.name] = engine
+            self._latencies.setdefault(engine.name, LatencyTracker())
+            self._outcomes.setdefault(engine.name, {"ok": 0, "error": 0, "timeout": 0})
+            self._recent_failures.setdefault(engine.name, deque(maxlen=100))
+        return engine
+
+    def load_plugins(self, spec: str) -> List[SearchEngine]:
+        """
+        Import and register engines named in a comma-separated list of
+        "module:attribute" entries. The attribute may be an engine, a list of
+        engines, or a callable returning either.
+
+        Returns:
+            The engines registered
+        """
+        loaded = []
+        for entry in filter(None, (part.strip() for part in spec.split(","))):
+            module_name, _, attribute = entry.partition(":")
+            try:
+                target = getattr(importlib.import_module(module_name), attribute or "engine")
+                if callable(target) and not isinstance(target, SearchEngine):
+                    target = target()
+                for engine in target if isinstance(target, (list, tuple)) else [target]:
+                    loaded.append(self.register(engine))
+            except Exception as e:
+                print(f"Error loading search engine plugin '{entry}': {e}")
+        return loaded
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._engines
+
+    def __iter__(self) -> Iterator[SearchEngine]:
+        return iter(list(self._engines.values()))
+
+    def get(self, name: str) -> SearchEngine:
+        return self._engines[name]
+
+    def expected_latency(self, name: str) -> float:
+        """Median measured latency, or the engine's hint while there are few samples."""
+        tracker = self._latencies[name]
+        if len(tracker) < self.min_samples:
+            return self._engines[name].latency_hint
+        return tracker.quantile(0.5)
+
+    def error_rate(self, name: str) -> float:
+        """Share of the engine's recent queries that failed or timed out."""
+        with self._lock:
+            recent = list(self._recent_failures[name])
+        return sum(recent) / len(recent) if recent else 0.0
+
+    def fastest(self, count: int = 1, capability: Optional[str] = None) -> List[str]:
+        """
+        Pick the best available engines by measured performance
+
+        Args:
+            count: Number of engines to return
+            capability: Only consider engines offering this capability
+
+        Returns:
+            Engine names, best first; latency is penalized by the error rate
+            and ties go to the cheaper engine
+        """
+        candidates = [
+            engine for engine in self
+            if engine.available() and (capability is None or capability in engine.capabilities)
+        ]
+        candidates.sort(key=lambda engine: (
+            self.expected_latency(engine.name) * (1 + 4 * self.error_rate(engine.name)),
+            engine.cost_per_query
+        ))
+        return [engine.name for engine in candidates[:count]]
+
+    def record(self, name: str, seconds: float, outcome: str) -> None:
+        """Record the latency and outcome ("ok", "error" or "timeout") of one engine query."""
+        if outcome == "ok":
+            self._latencies[name].record(seconds)
+        with self._lock:
+            self._outcomes[name][outcome] += 1
+            self._recent_failures[name].append(outcome != "ok")
+        metrics.inc("search_engine_requests_total", engine=name, outcome=outcome)
+        metrics.observe("search_engine_latency_seconds", seconds, engine=name)
+
+    def _record_once(self, call: Dict[str, bool], name: str, seconds: float, outcome: str) -> None:
+        """Record a query's outcome unless one was already recorded for it (e.g. a timeout)."""
+        with self._lock:
+            if call["recorded"]:
+                return
+            call["recorded"] = True
+        self.record(name, seconds, outcome)
+
+    def _record_results(self, call: Dict[str, bool], name: str, start: float, results: List[Dict]) -> List[Dict]:
+        failed = any(r.get("source", "").endswith("_error") for r in results)
+        self._record_once(call, name, time.monotonic() - start, "error" if failed else "ok")
+        return results
+
+    def _timed_search(self, call: Dict[str, bool], name: str, query: str, search_depth: str, max_results: int,
+                      timeout: Optional[float], options: Dict[str, Any]) -> List[Dict]:
+        start = time.monotonic()
+        try:
+            results = self._engines[name].search(query, search_depth, max_results, timeout, **options)
+        except Exception:
+            self._record_once(call, name, time.monotonic() - start, "error")
+            raise
+        return self._record_results(call, name, start, results)
+
+    async def _atimed_search(self, call: Dict[str, bool], name: str, query: str, search_depth: str,
+                             max_results: int, timeout: Optional[float], options: Dict[str, Any]) -> List[Dict]:
+        start = time.monotonic()
+        try:
+            results = await self._engines[name].asearch(query, search_depth, max_results, timeout, **options)
+        except Exception:
+            self._record_once(call, name, time.monotonic() - start, "error")
+            raise
+        return self._record_results(call, name, start, results)
+
+    def _submit(self, call: Dict[str, bool], name: str, query: str, search_depth: str, max_results: int,
+                timeout: Optional[float], options: Dict[str, Any]) -> Future:
+        """Start one engine query; cancelling the returned future cancels an async query's task."""
+        if not self._engines[name].native_async:
+            return self._executor.submit(
+                self._timed_search, call, name, query, search_depth, max_results, timeout, options
+            )
+        if self.loop is None:
+            with self._lock:
+                if self.loop is None:
+                    self.loop = BackgroundLoop(name="search-async")
+        return asyncio.run_coroutine_threadsafe(
+            self._atimed_search(call, name, query, search_depth, max_results, timeout, options), self.loop.loop
+        )
+
+    def search_many(
+        self,
+        names: List[str],
+        query: str,
+        search_depth: str = "basic",
+        max_results: int = 10,
+        timeout: Optional[float] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Tuple[str, List[Dict]]]:
+        """
+        Query engines in parallel and yield results as each engine returns.
+        Engines still running when the budget runs out or the generator is
+        closed are cancelled and their results discarded.
+
+        Args:
+            names: Engines to query
+            query: The search query
+            search_depth: "basic" or "advanced"
+            max_results: Maximum number of results to request from each engine
+            timeout: Time budget shared by all engines, in seconds
+            options: Search mode hints passed to every engine
+
+        Yields:
+            Tuples of (engine name, list of search result dictionaries)
+        """
+        start = time.monotonic()
+        # One outcome is recorded per query: a straggler timed out here is not
+        # counted again when its thread finishes
+        calls = {name: {"recorded": False} for name in names}
+        futures = {
+            self._submit(calls[name], name, query, search_depth, max_results, timeout, options or {}): name
+            for name in names
+        }
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                name = futures[future]
+                try:
+                    yield name, future.result()
+                except Exception as e:
+                    print(f"Error in {name} search: {e}")
+                    yield name, [{
+                        "title": f"{name} Search Error",
+                        "url": "",
+                        "content": f"Error performing {name} search: {str(e)}",
+                        "source": f"{name}_error"
+                    }]
+        except FuturesTimeoutError:
+            pending = [name for future, name in futures.items() if not future.done()]
+            for name in pending:
+                self._record_once(calls[name], name, time.monotonic() - start, "timeout")
+            print(f"Search timed out after {timeout:.1f}s waiting for {', '.join(pending)}")
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return per-engine hints and measurements for reporting."""
+        return {
+            engine.name: {
+                "description": engine.description,
+                "available": engine.available(),
+                "capabilities": sorted(engine.capabilities),
+                "cost_per_query": engine.cost_per_query,
+                "expected_latency": self.expected_latency(engine.name),
+                "error_rate": self.error_rate(engine.name),
+                **self._outcomes[engine.name]
+            }
+            for engine in self
+        }
@@ -0,0 +1,141 @@
+import json
+from typing import Any, Dict, List, Optional
+
+# Built-in profiles for the modes offered by the frontend sidebar
+DEFAULT_PROFILES: Dict[str, Dict[str, Any]] = {
+    "search": {
+        "description": "Web search with the full pipeline",
+        "max_results": 10,
+        "search_depth": "auto",
+        "categories": None,
+        "include_domains": None,
+        "context_tokens": 6000,
+        "model_tier": "auto",
+        "cache_ttl": None
+    },
+    "focus": {
+        "description": "Fewer results, short context and the small model for fast answers",
+        "max_results": 4,
+        "search_depth": "basic",
+        "categories": None,
+        "include_domains": None,
+        "context_tokens": 1500,
+        "model_tier": "small",
+        "cache_ttl": None
+    },
+    "scholar": {
+        "description": "Academic sources with deeper search and the large model",
+        "max_results": 8,
+        "search_depth": "advanced",
+        "categories": "science",
+        "include_domains": ["arxiv.org", "scholar.google.com", "semanticscholar.org", "ncbi.nlm.nih.gov", "nature.com"],
+        "context_tokens": 8000,
+        "model_tier": "large",
+        "cache_ttl": 86400
+    },
+    "youtube": {
+        "description": "YouTube videos",
+        "max_results": 6,
+        "search_depth": "basic",
+        "categories": "videos",
+        "include_domains": ["youtube.com"],
+        "context_tokens": 4000,
+        "model_tier": "auto",
+        "cache_ttl": None
+    }
+}
+
+
+class SearchProfile:
+    """
+    Performance profile of a search mode: how many results to fetch and how
+    deep, which categories or domains to search, how much context the model
+    sees, which model tier answers and how long answers are cached
+    """
+    def __init__(
+        self,
+        name: str,
+        description: str = "",
+        max_results: int = 10,
+        search_depth: str = "auto",
+        categories: Optional[str] = None,
+        include_domains: Optional[List[str]] = None,
+        context_tokens: int = 6000,
+        model_tier: str = "auto",
+        cache_ttl: Optional[float] = None
+    ):
+        """
+        Initialize a profile
+
+        Args:
+            name: Mode name sent by clients
+            description: Human-readable description
+            max_results: Search results requested per engine
+            search_depth: "basic", "advanced" or "auto" (advanced for time-sensitive queries)
+            categories: SearxNG categories, e.g. "science" or "videos" (None uses the default)
+            include_domains: Domains Tavily searches are restricted to
+            context_tokens: Approximate token budget for the search context
+            model_tier: "small", "large" or "auto" to let the router decide
+            cache_ttl: Answer cache TTL in seconds (None uses ANSWER_CACHE_TTL)
+        """
+        self.name = name
+        self.description = description
+        self.max_results = max_results
+        self.search_depth = search_depth
+        self.categories = categories
+        self.include_domains = include_domains
+        self.context_tokens = context_tokens
+        self.model_tier = model_tier
+        self.cache_ttl = cache_ttl
+
+    def depth_for(self, time_sensitive: bool) -> str:
+        """Search depth for a query, resolving "auto"."""
+        if self.search_depth == "auto":
+            return "advanced" if time_sensitive else "basic"
+        return self.search_depth
+
+    def search_options(self) -> Dict[str, Any]:
+        """Engine hints passed to every search engine; engines ignore what they do not support."""
+        options = {}
+        if self.categories:
+            options["categories"] = self.categories
+        if self.include_domains:
+            options["include_domains"] = list(self.include_domains)
+        return options
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "max_results": self.max_results,
+            "search_depth": self.search_depth,
+            "categories": self.categories,
+            "include_domains": self.include_domains,
+            "context_tokens": self.context_tokens,
+            "model_tier": self.model_tier,
+            "cache_ttl": self.cache_ttl
+        }
+
+
+def load_profiles(path: Optional[str] = None) -> Dict[str, SearchProfile]:
+    """
+    Build the search profiles from the built-in defaults, overridden field by
+    field (and extended with new modes) from an optional JSON file of the form
+    {"focus": {"max_results": 3}, "news": {...}}
+
+    Args:
+        path: JSON file with profile overrides
+
+    Returns:
+        Profiles keyed by mode name
+    """
+    settings = {name: dict(fields) for name, fields in DEFAULT_PROFILES.items()}
+    if path:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                overrides = json.load(f)
+            for name, fields in overrides.items():
+                settings.setdefault(name, dict(DEFAULT_PROFILES["search"])).update(fields)
+        except (OSError, ValueError) as e:
+            print(f"Error loading search profiles from {path}: {e}")
+    return {name: SearchProfile(name, **fields) for name, fields in settings.items()}
@@ -0,0 +1,202 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import httpx
+
+from metrics import metrics
+
+
+class LatencyTracker:
+    """Rolling window of recent request latencies"""
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+
+class HedgeBudget:
+    """Allows at most a fixed number of hedged requests per rolling minute"""
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self._sent = deque()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while self._sent and now - self._sent[0] > 60:
+                self._sent.popleft()
+            if len(self._sent) >= self.per_minute:
+                return False
+            self._sent.append(now)
+            return True
+
+
+class AsyncTavilyClient:
+    """
+    Async client for the Tavily search API sharing one keep-alive connection
+    pool. When a request has not answered within the hedge delay (a fixed
+    value, or the observed p95 latency), a duplicate is sent and whichever
+    returns first is used, within a per-minute hedge budget.
+    """
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.tavily.com",
+        max_connections: int = 20,
+        keepalive_expiry: float = 60,
+        timeout: float = 30,
+        hedge: bool = True,
+        hedge_delay: Optional[float] = None,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 0.2,
+        hedges_per_minute: int = 30,
+        min_samples: int = 20,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Initialize the client
+
+        Args:
+            api_key: Tavily API key
+            base_url: API base URL, e.g. a local stand-in for testing
+            max_connections: Size of the shared connection pool
+            keepalive_expiry: Seconds idle connections are kept open
+            timeout: Per-request timeout in seconds
+            hedge: Whether to send hedged duplicate requests
+            hedge_delay: Fixed hedge delay in seconds (None uses the observed latency quantile)
+            hedge_quantile: Latency quantile used as the adaptive hedge delay
+            hedge_min_delay: Lower bound for the adaptive hedge delay
+            hedges_per_minute: Maximum hedged requests per rolling minute
+            min_samples: Latency samples needed before adaptive hedging starts
+            transport: Optional httpx transport, for tests
+        """
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker()
+        self.budget = HedgeBudget(hedges_per_minute)
+        self._client_kwargs = {
+            "base_url": self.base_url,
+            "headers": {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+            "limits": httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            "timeout": timeout,
+            "transport": transport
+        }
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created on first use so it binds to the event loop that runs the requests
+        if self._client is None:
+            self._client = httpx.AsyncClient(**self._client_kwargs)
+        return self._client
+
+    def current_hedge_delay(self) -> Optional[float]:
+        """Return the delay before hedging, or None when hedging is not possible yet."""
+        if not self.hedge:
+            return None
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        if len(self.latencies) < self.min_samples:
+            return None
+        return max(self.hedge_min_delay, self.latencies.quantile(self.hedge_quantile))
+
+    async def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.monotonic()
+        response = await self.client.post(path, json=payload)
+        response.raise_for_status()
+        self.latencies.record(time.monotonic() - start)
+        return response.json()
+
+    async def search(self, query: str, **params) -> Dict[str, Any]:
+        """
+        Search with Tavily, hedging slow requests
+
+        Args:
+            query: The search query
+            **params: Tavily search parameters (search_depth, max_results, ...)
+
+        Returns:
+            Tavily response dictionary
+        """
+        payload = {"query": query, **{k: v for k, v in params.items() if v is not None}}
+        primary = asyncio.ensure_future(self._post("/search", payload))
+        delay = self.current_hedge_delay()
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        if not self.budget.try_acquire():
+            metrics.inc("tavily_hedges_total", outcome="over_budget")
+            return await primary
+
+        metrics.inc("tavily_hedges_total", outcome="sent")
+        hedged = asyncio.ensure_future(self._post("/search", payload))
+        pending = {primary, hedged}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    if hedged in succeeded and primary not in succeeded:
+                        metrics.inc("tavily_hedges_total", outcome="won")
+                    return succeeded[0].result()
+                # A failed request still leaves the other one a chance to succeed
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class BackgroundLoop:
+    """
+    Event loop running in a daemon thread so synchronous code can await async
+    clients whose connection pools persist across calls
+    """
+    def __init__(self, name: str = "async-io"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop and wait for its result."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            future.cancel()
+            raise
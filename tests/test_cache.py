@@ -0,0 +1,165 @@
+import threading
+import time
+
+from cache import InMemoryRedis, TieredCache, TTLCache
+from deadline import Deadline
+
+
+def make_worker(l2, lock_timeout=5.0, negative_ttl=60):
+    """A cache as one worker process sees it: its own L1 in front of the shared L2."""
+    return TieredCache("test", TTLCache(maxsize=100, ttl=300), l2=l2, negative_ttl=negative_ttl,
+                       lock_timeout=lock_timeout)
+
+
+def compute_in_thread(cache, key, compute, **kwargs):
+    results = {}
+    thread = threading.Thread(target=lambda: results.setdefault("value", cache.get_or_compute(key, compute, **kwargs)))
+    thread.start()
+    return thread, results
+
+
+def test_value_is_promoted_from_l2_to_l1():
+    l2 = InMemoryRedis()
+    make_worker(l2).set("key", {"answer": 42})
+    other = make_worker(l2)
+    assert other.get("key") == {"answer": 42}
+    assert other.l2_hits == 1
+    assert other.l1.get("key") == {"answer": 42}
+
+
+def test_empty_values_get_the_negative_ttl():
+    l2 = InMemoryRedis()
+    cache = make_worker(l2, negative_ttl=0)
+    assert cache.get_or_compute("key", lambda: [], ttl=300) == []
+    # A zero negative TTL means the empty result was not stored
+    assert cache.get("key") is None
+    assert cache.get_or_compute("other", lambda: ["hit"], ttl=300) == ["hit"]
+    assert cache.get("other") == ["hit"]
+
+
+def test_concurrent_workers_compute_once():
+    l2 = InMemoryRedis()
+    first, second = make_worker(l2), make_worker(l2)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.3)
+        return "value"
+
+    thread, results = compute_in_thread(first, "key", compute)
+    time.sleep(0.05)
+    assert second.get_or_compute("key", compute) == "value"
+    thread.join()
+    assert results["value"] == "value"
+    assert len(calls) == 1
+
+
+def test_waiter_computes_once_the_holder_releases_an_uncacheable_result():
+    l2 = InMemoryRedis()
+    first, second = make_worker(l2, lock_timeout=5), make_worker(l2, lock_timeout=5)
+
+    def failing():
+        time.sleep(0.3)
+        return "error"
+
+    thread, _ = compute_in_thread(first, "key", failing, cacheable=lambda value: value != "error")
+    time.sleep(0.05)
+    start = time.monotonic()
+    assert second.get_or_compute("key", lambda: "fresh") == "fresh"
+    # Stops waiting when the lock is released, long before the 5s lock timeout
+    assert time.monotonic() - start < 1.5
+    thread.join()
+
+
+def test_wait_is_capped_by_the_deadline():
+    l2 = InMemoryRedis()
+    cache = make_worker(l2, lock_timeout=5)
+    # Another worker holds the lock and never finishes
+    l2.set(cache._l2_key("key") + ":lock", b"1", ex=5, nx=True)
+    start = time.monotonic()
+    assert cache.get_or_compute("key", lambda: "fallback", deadline=Deadline(0.3)) == "fallback"
+    assert time.monotonic() - start < 1.5
+
+
+def test_l2_errors_fall_back_to_computing():
+    class BrokenRedis:
+        def get(self, name):
+            raise ConnectionError("down")
+
+        def set(self, name, value, ex=None, nx=False):
+            raise ConnectionError("down")
+
+        def delete(self, *names):
+            raise ConnectionError("down")
+
+    cache = make_worker(BrokenRedis())
+    assert cache.get_or_compute("key", lambda: "value") == "value"
+    assert cache.l2_errors > 0
+    # Still served from L1
+    assert cache.get("key") == "value"
+
+
+def test_waiting_threads_share_an_uncacheable_result():
+    cache = make_worker(InMemoryRedis())
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.5)
+        return "degraded"
+
+    start = time.monotonic()
+    threads = [
+        compute_in_thread(cache, "key", compute, cacheable=lambda value: False, deadline=Deadline(0.6))
+        for _ in range(4)
+    ]
+    for thread, _ in threads:
+        thread.join()
+    assert [results["value"] for _, results in threads] == ["degraded"] * 4
+    assert len(calls) == 1
+    assert time.monotonic() - start < 0.9
+
+
+def test_waiting_threads_stop_at_the_deadline():
+    cache = make_worker(InMemoryRedis())
+    thread, _ = compute_in_thread(cache, "key", lambda: time.sleep(1) or "slow")
+    time.sleep(0.05)
+    start = time.monotonic()
+    assert cache.get_or_compute("key", lambda: "own", deadline=Deadline(0.2)) == "own"
+    assert time.monotonic() - start < 0.6
+    thread.join()
+
+
+def test_an_expired_lock_is_not_released_by_its_former_holder():
+    l2 = InMemoryRedis()
+    cache = make_worker(l2)
+    lock_name = cache._l2_key("key") + ":lock"
+    assert cache._acquire_l2_lock(lock_name, "first")
+    # The first holder's lock expires and another worker takes it
+    l2.delete(lock_name)
+    assert cache._acquire_l2_lock(lock_name, "second")
+    cache._release_l2_lock(lock_name, "first")
+    assert l2.get(lock_name) == b"second"
+    cache._release_l2_lock(lock_name, "second")
+    assert l2.get(lock_name) is None
+
+
+def test_corrupt_l2_entries_are_misses():
+    l2 = InMemoryRedis()
+    cache = make_worker(l2)
+    l2.set(cache._l2_key("key"), b"\x02not zlib")
+    assert cache.get("key") is None
+    assert cache.l2_errors == 1
+    assert cache.get_or_compute("key", lambda: "value") == "value"
+    assert make_worker(l2).get("key") == "value"
+
+
+def test_ttl_for_shortens_the_ttl_of_partial_results():
+    l2 = InMemoryRedis()
+    cache = make_worker(l2)
+    assert cache.get_or_compute("partial", lambda: ["some"], ttl=300, ttl_for=lambda value: 0) == ["some"]
+    # A zero TTL means the partial result was not stored
+    assert cache.get("partial") is None
+    cache.get_or_compute("full", lambda: ["all"], ttl=300, ttl_for=lambda value: None)
+    assert cache.get("full") == ["all"]
@@ -0,0 +1,43 @@
+from history_store import ERROR_ANSWER_PREFIX, HistoryStore
+
+
+def make_store(tmp_path):
+    return HistoryStore(str(tmp_path / "history.sqlite3"), flush_interval=0.01)
+
+
+def answer(text, degraded=False):
+    return {"main_answer": text, "follow_up_questions": ["Why?"], "read_more": [], "degraded": degraded}
+
+
+def test_find_answer_reuses_the_newest_complete_answer(tmp_path):
+    store = make_store(tmp_path)
+    store.record("What is WAL?", answer("Older"), "tavily", "search", answered_at=1)
+    store.record("What is WAL?", answer("Write-ahead logging"), "tavily", "search")
+    store.flush()
+    found = store.find_answer("what is wal", "tavily", "search", max_age=60)
+    assert found["main_answer"] == "Write-ahead logging"
+    assert found["follow_up_questions"] == ["Why?"]
+    assert store.find_answer("What is WAL?", "tavily", "focus", max_age=60) is None
+
+
+def test_find_answer_skips_error_and_degraded_answers(tmp_path):
+    store = make_store(tmp_path)
+    store.record("What is WAL?", answer(f"{ERROR_ANSWER_PREFIX}timeout"), "tavily", "search")
+    store.record("What is WAL?", answer("Partial", degraded=True), "tavily", "search")
+    store.flush()
+    assert store.find_answer("What is WAL?", "tavily", "search", max_age=60) is None
+
+
+def test_entries_are_listed_per_user_and_session(tmp_path):
+    store = make_store(tmp_path)
+    for i in range(3):
+        store.record(f"Question {i}", answer(f"Answer {i}"), user_id="alice", session_id="s1")
+    store.record("Other", answer("Other"), user_id=None, session_id="s2")
+    store.flush()
+    entries, cursor = store.list_entries(user_id="alice", limit=2)
+    assert [entry["question"] for entry in entries] == ["Question 2", "Question 1"]
+    entries, cursor = store.list_entries(user_id="alice", before=cursor, limit=2)
+    assert [entry["question"] for entry in entries] == ["Question 0"]
+    assert cursor is None
+    entries, _ = store.list_entries(session_id="s2")
+    assert [entry["question"] for entry in entries] == ["Other"]
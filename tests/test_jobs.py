@@ -0,0 +1,181 @@
+import hashlib
+import hmac
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from cache import InMemoryRedis, deserialize
+from jobs import JOB_SUCCEEDED, JobManager, JobStore, check_callback_url, public_job
+
+
+class CallbackServer:
+    """A local HTTP server answering callbacks with the given status codes in turn."""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.requests = []
+        self.received = threading.Event()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                server.requests.append((dict(self.headers), body))
+                status = server.statuses.pop(0) if server.statuses else 200
+                self.send_response(status)
+                if status == 302:
+                    self.send_header("Location", f"http://127.0.0.1:{self.server.server_port}/redirected")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                if status < 500:
+                    server.received.set()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/callback"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def callback_server():
+    servers = []
+
+    def start(statuses=()):
+        server = CallbackServer(statuses)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def make_manager(**kwargs):
+    kwargs.setdefault("callback_allowed_hosts", ["127.0.0.1"])
+    kwargs.setdefault("callback_backoff", 0.01)
+    return JobManager(lambda params, progress, client: {"answer": params["question"].upper()}, JobStore(), **kwargs)
+
+
+def finish(manager):
+    """Wait until the running jobs and their callbacks are done."""
+    manager._executor.shutdown(wait=True)
+
+
+def test_callback_is_signed_with_the_secret(callback_server):
+    server = callback_server()
+    manager = make_manager(callback_secret="s3cret")
+    job = manager.submit({"question": "hello"}, callback_url=server.url)
+    assert server.received.wait(5)
+    headers, body = server.requests[0]
+    expected = hmac.new(b"s3cret", body, hashlib.sha256).hexdigest()
+    assert headers["X-Signature"] == f"sha256={expected}"
+    payload = json.loads(body)
+    assert payload["id"] == job["id"]
+    assert payload["status"] == JOB_SUCCEEDED
+    assert payload["result"] == {"answer": "HELLO"}
+    # The callback URL is not sent back
+    assert "callback_url" not in payload
+
+
+def test_run_gets_the_client_key_without_exposing_it(callback_server):
+    server = callback_server()
+    clients = []
+    manager = JobManager(
+        lambda params, progress, client: clients.append(client) or {}, JobStore(),
+        callback_allowed_hosts=["127.0.0.1"]
+    )
+    job = manager.submit({"question": "hello"}, callback_url=server.url, client="api-key")
+    assert server.received.wait(5)
+    assert clients == ["api-key"]
+    assert "client" not in public_job(manager.get(job["id"]))
+    assert b"api-key" not in server.requests[0][1]
+
+
+def test_saved_jobs_do_not_contain_the_client_key():
+    l2 = InMemoryRedis()
+    manager = JobManager(lambda params, progress, client: {"client": "seen"}, JobStore(client=l2))
+    job = manager.submit({"question": "hello"}, client="key:secret-api-key")
+    finish(manager)
+    assert manager.get(job["id"])["status"] == JOB_SUCCEEDED
+    # Stored values are compressed, so check them decoded
+    stored = [deserialize(value) for _, value in l2._data.values()]
+    assert stored and "secret-api-key" not in json.dumps(stored)
+    assert "secret-api-key" not in json.dumps(manager.get(job["id"]))
+
+
+def test_unsigned_callback_without_secret(callback_server):
+    server = callback_server()
+    manager = make_manager()
+    manager.submit({"question": "hello"}, callback_url=server.url)
+    assert server.received.wait(5)
+    headers, _ = server.requests[0]
+    assert "X-Signature" not in headers
+
+
+def test_server_errors_are_retried(callback_server):
+    server = callback_server([500, 503, 200])
+    manager = make_manager(callback_retries=3)
+    manager.submit({"question": "hello"}, callback_url=server.url)
+    assert server.received.wait(5)
+    assert len(server.requests) == 3
+    # Every attempt carries the same body
+    assert len({body for _, body in server.requests}) == 1
+
+
+def test_retries_give_up_after_the_last_attempt(callback_server):
+    server = callback_server([500] * 10)
+    manager = make_manager(callback_retries=3)
+    manager.submit({"question": "hello"}, callback_url=server.url)
+    finish(manager)
+    assert len(server.requests) == 3
+
+
+def test_client_errors_and_redirects_are_not_retried(callback_server):
+    for status in (404, 302):
+        server = callback_server([status])
+        manager = make_manager(callback_retries=3)
+        manager.submit({"question": "hello"}, callback_url=server.url)
+        finish(manager)
+        # The redirect is not followed either
+        assert [headers.get("Host") for headers, _ in server.requests] == [f"127.0.0.1:{server.httpd.server_port}"]
+
+
+@pytest.mark.parametrize("url", [
+    "ftp://example.com/callback",
+    "http:///callback",
+    "http://127.0.0.1:8000/callback",
+    "http://localhost/callback",
+    "http://10.0.0.5/callback",
+    "http://192.168.1.1/callback",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://[::1]/callback",
+    "http://0.0.0.0/callback",
+    "http://224.0.0.1/callback",
+])
+def test_non_public_callback_urls_are_rejected(url):
+    with pytest.raises(ValueError):
+        check_callback_url(url)
+
+
+def test_public_and_allowed_callback_urls_are_accepted():
+    check_callback_url("https://93.184.216.34/callback")
+    check_callback_url("http://127.0.0.1:8000/callback", ["127.0.0.1"])
+    # With an allowlist, other hosts are rejected even when public
+    with pytest.raises(ValueError):
+        check_callback_url("https://93.184.216.34/callback", ["hooks.example.com"])
+
+
+def test_submit_rejects_a_private_callback_without_queueing():
+    manager = make_manager(callback_allowed_hosts=[])
+    with pytest.raises(ValueError):
+        manager.submit({"question": "hello"}, callback_url="http://169.254.169.254/latest/meta-data/")
+    assert manager.pending() == 0
@@ -0,0 +1,43 @@
+from concurrent.futures import Future
+
+import pytest
+
+import main
+
+
+def prefetched(engine, mode, text, client, results):
+    """Record a finished prefetch as prefetch_search would."""
+    future = Future()
+    future.set_result(results)
+    main._prefetches.set((engine, mode, text), future)
+    texts = main._client_prefetch_texts.get((client, engine, mode), ())
+    main._client_prefetch_texts.set((client, engine, mode), (text,) + texts)
+
+
+@pytest.fixture(autouse=True)
+def clear_prefetches():
+    main._prefetches.clear()
+    main._client_prefetch_texts.clear()
+    yield
+    main._prefetches.clear()
+    main._client_prefetch_texts.clear()
+
+
+def test_exact_matches_are_shared_between_clients():
+    prefetched("tavily", "search", "what is the capital of france", "ip:a", ["exact"])
+    assert main.find_prefetched_results("What is the capital of France?", "tavily", "search", client="ip:b") == ["exact"]
+    assert main.find_prefetched_results("What is the capital of France?", "tavily", "search") == ["exact"]
+
+
+def test_near_matches_only_use_the_clients_own_prefetches():
+    prefetched("tavily", "search", "what is the capital of franc", "ip:a", ["near"])
+    question = "What is the capital of France?"
+    assert main.find_prefetched_results(question, "tavily", "search", client="ip:a") == ["near"]
+    assert main.find_prefetched_results(question, "tavily", "search", client="ip:b") is None
+    assert main.find_prefetched_results(question, "tavily", "search") is None
+    assert main.find_prefetched_results(question, "tavily", "focus", client="ip:a") is None
+
+
+def test_dissimilar_text_is_not_matched():
+    prefetched("tavily", "search", "what is the capital", "ip:a", ["short"])
+    assert main.find_prefetched_results("What is the capital of France?", "tavily", "search", client="ip:a") is None
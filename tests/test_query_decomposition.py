@@ -0,0 +1,47 @@
+from query_decomposition import decompose_question, merge_results
+
+
+def result(host, source="tavily"):
+    return {"url": f"https://{host}/page", "title": host, "source": source}
+
+
+def test_comparisons_split_into_one_query_per_subject():
+    assert decompose_question("compare AWS and GCP in terms of pricing") == ["AWS pricing", "GCP pricing"]
+    assert decompose_question("React vs Vue vs Svelte") == ["React", "Vue", "Svelte"]
+
+
+def test_shared_context_is_carried_into_every_subquery():
+    assert decompose_question("What is the difference between a list and a tuple in Python?") == \
+        ["list in Python", "tuple in Python"]
+    assert decompose_question("Which is better, PostgreSQL or MySQL for analytics?") == \
+        ["PostgreSQL for analytics", "MySQL for analytics"]
+
+
+def test_versus_separates_whole_subjects():
+    assert decompose_question("Tom and Jerry vs Looney Tunes") == ["Tom and Jerry", "Looney Tunes"]
+
+
+def test_parts_that_cannot_be_searched_alone_are_not_split():
+    assert decompose_question("Difference between Python 2 and 3") == []
+    assert decompose_question("difference between it and that") == []
+    assert decompose_question("what is the capital of France") == []
+
+
+def test_several_questions_are_split():
+    assert decompose_question("What is Rust? How does the borrow checker work?") == \
+        ["What is Rust?", "How does the borrow checker work?"]
+
+
+def test_original_results_keep_their_budget_ahead_of_subqueries():
+    original = [result("a"), result("b"), result("c")]
+    first = [result("b"), result("d"), result("e")]
+    second = [result("f")]
+    merged = merge_results([original, first, second], 5, primary_results=3)
+    assert [r["title"] for r in merged] == ["a", "b", "c", "f", "d"]
+
+
+def test_round_robin_merge_skips_placeholders():
+    merged = merge_results([[result("a"), result("b")], [{"url": "", "source": "tavily_error"}, result("c")]], 10)
+    assert [r["title"] for r in merged] == ["a", "c", "b"]
+    errors = [{"url": "", "source": "tavily_error"}]
+    assert merge_results([errors, []], 10) == errors
@@ -0,0 +1,52 @@
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from recorder import TrafficRecorder
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class OfflineEmbeddings:
+    def embed_documents(self, texts):
+        raise AssertionError("replay must not call the embeddings client")
+
+    embed_query = embed_documents
+
+
+def test_embeddings_are_recorded_and_replayed_offline(tmp_path):
+    path = str(tmp_path / "corpus.jsonl.gz")
+    live = CountingEmbeddings()
+    recorded = TrafficRecorder("record", path).wrap_embeddings(live, {"model": "test"})
+    assert recorded.embed_query("hello") == [5.0, 1.0]
+    assert recorded.embed_documents(["a", "abc"]) == [[1.0, 1.0], [3.0, 1.0]]
+    assert live.calls == 2
+
+    replayer = TrafficRecorder("replay", path, speed=0)
+    replayed = replayer.wrap_embeddings(OfflineEmbeddings(), {"model": "test"})
+    assert replayed.embed_query("hello") == [5.0, 1.0]
+    assert replayed.embed_documents(["a", "abc"]) == [[1.0, 1.0], [3.0, 1.0]]
+    assert len(replayer.records("embedding")) == 2
+
+
+def test_model_calls_of_other_kinds_are_kept_apart_from_answers(tmp_path):
+    path = str(tmp_path / "corpus.jsonl.gz")
+    model = RunnableLambda(lambda prompt: AIMessage(content="part one\npart two"))
+    request = {"question": "compare a and b", "max_subqueries": 3}
+    TrafficRecorder("record", path).wrap_model(model, request, kind="decompose").invoke("prompt")
+
+    replayer = TrafficRecorder("replay", path, speed=0)
+    offline = RunnableLambda(lambda prompt: (_ for _ in ()).throw(AssertionError("network call")))
+    message = replayer.wrap_model(offline, request, kind="decompose").invoke("prompt")
+    assert message.content == "part one\npart two"
+    # The replay benchmark takes its questions from the answer ("llm") records only
+    assert replayer.records("llm") == []
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+import time
+
+from search_engines import EngineRegistry, FunctionEngine
+
+
+def result(source):
+    return [{"title": source, "url": f"https://example.com/{source}", "content": "", "source": source}]
+
+
+def make_registry():
+    registry = EngineRegistry(max_workers=4)
+    cancelled = threading.Event()
+
+    async def slow_async(query, search_depth, max_results, timeout, **options):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return result("slow")
+
+    async def fast_async(query, search_depth, max_results, timeout, **options):
+        return result("async")
+
+    registry.register(FunctionEngine("sync", "Sync", lambda q, d, n, t, **o: result("sync")))
+    registry.register(FunctionEngine("async", "Async", lambda *a, **o: [], async_search=fast_async))
+    registry.register(FunctionEngine("slow", "Slow", lambda *a, **o: [], async_search=slow_async))
+    return registry, cancelled
+
+
+def test_async_engines_are_awaited_natively():
+    registry, _ = make_registry()
+    assert registry.get("async").native_async
+    assert not registry.get("sync").native_async
+    results = dict(registry.search_many(["sync", "async"], "query", timeout=5))
+    assert results["sync"][0]["source"] == "sync"
+    # The async function ran, not the sync fallback that returns nothing
+    assert results["async"][0]["source"] == "async"
+    assert registry.stats()["async"]["ok"] == 1
+
+
+def test_async_engine_past_the_budget_is_cancelled():
+    registry, cancelled = make_registry()
+    start = time.monotonic()
+    results = dict(registry.search_many(["async", "slow"], "query", timeout=0.3))
+    assert list(results) == ["async"]
+    assert time.monotonic() - start < 2
+    assert cancelled.wait(2)
+    assert registry.stats()["slow"]["timeout"] == 1
+
+
+def test_thread_straggler_is_counted_once():
+    registry = EngineRegistry(max_workers=2)
+    finished = threading.Event()
+
+    def slow(query, search_depth, max_results, timeout, **options):
+        time.sleep(0.5)
+        finished.set()
+        return result("slow")
+
+    registry.register(FunctionEngine("slow", "Slow", slow))
+    assert dict(registry.search_many(["slow"], "query", timeout=0.1)) == {}
+    assert finished.wait(2)
+    time.sleep(0.05)
+    stats = registry.stats()["slow"]
+    assert (stats["timeout"], stats["ok"]) == (1, 0)
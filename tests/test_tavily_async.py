@@ -0,0 +1,101 @@
+import asyncio
+
+import httpx
+import pytest
+
+from tavily_async import AsyncTavilyClient, BackgroundLoop, HedgeBudget
+
+
+class StandIn:
+    """Tavily stand-in answering each request after the next scripted delay"""
+    def __init__(self, delays, failures=()):
+        self.delays = list(delays)
+        self.failures = set(failures)
+        self.requests = 0
+        self.cancelled = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        number = self.requests
+        self.requests += 1
+        try:
+            await asyncio.sleep(self.delays[number])
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if number in self.failures:
+            return httpx.Response(500, json={"error": "failed"})
+        return httpx.Response(200, json={"results": [{"url": f"https://example.com/{number}"}]})
+
+
+def make_client(stand_in, **kwargs):
+    return AsyncTavilyClient("key", transport=httpx.MockTransport(stand_in.handle), **kwargs)
+
+
+async def search(client, query="python"):
+    try:
+        return await client.search(query, max_results=3)
+    finally:
+        # Let cancelled requests finish unwinding before the loop closes
+        await asyncio.sleep(0.05)
+        await client.aclose()
+
+
+def test_fast_request_is_not_hedged():
+    stand_in = StandIn([0.0])
+    result = asyncio.run(search(make_client(stand_in, hedge_delay=0.2)))
+    assert result["results"][0]["url"] == "https://example.com/0"
+    assert stand_in.requests == 1
+
+
+def test_slow_request_is_hedged_and_the_loser_cancelled():
+    stand_in = StandIn([1.0, 0.0])
+    result = asyncio.run(search(make_client(stand_in, hedge_delay=0.1)))
+    assert result["results"][0]["url"] == "https://example.com/1"
+    assert stand_in.requests == 2
+    assert stand_in.cancelled == 1
+
+
+def test_no_adaptive_hedging_before_enough_samples():
+    stand_in = StandIn([0.3])
+    client = make_client(stand_in, min_samples=20)
+    assert client.current_hedge_delay() is None
+    asyncio.run(search(client))
+    assert stand_in.requests == 1
+
+
+def test_adaptive_delay_follows_observed_latency():
+    client = make_client(StandIn([]), min_samples=3, hedge_min_delay=0.05)
+    for seconds in (0.1, 0.2, 0.4):
+        client.latencies.record(seconds)
+    assert client.current_hedge_delay() == 0.4
+
+
+def test_hedge_budget_limits_duplicates():
+    stand_in = StandIn([0.3])
+    result = asyncio.run(search(make_client(stand_in, hedge_delay=0.05, hedges_per_minute=0)))
+    assert result["results"][0]["url"] == "https://example.com/0"
+    assert stand_in.requests == 1
+    assert not HedgeBudget(0).try_acquire()
+
+
+def test_failed_primary_falls_back_to_the_hedge():
+    stand_in = StandIn([0.2, 0.4], failures={0})
+    result = asyncio.run(search(make_client(stand_in, hedge_delay=0.1)))
+    assert result["results"][0]["url"] == "https://example.com/1"
+
+
+def test_error_is_raised_when_both_requests_fail():
+    stand_in = StandIn([0.2, 0.3], failures={0, 1})
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(search(make_client(stand_in, hedge_delay=0.1)))
+
+
+def test_background_loop_runs_the_client_from_sync_code():
+    stand_in = StandIn([0.0, 0.0])
+    client = make_client(stand_in)
+    loop = BackgroundLoop()
+    # The pool persists across calls on the same loop
+    for _ in range(2):
+        assert loop.run(client.search("python"), timeout=5)["results"]
+    loop.run(client.aclose(), timeout=5)
+    assert stand_in.requests == 2
@@ -0,0 +1,106 @@
+import time
+
+import numpy as np
+import pytest
+
+from vector_store import EmbeddingStore, top_k
+
+
+def basis(dim, i, noise=0.0, rng=None):
+    """A unit vector along axis i, optionally with a little noise."""
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i] = 1.0
+    if noise:
+        vector += noise * rng.standard_normal(dim).astype(np.float32)
+    return vector
+
+
+def test_top_k_returns_the_largest_scores_best_first():
+    scores = np.array([[0.1, 0.9, 0.5, 0.7], [0.4, 0.2, 0.8, 0.6]], dtype=np.float32)
+    idx, best = top_k(scores, 3)
+    assert idx.tolist() == [[1, 3, 2], [2, 3, 0]]
+    assert np.allclose(best, [[0.9, 0.7, 0.5], [0.8, 0.6, 0.4]])
+    # k larger than the row keeps every column
+    idx, _ = top_k(scores, 10)
+    assert idx.shape == (2, 4)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_search_finds_nearest_vectors_across_segments(tmp_path, dtype):
+    rng = np.random.default_rng(0)
+    store = EmbeddingStore(str(tmp_path), dim=16, dtype=dtype, segment_size=4, chunk_rows=3)
+    vectors = np.stack([basis(16, i, noise=0.05, rng=rng) for i in range(10)])
+    for start in (0, 4, 8):
+        stop = min(start + 4, 10)
+        store.add([f"v{i}" for i in range(start, stop)], vectors[start:stop], [{"i": i} for i in range(start, stop)])
+    # Two flushed segments, scored in chunks, and two buffered vectors
+    assert store.segment_count == 2
+    assert len(store) == 10
+    hits = store.search(np.stack([basis(16, 3), basis(16, 8)]), k=2)
+    assert [hit[0] for hit in hits[0]][0] == "v3"
+    assert [hit[0] for hit in hits[1]][0] == "v8"
+    assert hits[0][0][2] == {"i": 3}
+    assert hits[0][0][1] > 0.95
+    assert hits[0][0][1] >= hits[0][1][1]
+
+
+def test_buffered_vectors_are_searchable_and_flushed_for_other_processes(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=4, segment_size=100)
+    store.add(["a"], [basis(4, 0)])
+    assert store.search(basis(4, 0), k=1)[0][0][0] == "a"
+    other = EmbeddingStore(str(tmp_path), dim=4)
+    assert other.search(basis(4, 0), k=1) == [[]]
+    store.close()
+    assert other.search(basis(4, 0), k=1)[0][0][0] == "a"
+
+
+def test_buffered_vectors_are_flushed_on_a_timer(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=4, segment_size=100, flush_interval=0.05)
+    store.add(["a"], [basis(4, 0)])
+    deadline = time.monotonic() + 5
+    while store.segment_count == 0 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert store.segment_count == 1
+    store.close()
+
+
+def test_readding_an_id_replaces_its_vector(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=4, segment_size=1)
+    store.add(["q"], [basis(4, 0)], [{"version": 1}])
+    store.add(["q"], [basis(4, 1)], [{"version": 2}])
+    # The old vector matches the query better but has been replaced
+    hits = store.search(basis(4, 0), k=1)[0]
+    assert hits[0][2] == {"version": 2}
+    hits = store.search(basis(4, 1), k=1)[0]
+    assert hits[0][0] == "q" and hits[0][2] == {"version": 2}
+
+
+def test_deleted_ids_are_not_returned(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=4, segment_size=2)
+    store.add(["a", "b"], [basis(4, 0), basis(4, 1)])
+    store.delete(["a"])
+    assert [hit[0] for hit in store.search(basis(4, 0), k=2)[0]] == ["b"]
+    # Adding an id again makes it live again
+    store.add(["a", "c"], [basis(4, 0), basis(4, 2)])
+    assert store.search(basis(4, 0), k=1)[0][0][0] == "a"
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_compaction_merges_segments_and_drops_dead_rows(tmp_path, dtype):
+    store = EmbeddingStore(str(tmp_path), dim=4, dtype=dtype, segment_size=1)
+    store.add(["a"], [basis(4, 0)], [{"v": 1}])
+    store.add(["b"], [basis(4, 1)])
+    store.add(["a"], [basis(4, 2)], [{"v": 2}])
+    store.add(["c"], [basis(4, 3)])
+    store.delete(["b"])
+    assert store.segment_count == 4
+    assert store.compact()
+    assert store.segment_count == 1
+    assert len(store) == 2
+    hits = store.search(basis(4, 2), k=3)[0]
+    assert hits[0][0] == "a" and hits[0][2] == {"v": 2}
+    assert "b" not in [hit[0] for hit in hits]
+    # Another process sees the compacted store
+    other = EmbeddingStore(str(tmp_path), dim=4, dtype=dtype)
+    assert len(other) == 2
+    assert not store.compact()
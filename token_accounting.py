@@ -0,0 +1,180 @@
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from cache import TTLCache
+
+# Optional exact tokenizer; falls back to about 4 characters per token
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# USD per million (prompt, completion) tokens, matched by model name prefix
+DEFAULT_MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "o3-mini": (1.10, 4.40),
+    "o4-mini": (1.10, 4.40)
+}
+
+
+def load_prices(overrides: str = "") -> Dict[str, Tuple[float, float]]:
+    """
+    Build the price table from the defaults and an optional JSON object of
+    the form {"model-name": [prompt_per_million, completion_per_million]}
+    """
+    prices = dict(DEFAULT_MODEL_PRICES)
+    if overrides:
+        try:
+            prices.update({name: tuple(price) for name, price in json.loads(overrides).items()})
+        except (ValueError, TypeError) as e:
+            print(f"Error parsing model prices: {e}")
+    return prices
+
+
+def price_for(model_name: str, prices: Dict[str, Tuple[float, float]]) -> Tuple[float, float]:
+    """Prices of the longest matching model name prefix, e.g. gpt-4o for gpt-4o-2024-08-06."""
+    matches = [name for name in prices if (model_name or "").startswith(name)]
+    if not matches:
+        return 0.0, 0.0
+    return prices[max(matches, key=len)]
+
+
+class TokenCounter:
+    """
+    Counts tokens with tiktoken when it is installed (and its encoding can be
+    loaded), otherwise estimates them from the text length. Counts are cached
+    by content hash, so search results reused across requests are only
+    tokenized once.
+    """
+    def __init__(self, model_name: str = "gpt-4o", cache_size: int = 4096):
+        """
+        Initialize the counter
+
+        Args:
+            model_name: Model whose tokenizer to use
+            cache_size: Number of texts whose counts are kept
+        """
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                try:
+                    self._encoding = tiktoken.encoding_for_model(model_name)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                print(f"Could not load the tokenizer for {model_name}, estimating tokens instead: {e}")
+        self._cache = TTLCache(maxsize=cache_size, ttl=86400)
+
+    @property
+    def exact(self) -> bool:
+        return self._encoding is not None
+
+    def count(self, text: str) -> int:
+        """Number of tokens in text."""
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        tokens = self._cache.get(key)
+        if tokens is None:
+            if self._encoding is not None:
+                tokens = len(self._encoding.encode(text, disallowed_special=()))
+            else:
+                tokens = math.ceil(len(text) / 4)
+            self._cache.set(key, tokens)
+        return tokens
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text to at most max_tokens tokens."""
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is None:
+            return text[:max_tokens * 4]
+        tokens = self._encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else self._encoding.decode(tokens[:max_tokens])
+
+
+class RequestUsage:
+    """Context size, token counts and cost of one request's model calls"""
+    def __init__(self, client: Optional[str] = None, mode: Optional[str] = None):
+        self.client = client
+        self.mode = mode
+        self.context_tokens = 0
+        self.context_trimmed = False
+        self.estimated_prompt_tokens = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cost_usd = 0.0
+        self.model_calls = 0
+        # Usage not reported by the provider was counted locally
+        self.estimated = False
+        self._lock = threading.Lock()
+
+    def add_call(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int,
+                 cost_usd: float, estimated: bool = False) -> None:
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cached_tokens += cached_tokens
+            self.cost_usd += cost_usd
+            self.model_calls += 1
+            self.estimated = self.estimated or estimated
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "context_tokens": self.context_tokens,
+            "context_trimmed": self.context_trimmed,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "model_calls": self.model_calls,
+            "estimated": self.estimated
+        }
+
+
+class UsageLedger:
+    """Running token and cost totals per mode and per client, keeping only the most recently seen clients"""
+    def __init__(self, max_clients: int = 10000):
+        self.max_clients = max_clients
+        self._modes: Dict[str, Dict[str, float]] = {}
+        self._clients: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _add(totals: Dict[str, float], usage: RequestUsage) -> None:
+        totals["requests"] = totals.get("requests", 0) + 1
+        totals["model_calls"] = totals.get("model_calls", 0) + usage.model_calls
+        totals["prompt_tokens"] = totals.get("prompt_tokens", 0) + usage.prompt_tokens
+        totals["completion_tokens"] = totals.get("completion_tokens", 0) + usage.completion_tokens
+        totals["cost_usd"] = totals.get("cost_usd", 0.0) + usage.cost_usd
+
+    def record(self, usage: RequestUsage) -> None:
+        """Add a finished request to its mode's and client's totals."""
+        with self._lock:
+            if usage.mode:
+                self._add(self._modes.setdefault(usage.mode, {}), usage)
+            if usage.client:
+                totals = self._clients.pop(usage.client, {})
+                self._add(totals, usage)
+                self._clients[usage.client] = totals
+                while len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+
+    def client_totals(self, client: str) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._clients.get(client, {}))
+
+    def mode_totals(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {mode: dict(totals) for mode, totals in self._modes.items()}
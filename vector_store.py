@@ -0,0 +1,393 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length so dot products are cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the indices and scores of the k largest scores in every row,
+    best first, using argpartition instead of a full sort
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    if k < scores.shape[1]:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+class _Segment:
+    """An immutable, memory-mapped block of vectors with its ids and metadata"""
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        self.vectors = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        scale_path = os.path.join(directory, f"{name}.scale.npy")
+        self.scales = np.load(scale_path, mmap_mode="r") if os.path.exists(scale_path) else None
+        with open(os.path.join(directory, f"{name}.meta.jsonl"), encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+        self.ids = [row["id"] for row in rows]
+        self.metadata = [row.get("metadata") for row in rows]
+        # Last row of each id, so rows superseded within the segment can be skipped
+        self.row_of = {id_: row for row, id_ in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class _BufferSegment:
+    """Vectors added since the last flush, searchable before they reach disk"""
+    def __init__(self, ids: List[str], vectors: List[np.ndarray], metadata: List[Any]):
+        self.name = "buffer"
+        self.ids = list(ids)
+        self.vectors = np.concatenate(vectors)
+        self.scales = None
+        self.metadata = list(metadata)
+        self.row_of = {id_: row for row, id_ in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class EmbeddingStore:
+    """
+    Append-only store of unit-normalized embeddings in memory-mapped segment
+    files. Segments are shared through the page cache by every process that
+    opens the same directory, so per-worker memory stays flat as workers are
+    added. New vectors are buffered and flushed as new segments; compaction
+    merges segments and drops deleted ids. Adding an id again replaces its
+    vector.
+    """
+    def __init__(self, directory: str, dim: int, dtype: str = "float32", segment_size: int = 4096,
+                 chunk_rows: int = 65536, flush_interval: float = 0):
+        """
+        Initialize the store, creating the directory if needed
+
+        Args:
+            directory: Directory holding the segment files and manifest
+            dim: Embedding dimension
+            dtype: "float32", or "int8" for 4x smaller per-row scaled quantized vectors
+            segment_size: Number of buffered vectors that triggers a flush to a new segment
+            chunk_rows: Rows scored at once per segment, bounding temporary memory
+            flush_interval: When positive, buffered vectors are also flushed by a
+                background thread at least this often (in seconds)
+        """
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        self.directory = directory
+        self.dim = dim
+        self.dtype = dtype
+        self.segment_size = segment_size
+        self.chunk_rows = chunk_rows
+        self._lock = threading.RLock()
+        # Held for the whole of a compaction, so at most one runs per store
+        self._compact_lock = threading.Lock()
+        self._segments: Dict[str, _Segment] = {}
+        self._deleted = set()
+        self._manifest_mtime = None
+        self._buffer_ids: List[str] = []
+        self._buffer_vectors: List[np.ndarray] = []
+        self._buffer_metadata: List[Any] = []
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+        self._closed = threading.Event()
+        self._flusher = None
+        if flush_interval > 0:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, args=(flush_interval,), name="embedding-flush", daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_loop(self, interval: float) -> None:
+        while not self._closed.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing embedding store: {e}")
+
+    def close(self) -> None:
+        """Stop the background flusher and write any buffered vectors."""
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    @contextmanager
+    def _file_lock(self):
+        # Serializes manifest updates between worker processes
+        with open(os.path.join(self.directory, LOCK_NAME), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_manifest(self) -> dict:
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return {"dim": self.dim, "dtype": self.dtype, "segments": [], "deleted": []}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: dict) -> None:
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+    def refresh(self) -> None:
+        """Pick up segments written by other processes since the last refresh."""
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        with self._lock:
+            if mtime == self._manifest_mtime:
+                return
+            manifest = self._read_manifest()
+            if manifest["dim"] != self.dim or manifest["dtype"] != self.dtype:
+                raise ValueError(
+                    f"Store at {self.directory} holds {manifest['dtype']} vectors of dim {manifest['dim']}"
+                )
+            self._segments = {
+                name: self._segments.get(name) or _Segment(self.directory, name)
+                for name in manifest["segments"]
+            }
+            self._deleted = set(manifest["deleted"])
+            self._manifest_mtime = mtime
+
+    def _write_segment(self, ids: List[str], vectors: np.ndarray, metadata: List[Any]) -> str:
+        name = f"seg-{time.time_ns()}-{os.getpid()}"
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+            np.save(os.path.join(self.directory, f"{name}.scale.npy"), scales.astype(np.float32))
+            np.save(os.path.join(self.directory, f"{name}.npy"), quantized)
+        else:
+            np.save(os.path.join(self.directory, f"{name}.npy"), vectors.astype(np.float32))
+        with open(os.path.join(self.directory, f"{name}.meta.jsonl"), "w", encoding="utf-8") as f:
+            for id_, meta in zip(ids, metadata):
+                f.write(json.dumps({"id": id_, "metadata": meta}) + "\n")
+        return name
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray, metadata: Optional[Sequence[Any]] = None) -> None:
+        """
+        Buffer vectors for insertion. They are searchable in this process at
+        once and in other processes after the next flush, which happens when
+        segment_size vectors are buffered, every flush_interval and on close
+
+        Args:
+            ids: Identifier of each vector
+            vectors: Array of shape (n, dim)
+            metadata: Optional JSON-serializable metadata for each vector
+        """
+        vectors = normalize_rows(vectors)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dim {self.dim}, got {vectors.shape[1]}")
+        metadata = list(metadata) if metadata is not None else [None] * len(ids)
+        with self._lock:
+            self._buffer_ids.extend(ids)
+            self._buffer_vectors.append(vectors)
+            self._buffer_metadata.extend(metadata)
+            if len(self._buffer_ids) >= self.segment_size:
+                self.flush()
+
+    def flush(self) -> None:
+        """Write buffered vectors to a new segment and publish it in the manifest."""
+        with self._lock:
+            if not self._buffer_ids:
+                return
+            ids, metadata = self._buffer_ids, self._buffer_metadata
+            vectors = np.concatenate(self._buffer_vectors)
+            self._buffer_ids, self._buffer_vectors, self._buffer_metadata = [], [], []
+            name = self._write_segment(ids, vectors, metadata)
+            with self._file_lock():
+                manifest = self._read_manifest()
+                manifest["segments"].append(name)
+                # Re-adding an id makes it live again
+                manifest["deleted"] = sorted(set(manifest["deleted"]) - set(ids))
+                self._write_manifest(manifest)
+            self._manifest_mtime = None
+            self.refresh()
+
+    def delete(self, ids: Sequence[str]) -> None:
+        """Mark ids as deleted; their rows are dropped at the next compaction."""
+        with self._lock, self._file_lock():
+            manifest = self._read_manifest()
+            manifest["deleted"] = sorted(set(manifest["deleted"]) | set(ids))
+            self._write_manifest(manifest)
+            self._manifest_mtime = None
+        self.refresh()
+
+    def compact(self) -> bool:
+        """
+        Merge all segments into one, dropping deleted and superseded rows.
+        Rows are gathered and the merged segment is written without holding
+        the store or file lock, so searches and adds carry on meanwhile; the
+        locks are only taken to swap the manifest.
+
+        Returns:
+            False if nothing was merged (another compaction is running, there
+            is nothing to merge, or another process compacted first)
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._compact()
+        finally:
+            self._compact_lock.release()
+
+    def compact_in_background(self) -> bool:
+        """Start a compaction in a background thread unless one is running; returns whether one started."""
+        if self._compact_lock.locked():
+            return False
+        threading.Thread(target=self.compact, name="embedding-compact", daemon=True).start()
+        return True
+
+    def _compact(self) -> bool:
+        self.flush()
+        self._manifest_mtime = None
+        self.refresh()
+        with self._lock:
+            segments = dict(self._segments)
+            deleted = set(self._deleted)
+        names = list(segments)
+        if len(names) <= 1 and not deleted:
+            return False
+        # Later segments win when an id was added more than once
+        latest = {}
+        for name in names:
+            for row, id_ in enumerate(segments[name].ids):
+                latest[id_] = (name, row)
+        rows_by_segment: Dict[str, List[Tuple[str, int]]] = {}
+        for id_, (name, row) in latest.items():
+            if id_ not in deleted:
+                rows_by_segment.setdefault(name, []).append((id_, row))
+        # Gather each segment's surviving rows with one fancy-indexing read
+        ids, metadata, blocks = [], [], []
+        for name, kept in rows_by_segment.items():
+            segment = segments[name]
+            rows = np.fromiter((row for _, row in kept), dtype=np.int64, count=len(kept))
+            ids.extend(id_ for id_, _ in kept)
+            metadata.extend(segment.metadata[row] for _, row in kept)
+            blocks.append(self._dequantize_rows(segment, rows))
+        new_segments = [self._write_segment(ids, np.concatenate(blocks), metadata)] if ids else []
+        with self._lock, self._file_lock():
+            manifest = self._read_manifest()
+            if not set(names) <= set(manifest["segments"]):
+                # Another process compacted these segments first
+                stale, names = new_segments, []
+            else:
+                stale = []
+                manifest["segments"] = new_segments + [n for n in manifest["segments"] if n not in names]
+                manifest["deleted"] = sorted(set(manifest["deleted"]) - deleted)
+                self._write_manifest(manifest)
+            self._manifest_mtime = None
+            self.refresh()
+        # Old segment files can go once no manifest references them; readers
+        # that still have them mapped keep working until they refresh
+        for name in names + stale:
+            for suffix in (".npy", ".scale.npy", ".meta.jsonl"):
+                try:
+                    os.remove(os.path.join(self.directory, name + suffix))
+                except FileNotFoundError:
+                    pass
+        return bool(names)
+
+    def _dequantize_rows(self, segment: Any, rows: np.ndarray) -> np.ndarray:
+        block = np.asarray(segment.vectors[rows], dtype=np.float32)
+        if segment.scales is not None:
+            block *= np.asarray(segment.scales[rows], dtype=np.float32)[:, None]
+        return block
+
+    def search(self, queries: np.ndarray, k: int = 10) -> List[List[Tuple[str, float, Any]]]:
+        """
+        Find the k most similar stored and buffered vectors for each query
+
+        Args:
+            queries: Array of shape (dim,) or (m, dim)
+            k: Number of neighbours to return per query
+
+        Returns:
+            For each query, a list of (id, cosine similarity, metadata), best first
+        """
+        queries = normalize_rows(queries)
+        self.refresh()
+        with self._lock:
+            segments = list(self._segments.values())
+            if self._buffer_ids:
+                segments.append(_BufferSegment(self._buffer_ids, self._buffer_vectors, self._buffer_metadata))
+            deleted = self._deleted
+        # Over-fetch when deleted or re-added ids may take slots, so the result is not left short
+        may_repeat = len(segments) > 1 or any(len(segment) > len(segment.row_of) for segment in segments)
+        fetch_k = k + min(len(deleted), k) if not may_repeat else 2 * k
+        best_scores = np.full((queries.shape[0], 0), -np.inf, dtype=np.float32)
+        best_refs: List[List[Tuple[Any, int]]] = [[] for _ in range(queries.shape[0])]
+
+        for segment in segments:
+            for start in range(0, len(segment), self.chunk_rows):
+                stop = min(start + self.chunk_rows, len(segment))
+                scores = queries @ np.asarray(segment.vectors[start:stop], dtype=np.float32).T
+                if segment.scales is not None:
+                    # Scaling the scores is cheaper than dequantizing the block
+                    scores *= segment.scales[start:stop]
+                idx, part = top_k(scores, fetch_k)
+                # Merge this chunk's candidates with the running best per query
+                merged_scores = np.concatenate([best_scores, part], axis=1)
+                merged_idx, merged_top = top_k(merged_scores, fetch_k)
+                for q in range(queries.shape[0]):
+                    candidates = best_refs[q] + [(segment, start + int(i)) for i in idx[q]]
+                    best_refs[q] = [candidates[int(i)] for i in merged_idx[q]]
+                best_scores = merged_top
+
+        # Segments are in insertion order (the buffer last), so an id's latest row
+        # is its last row in the last segment holding it
+        position = {id(segment): i for i, segment in enumerate(segments)}
+
+        def is_latest(segment: Any, row: int, id_: str) -> bool:
+            if segment.row_of.get(id_) != row:
+                return False
+            return not any(id_ in later.row_of for later in segments[position[id(segment)] + 1:])
+
+        results = []
+        for q in range(queries.shape[0]):
+            hits = []
+            for (segment, row), score in zip(best_refs[q], best_scores[q]):
+                id_ = segment.ids[row]
+                if id_ in deleted or not is_latest(segment, row, id_):
+                    continue
+                hits.append((id_, float(score), segment.metadata[row]))
+            results.append(hits[:k])
+        return results
+
+    @property
+    def segment_count(self) -> int:
+        with self._lock:
+            return len(self._segments)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(segment) for segment in self._segments.values()) + len(self._buffer_ids)